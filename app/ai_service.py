@@ -1,20 +1,157 @@
-from langchain_core.prompts import PromptTemplate
-from langchain_core.output_parsers import JsonOutputParser
-from typing import List
+from typing import List, Optional
+from collections import OrderedDict
 from pydantic import BaseModel, Field
-from .config import ORCHESTRATOR_URL
+from .config import ORCHESTRATOR_URL, settings
 from .schemas import AgentOutput
-from .core.llm_adapter import OrchestratorChatModel
+from .core.incremental_json import StringArrayStreamParser
+from .core.log import get_logger
+from .core.tracing import span
+import threading
+import hashlib
+import sqlite3
+import time
 import json
 
+log = get_logger("ai_service")
+agent_log = get_logger("ai_agent")
+
 class SyllabusOutput(BaseModel):
     topics: List[str] = Field(description="List of syllabus topics/modules")
 
-def generate_syllabus_ai(course_name: str, course_desc: str, competencies: list[dict], system_prompt: str = None, temperature: float = 0.7, top_p: float = None, frequency_penalty: float = None, presence_penalty: float = None) -> list[str]:
+# Bump when the prompt template or parsing changes, so older cached results are not reused
+SYLLABUS_CACHE_VERSION = "rev19-1"
+
+class SyllabusCache:
     """
-    Generates a course program (syllabus) using LangChain with Orchestrator Adapter.
+    Result cache for generate_syllabus_ai, keyed on a stable hash of every input
+    that reaches the orchestrator. Tier 1 is an in-memory LRU; tier 2 (optional)
+    is a SQLite file so results survive restarts. Only non-empty results are stored.
     """
-    
+    def __init__(self, max_entries: int = 512, ttl: float = 0.0, path: Optional[str] = None, enabled: bool = True):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.enabled = enabled
+        self._memory: OrderedDict = OrderedDict()   # key -> (stored_at, topics)
+        self._lock = threading.Lock()
+        self._db = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if enabled and path:
+            try:
+                self._db = sqlite3.connect(path, check_same_thread=False)
+                self._db.execute("CREATE TABLE IF NOT EXISTS syllabus_cache (key TEXT PRIMARY KEY, topics TEXT NOT NULL, stored_at REAL NOT NULL)")
+                self._db.commit()
+            except sqlite3.Error as e:
+                log.warning(f"Syllabus disk cache disabled ({path}): {e}")
+                self._db = None
+
+    @staticmethod
+    def make_key(course_name: str, course_desc: str, competencies: list[dict], system_prompt: str = None, temperature: float = 0.7, top_p: float = None, frequency_penalty: float = None, presence_penalty: float = None) -> str:
+        material = {
+            "v": SYLLABUS_CACHE_VERSION,
+            "course_name": course_name,
+            "course_desc": course_desc,
+            # Only competency names reach the prompt
+            "competencies": [c.get("name") for c in competencies],
+            "system_prompt": system_prompt,
+            "temperature": temperature,
+            "top_p": top_p,
+            "frequency_penalty": frequency_penalty,
+            "presence_penalty": presence_penalty
+        }
+        return hashlib.sha256(json.dumps(material, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    def _fresh(self, stored_at: float) -> bool:
+        return not self.ttl or (time.time() - stored_at) <= self.ttl
+
+    def get(self, key: str) -> Optional[list[str]]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and self._fresh(entry[0]):
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return list(entry[1])
+
+            if self._db is not None:
+                row = self._db.execute("SELECT topics, stored_at FROM syllabus_cache WHERE key = ?", (key,)).fetchone()
+                if row and self._fresh(row[1]):
+                    topics = json.loads(row[0])
+                    self._remember(key, row[1], topics)
+                    self.disk_hits += 1
+                    return list(topics)
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, topics: list[str]):
+        if not self.enabled or not topics:
+            return
+        stored_at = time.time()
+        with self._lock:
+            self._remember(key, stored_at, list(topics))
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO syllabus_cache (key, topics, stored_at) VALUES (?, ?, ?)",
+                        (key, json.dumps(topics, ensure_ascii=False), stored_at)
+                    )
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    log.warning(f"Syllabus disk cache write failed: {e}")
+
+    def _remember(self, key: str, stored_at: float, topics: list[str]):
+        self._memory[key] = (stored_at, topics)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "size": len(self._memory),
+                "max_entries": self.max_entries,
+                "disk": self.path if self._db is not None else None,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0
+            }
+
+syllabus_cache = SyllabusCache(
+    max_entries=settings.syllabus_cache_max_entries,
+    ttl=settings.syllabus_cache_ttl,
+    path=settings.syllabus_cache_path,
+    enabled=settings.syllabus_cache_enabled
+)
+
+def warmup():
+    """
+    Imports LangChain and the orchestrator model ahead of the first request.
+    Called off the event loop at startup (settings.warmup_on_startup); module
+    import stays cheap so the container can answer /health immediately.
+    """
+    from langchain_core.messages import SystemMessage, HumanMessage
+    from langchain_core.prompts import PromptTemplate
+    from langchain_core.output_parsers import JsonOutputParser
+    from .core.llm_adapter import OrchestratorChatModel
+    JsonOutputParser(pydantic_object=SyllabusOutput).get_format_instructions()
+
+def _build_syllabus_chain(course_name: str, course_desc: str, competencies: list[dict], system_prompt: str = None, temperature: float = 0.7, top_p: float = None, frequency_penalty: float = None, presence_penalty: float = None, parse: bool = True):
+    """
+    Builds the (chain, chain_input) pair shared by the sync and async syllabus generators.
+    With parse=False the chain stops at the model, so its raw text can be streamed.
+    """
+    from langchain_core.messages import SystemMessage, HumanMessage
+    from langchain_core.prompts import PromptTemplate
+    from langchain_core.output_parsers import JsonOutputParser
+    from .core.llm_adapter import OrchestratorChatModel
+
     # Pass params via constructor
     model = OrchestratorChatModel(
         orchestrator_url=ORCHESTRATOR_URL,
@@ -51,8 +188,6 @@ def generate_syllabus_ai(course_name: str, course_desc: str, competencies: list[
     
     {format_instructions}
     """
-    
-    from langchain_core.messages import SystemMessage, HumanMessage
 
     if system_prompt:
         # If user provides system prompt, we use strictly that as SystemMessage
@@ -67,40 +202,117 @@ def generate_syllabus_ai(course_name: str, course_desc: str, competencies: list[
             HumanMessage(content=f"CURSO: {course_name}\nDESCRIÇÃO: {course_desc}\nCOMPETÊNCIAS: {comp_text}\n\n{parser.get_format_instructions()}")
         ]
         
-        chain = model | parser
-        
-        try:
-            result = chain.invoke(messages)
-            return result.get("topics", [])
-        except Exception as e:
-            print(f"[AI SERVICE] Error generating syllabus (custom prompt): {str(e)}")
-            return []
-
-    else:
-        # Default legacy flow with PromptTemplate
-        prompt = PromptTemplate(
-            template=default_template,
-            input_variables=["course_name", "course_desc", "comp_text"],
-            partial_variables={"format_instructions": parser.get_format_instructions()}
-        )
-
-        chain = prompt | model | parser
-
-        try:
-            result = chain.invoke({
-                "course_name": course_name,
-                "course_desc": course_desc,
-                "comp_text": comp_text
-            })
-            return result.get("topics", [])
-        except Exception as e:
-            print(f"[AI SERVICE] Error generating syllabus: {str(e)}")
-            return []
+        return (model | parser if parse else model), messages
+
+    # Default legacy flow with PromptTemplate
+    prompt = PromptTemplate(
+        template=default_template,
+        input_variables=["course_name", "course_desc", "comp_text"],
+        partial_variables={"format_instructions": parser.get_format_instructions()}
+    )
+
+    chain = (prompt | model | parser) if parse else (prompt | model)
+    return chain, {
+        "course_name": course_name,
+        "course_desc": course_desc,
+        "comp_text": comp_text
+    }
+
+def generate_syllabus_ai(course_name: str, course_desc: str, competencies: list[dict], system_prompt: str = None, temperature: float = 0.7, top_p: float = None, frequency_penalty: float = None, presence_penalty: float = None, force_regenerate: bool = False) -> list[str]:
+    """
+    Generates a course program (syllabus) using LangChain with Orchestrator Adapter.
+    Identical inputs are served from syllabus_cache unless force_regenerate is set.
+    """
+    cache_key = SyllabusCache.make_key(course_name, course_desc, competencies, system_prompt, temperature, top_p, frequency_penalty, presence_penalty)
+    if not force_regenerate:
+        cached = syllabus_cache.get(cache_key)
+        if cached:
+            return cached
+
+    chain, chain_input = _build_syllabus_chain(course_name, course_desc, competencies, system_prompt, temperature, top_p, frequency_penalty, presence_penalty)
+
+    try:
+        result = chain.invoke(chain_input)
+        topics = result.get("topics", [])
+        syllabus_cache.put(cache_key, topics)
+        return topics
+    except Exception as e:
+        label = " (custom prompt)" if system_prompt else ""
+        log.error(f"Error generating syllabus{label}: {str(e)}", extra={"data": {"course": course_name}})
+        return []
+
+async def agenerate_syllabus_ai(course_name: str, course_desc: str, competencies: list[dict], system_prompt: str = None, temperature: float = 0.7, top_p: float = None, frequency_penalty: float = None, presence_penalty: float = None, force_regenerate: bool = False) -> list[str]:
+    """
+    Async variant of generate_syllabus_ai. Uses the adapter's native _agenerate,
+    so concurrent generations share the async pool instead of one thread each.
+    """
+    cache_key = SyllabusCache.make_key(course_name, course_desc, competencies, system_prompt, temperature, top_p, frequency_penalty, presence_penalty)
+    if not force_regenerate:
+        cached = syllabus_cache.get(cache_key)
+        if cached:
+            return cached
+
+    # The parser runs outside the chain so tracing can tell model time from parse time
+    chain, chain_input = _build_syllabus_chain(course_name, course_desc, competencies, system_prompt, temperature, top_p, frequency_penalty, presence_penalty, parse=False)
+
+    try:
+        message = await chain.ainvoke(chain_input)
+        with span("syllabus.parse", chars=len(message.content)):
+            from langchain_core.output_parsers import JsonOutputParser
+            result = JsonOutputParser(pydantic_object=SyllabusOutput).parse(message.content)
+        topics = result.get("topics", [])
+        syllabus_cache.put(cache_key, topics)
+        return topics
+    except Exception as e:
+        label = " (custom prompt)" if system_prompt else ""
+        log.error(f"Error generating syllabus{label}: {str(e)}", extra={"data": {"course": course_name}})
+        return []
+
+async def astream_syllabus_ai(course_name: str, course_desc: str, competencies: list[dict], system_prompt: str = None, temperature: float = 0.7, top_p: float = None, frequency_penalty: float = None, presence_penalty: float = None, force_regenerate: bool = False):
+    """
+    Streaming variant of agenerate_syllabus_ai. Async generator of events:
+    ("topic", str) as soon as each topic is complete in the model output, then
+    ("programa", list[str]) with the final parsed list ([] on failure).
+    """
+    cache_key = SyllabusCache.make_key(course_name, course_desc, competencies, system_prompt, temperature, top_p, frequency_penalty, presence_penalty)
+    if not force_regenerate:
+        cached = syllabus_cache.get(cache_key)
+        if cached:
+            for topic in cached:
+                yield "topic", topic
+            yield "programa", cached
+            return
+
+    chain, chain_input = _build_syllabus_chain(course_name, course_desc, competencies, system_prompt, temperature, top_p, frequency_penalty, presence_penalty, parse=False)
+    topic_parser = StringArrayStreamParser("topics")
+    chunks = []
+
+    try:
+        async for chunk in chain.astream(chain_input):
+            text = chunk.content if isinstance(chunk.content, str) else ""
+            chunks.append(text)
+            for topic in topic_parser.feed(text):
+                yield "topic", topic
+
+        # Final parse of the full text (same parser as the non-streaming path)
+        from langchain_core.output_parsers import JsonOutputParser
+        result = JsonOutputParser(pydantic_object=SyllabusOutput).parse("".join(chunks))
+        topics = result.get("topics", []) if isinstance(result, dict) else []
+        syllabus_cache.put(cache_key, topics)
+        yield "programa", topics
+    except Exception as e:
+        label = " (custom prompt)" if system_prompt else ""
+        log.error(f"Error streaming syllabus{label}: {str(e)}", extra={"data": {"course": course_name}})
+        # Keep whatever topics were complete before the failure
+        yield "programa", list(topic_parser.items)
 
 def generate_full_structure(objetivo: str, publico: str, nivel: str) -> AgentOutput:
     """
     Generates the full competency and course structure using LangChain via Orchestrator.
     """
+    from langchain_core.prompts import PromptTemplate
+    from langchain_core.output_parsers import JsonOutputParser
+    from .core.llm_adapter import OrchestratorChatModel
     
     model = OrchestratorChatModel(
         orchestrator_url=ORCHESTRATOR_URL,
@@ -140,7 +352,7 @@ def generate_full_structure(objetivo: str, publico: str, nivel: str) -> AgentOut
 
     chain = prompt | model | parser
 
-    print(f"[AI AGENT] Generating structure via Orchestrator for: {objetivo}")
+    agent_log.info(f"Generating structure via Orchestrator for: {objetivo}")
     
     try:
         result = chain.invoke({
@@ -152,5 +364,5 @@ def generate_full_structure(objetivo: str, publico: str, nivel: str) -> AgentOut
         return AgentOutput(**result)
 
     except Exception as e:
-        print(f"[AI AGENT] Error: {str(e)}")
+        agent_log.error(f"Error: {str(e)}")
         raise e
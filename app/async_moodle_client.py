@@ -0,0 +1,341 @@
+import time
+import httpx
+from .config import MOODLE_URL, MOODLE_HOST, settings, get_moodle_token
+from .moodle_client import build_payload, parse_response, MOODLE_HEADERS, read_cache, COALESCE_FUNCTIONS, get_moodle_guard, log
+from .core.single_flight import AsyncSingleFlight
+from .core.moodle_params import array_param
+from .core.moodle_decode import SectionsDecoder
+from .core.metrics import MOODLE_CALL_SECONDS
+from .core.tracing import span
+
+async_flight = AsyncSingleFlight()
+
+class AsyncMoodleClient:
+    """
+    asyncio-native Moodle Web Service client (httpx.AsyncClient).
+    Mirrors MoodleClient: same payload/response handling, shared keep-alive pool,
+    but awaiting Moodle does not hold a worker thread.
+    """
+    def __init__(self, url: str = MOODLE_URL, host: str = MOODLE_HOST,
+                 max_connections: int = None, max_keepalive_connections: int = None,
+                 connect_timeout: float = None, read_timeout: float = None):
+        self.url = url
+        self.host = host
+        self.max_connections = max_connections or settings.moodle_pool_maxsize
+        self.max_keepalive_connections = max_keepalive_connections or self.max_connections
+        self.timeout = httpx.Timeout(
+            read_timeout or settings.moodle_read_timeout,
+            connect=connect_timeout or settings.moodle_connect_timeout
+        )
+        self.client = httpx.AsyncClient(
+            headers={**MOODLE_HEADERS, "Host": self.host},
+            timeout=self.timeout,
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive_connections
+            )
+        )
+
+        self._requests = 0
+        self._in_flight = 0
+        self._peak_in_flight = 0
+        self._errors = 0
+
+    async def call(self, function, params, token: str = None, timeout=None, decoder=None):
+        # Same read-through cache, single-flight and decoder rules as the sync client
+        with span(f"moodle.{function}", **{"moodle.wsfunction": function}) as current:
+            start = time.perf_counter()
+            result = "error"
+            try:
+                cacheable = read_cache.is_cacheable(function)
+                coalesce = settings.moodle_coalesce_enabled and function in COALESCE_FUNCTIONS
+                if not cacheable and not coalesce:
+                    # Writes invalidate even when they fail: Moodle may have applied part of them
+                    try:
+                        data = await self._post(function, params, token, timeout, decoder)
+                    finally:
+                        read_cache.invalidate_for(function)
+                    result = "ok"
+                    return data
+
+                key = read_cache.make_key(function, params, token or get_moodle_token(), decoder.name if decoder else None)
+                if cacheable:
+                    hit, value = read_cache.get(key)
+                    if hit:
+                        result = "hit"
+                        return value
+
+                if coalesce:
+                    # Identical concurrent reads share one in-flight request
+                    data = await async_flight.do(key, lambda: self._post(function, params, token, timeout, decoder))
+                else:
+                    data = await self._post(function, params, token, timeout, decoder)
+
+                if cacheable:
+                    read_cache.put(key, data)
+                result = "ok"
+                return data
+            finally:
+                MOODLE_CALL_SECONDS.observe(time.perf_counter() - start, function, result)
+                current.set_attribute("moodle.result", result)
+
+    async def _post(self, function, params, token: str = None, timeout=None, decoder=None):
+        payload = build_payload(function, params, token)
+
+        # Counters are only touched from the event loop thread, no lock needed
+        self._requests += 1
+        self._in_flight += 1
+        self._peak_in_flight = max(self._peak_in_flight, self._in_flight)
+
+        try:
+            if decoder is not None:
+                status_code, data = await get_moodle_guard().acall(lambda: self._send_decoded(payload, decoder(), timeout))
+                return parse_response(function, status_code, data)
+            r = await get_moodle_guard().acall(lambda: self._send(payload, timeout))
+            return parse_response(function, r.status_code, r.json())
+        except Exception as e:
+            self._errors += 1
+            log.error(f"{function} failed: {e}", extra={"data": {"wsfunction": function}})
+            raise e
+        finally:
+            self._in_flight -= 1
+
+    async def _send(self, payload: dict, timeout=None):
+        r = await self.client.post(self.url, data=payload, timeout=timeout or self.timeout)
+        r.raise_for_status()
+        return r
+
+    async def _send_decoded(self, payload: dict, decoder, timeout=None):
+        async with self.client.stream("POST", self.url, data=payload, timeout=timeout or self.timeout) as r:
+            r.raise_for_status()
+            async for chunk in r.aiter_bytes():
+                decoder.feed(chunk)
+            return r.status_code, decoder.close()
+
+    def pool_stats(self) -> dict:
+        # httpx does not expose pool internals publicly; read httpcore's pool if present
+        pool = getattr(getattr(self.client, "_transport", None), "_pool", None)
+        connections = list(getattr(pool, "connections", []) or [])
+        return {
+            "max_connections": self.max_connections,
+            "max_keepalive_connections": self.max_keepalive_connections,
+            "requests": self._requests,
+            "errors": self._errors,
+            "in_flight": self._in_flight,
+            "peak_in_flight": self._peak_in_flight,
+            "connections_open": len(connections),
+            "idle": sum(1 for c in connections if c.is_idle())
+        }
+
+    async def aclose(self):
+        await self.client.aclose()
+
+_client: AsyncMoodleClient = None
+
+def get_async_moodle_client() -> AsyncMoodleClient:
+    """Returns the process-wide AsyncMoodleClient, creating it on first use."""
+    global _client
+    if _client is None or _client.client.is_closed:
+        _client = AsyncMoodleClient()
+    return _client
+
+async def close_async_moodle_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+async def call_moodle(function, params, token: str = None):
+    return await get_async_moodle_client().call(function, params, token)
+
+def get_pool_stats() -> dict:
+    return get_async_moodle_client().pool_stats()
+
+# --- Async mirrors of moodle_client helpers ---
+
+async def update_course(course_id: int, summary: str, token: str = None):
+    """
+    Updates the course summary using core_course_update_courses.
+    """
+    params = {
+        "courses[0][id]": course_id,
+        "courses[0][summary]": summary,
+        "courses[0][summaryformat]": 1  # HTML
+    }
+    return await call_moodle("core_course_update_courses", params, token)
+
+async def get_course_contents(course_id: int, token: str = None):
+    """
+    Get course sections and modules using core_course_get_contents.
+    """
+    params = {
+        "courseid": course_id
+    }
+    return await call_moodle("core_course_get_contents", params, token)
+
+async def get_course_sections(course_id: int, token: str = None):
+    """
+    core_course_get_contents projected to SectionRecords (id, section, name, visible),
+    streamed so module data is never fully materialised.
+    """
+    return await get_async_moodle_client().call("core_course_get_contents", {"courseid": course_id}, token, decoder=SectionsDecoder)
+
+async def update_section(section_id: int, name: str, summary: str = "", visible: int = 1, token: str = None):
+    """
+    Update a course section visibility via core_course_edit_section.
+    Use update_section_name for renaming.
+    """
+    params = {
+        "id": section_id,
+        "action": "show" if visible else "hide",
+    }
+    await call_moodle("core_course_edit_section", params, token)
+
+async def update_section_name(section_id: int, new_name: str, token: str = None):
+    """
+    Renames a section using core_update_inplace_editable.
+    Assumes format_topics.
+    """
+    params = {
+        "component": "format_topics",
+        "itemtype": "sectionname",
+        "itemid": section_id,
+        "value": new_name
+    }
+    return await call_moodle("core_update_inplace_editable", params, token)
+
+async def update_course_numsections(course_id: int, num_sections: int, token: str = None):
+    """
+    Updates the number of sections in a course using core_course_update_courses.
+    """
+    params = {
+        "courses[0][id]": course_id,
+        "courses[0][format]": "topics",
+        "courses[0][numsections]": num_sections,
+        "courses[0][courseformatoptions][0][name]": "numsections",
+        "courses[0][courseformatoptions][0][value]": num_sections
+    }
+    return await call_moodle("core_course_update_courses", params, token)
+
+async def create_course_sections(course_ids: list[int], token: str = None):
+    """
+    Creates new sections using core_course_create_sections.
+    One section is created for each ID in the list.
+    """
+    params = array_param("core_course_create_sections").encode(course_ids)
+    return await call_moodle("core_course_create_sections", params, token)
+
+async def delete_course_sections(section_ids: list[int], token: str = None):
+    """
+    Deletes sections using core_course_delete_sections.
+    """
+    params = array_param("core_course_delete_sections").encode(section_ids)
+    return await call_moodle("core_course_delete_sections", params, token)
+
+async def create_moodle_section(course_id: int, section_name: str, token: str = None):
+    """
+    Creates a new section using the custom local_sectionmanager plugin.
+    """
+    params = {
+        "courseid": course_id,
+        "sections[0][name]": section_name
+    }
+    return await call_moodle("local_sectionmanager_create_sections", params, token)
+
+async def create_moodle_sections(course_id: int, section_names: list[str], token: str = None):
+    """
+    Creates several sections in ONE local_sectionmanager_create_sections call.
+    Use map_created_sections to align the response with section_names.
+    """
+    params = array_param("local_sectionmanager_create_sections").encode_columns({"courseid": course_id}, name=section_names)
+    return await call_moodle("local_sectionmanager_create_sections", params, token)
+
+async def show_sections(course_id: int, section_ids: list[int], token: str = None):
+    """
+    Makes sections visible in ONE core_courseformat_update_course 'section_show'
+    call (Moodle 4.4+), which takes an ids[] array.
+    """
+    params = {"action": "section_show", "courseid": course_id}
+    array_param("core_courseformat_update_course").encode(section_ids, params)
+    return await call_moodle("core_courseformat_update_course", params, token)
+
+async def move_section_after(course_id: int, section_id: int, target_section_id: int, token: str = None):
+    """
+    Moves a section right after target_section_id (pass the general section id to move it to the top).
+    Uses core_courseformat_update_course 'section_move_after' (Moodle 4.4+).
+    """
+    params = {
+        "action": "section_move_after",
+        "courseid": course_id,
+        "targetsectionid": target_section_id
+    }
+    array_param("core_courseformat_update_course").encode([section_id], params)
+    return await call_moodle("core_courseformat_update_course", params, token)
+
+async def create_competency_framework(idnumber: str, shortname: str, description: str, token: str = None):
+    """
+    Creates a new competency framework.
+    """
+    params = {
+        "competencyframework": {
+            "idnumber": idnumber,
+            "shortname": shortname,
+            "description": description,
+            "descriptionformat": 1, # HTML
+            "visible": 1,
+            "scaleid": 1 # Standard scale (Change if needed)
+        }
+    }
+    return await call_moodle("core_competency_create_competency_framework", params, token)
+
+async def create_competency(framework_id: int, shortname: str, description: str, idnumber: str, token: str = None):
+    """
+    Creates a competency within a framework.
+    """
+    params = {
+        "competency": {
+            "shortname": shortname,
+            "description": description,
+            "descriptionformat": 1,
+            "idnumber": idnumber,
+            "competencyframeworkid": framework_id
+        }
+    }
+    return await call_moodle("core_competency_create_competency", params, token)
+
+async def create_course_category(name: str, token: str = None):
+    """
+    Creates a new course category at root.
+    """
+    params = {
+        "categories[0][name]": name,
+        "categories[0][parent]": 0,
+        "categories[0][descriptionformat]": 1
+    }
+    return await call_moodle("core_course_create_categories", params, token)
+
+async def create_course(fullname: str, shortname: str, category_id: int, summary: str, token: str = None):
+    """
+    Creates a new course.
+    """
+    params = {
+        "courses[0][fullname]": fullname,
+        "courses[0][shortname]": shortname, # Must be unique
+        "courses[0][categoryid]": category_id,
+        "courses[0][summary]": summary,
+        "courses[0][summaryformat]": 1,
+        "courses[0][format]": "topics",
+        "courses[0][numsections]": 0
+    }
+    return await call_moodle("core_course_create_courses", params, token)
+
+async def update_section_summary(section_id: int, summary: str, token: str = None):
+    """
+    Updates the summary of a section via core_course_edit_section.
+    """
+    params = {
+        "id": section_id,
+        "summary": summary,
+        "summaryformat": 1
+    }
+    return await call_moodle("core_course_edit_section", params, token)
@@ -1,26 +1,151 @@
-from typing import Optional
+from typing import Dict, Optional
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from app.core.config_provider import SSMConfigProvider
+from app.core.config_provider import SSMConfigProvider, ParameterCache
 
 class Settings(BaseSettings):
     moodle_url: str = "https://seu-moodle.com/webservice/rest/server.php"
     moodle_host: str = "moodle.r5projetos.com.br"
     moodle_token: Optional[str] = None
     orchestrator_url: str = "http://localhost:8000"
+
+    # AWS SSM parameters (fetched lazily, refreshed in the background)
+    ssm_enabled: bool = True
+    ssm_region: str = "us-east-1"
+    ssm_moodle_token_path: str = "/prod/keduka/md-api-secao/moodle_token"
+    ssm_parameter_prefix: Optional[str] = None    # e.g. /prod/keduka/md-api-secao/ to batch-load everything below it
+    ssm_refresh_interval: float = 300.0
+    ssm_initial_wait: float = 5.0                 # Max seconds startup waits for the first fetch (requests never wait)
+    ssm_cache_path: Optional[str] = "/tmp/keduka_ssm_cache.bin"
+    # Fernet key encrypting the disk cache; unset = no disk cache. Generate one with
+    # python -c "from cryptography.fernet import Fernet; print(Fernet.generate_key().decode())"
+    ssm_cache_key: Optional[str] = None
+
+    # Moodle HTTP connection pool (shared keep-alive session)
+    moodle_pool_connections: int = 4      # Number of host pools kept (one per scheme/host)
+    moodle_pool_maxsize: int = 32         # Max open connections per host
+    moodle_pool_block: bool = False       # Block when pool is exhausted instead of opening extra connections
+    moodle_connect_timeout: float = 5.0
+    moodle_read_timeout: float = 20.0
+    moodle_bulk_write_concurrency: int = 8  # Parallel per-section calls (renames) when applying a section plan
+
+    # Moodle read-through cache (per-wsfunction TTL in seconds; functions not listed are never cached)
+    moodle_cache_enabled: bool = True
+    moodle_cache_max_entries: int = 2048
+    moodle_cache_ttls: Dict[str, float] = {
+        "core_course_get_courses": 300.0,
+        "core_competency_list_course_competencies": 300.0,
+        "core_course_get_contents": 60.0,
+    }
+    moodle_coalesce_enabled: bool = True  # Share one in-flight request between identical concurrent reads
+
+    # Adaptive concurrency limit (AIMD) + circuit breaker per upstream host
+    moodle_limit_initial: int = 16
+    moodle_limit_min: int = 2
+    moodle_limit_max: int = 64
+    moodle_limit_latency_threshold: float = 2.0   # Seconds; slower calls shrink the limit
+    moodle_limit_queue_timeout: float = 5.0       # Seconds a call may wait for a slot before failing fast
+    orchestrator_limit_initial: int = 32
+    orchestrator_limit_min: int = 4
+    orchestrator_limit_max: int = 128
+    orchestrator_limit_latency_threshold: float = 30.0
+    orchestrator_limit_queue_timeout: float = 10.0
+    limit_backoff: float = 0.7
+    breaker_error_threshold: float = 0.5          # Failure ratio that opens the circuit
+    breaker_min_requests: int = 20                # Minimum calls in the window before it can open
+    breaker_window: float = 30.0
+    breaker_open_seconds: float = 15.0
+    breaker_half_open_max: int = 1
+
+    # Syllabus generation result cache (memory LRU + optional SQLite file tier)
+    syllabus_cache_enabled: bool = True
+    syllabus_cache_max_entries: int = 512
+    syllabus_cache_ttl: float = 0.0               # Seconds; 0 = entries never expire
+    syllabus_cache_path: Optional[str] = None     # e.g. /tmp/syllabus_cache.sqlite3 (None = memory only)
+
+    max_request_body_bytes: int = 1_048_576       # Larger bodies get 413 (checked while streaming); 0 disables
+
+    # Execution guard state: "memory" (per process), "sqlite" (all workers on one host), "redis" (all replicas)
+    guard_backend: str = "memory"
+    guard_memory_shards: int = 16                 # Lock stripes of the memory backend
+    guard_sqlite_path: str = "/tmp/keduka_execution_guard.sqlite3"
+    guard_redis_url: Optional[str] = None         # e.g. redis://localhost:6379/0 (needs the 'redis' package)
+    guard_redis_prefix: str = "keduka:guard:"
+    guard_store_timeout: float = 2.0              # SQLite lock wait / Redis connect+command timeout (seconds)
+
+    # Execution guard rate limits (GCRA, per process). rate = requests/second, burst = requests allowed at once; rate 0 disables.
+    # Off by default: when enabled, callers over a limit get 429 + Retry-After (see enforce_rate_limits).
+    rate_limit_enabled: bool = False
+    rate_limit_token_rate: float = 1.0            # Per X-Moodle-Token (tenant)
+    rate_limit_token_burst: int = 20
+    # Per client IP. Only meaningful when uvicorn runs with --proxy-headers and FORWARDED_ALLOW_IPS
+    # covers the load balancer (see Dockerfile); otherwise every caller shares the ALB's address.
+    rate_limit_origin_rate: float = 0.0
+    rate_limit_origin_burst: int = 50
+
+    # Background job mode for /api/course/programa (?async=true)
+    jobs_workers: int = 4                         # Jobs running at once
+    jobs_queue_size: int = 100                    # Jobs waiting for a worker before new ones get 503
+    jobs_ttl: float = 3600.0                      # Seconds a finished job stays pollable
+    jobs_max_tracked: int = 1000
+
+    # Batch generation (/api/course/programa/batch): independent limits per phase
+    batch_max_courses: int = 500
+    batch_read_concurrency: int = 8               # Courses loading Moodle inputs at once
+    batch_llm_concurrency: int = 4                # Courses waiting on the orchestrator at once
+    batch_write_concurrency: int = 4              # Courses applying section plans at once
+
+    warmup_on_startup: bool = True                # Import LangChain in the background at startup instead of on the first request
+
+    # Logging (app.core.log): JSON lines written off the request path
+    log_level: str = "INFO"
+    log_format: str = "json"                      # "json" or "text"
+    log_sample_rates: Dict[str, float] = {}       # Fraction of DEBUG/INFO records kept per category, e.g. {"moodle": 0.1}
+
+    # Tracing (app.core.tracing): spans per phase, Moodle call and section write
+    tracing_enabled: bool = False
+    tracing_file: Optional[str] = None            # JSON lines, one span per line
+    tracing_otlp_endpoint: Optional[str] = None   # OTLP/HTTP collector base URL, e.g. http://collector:4318
+    tracing_server_timing: bool = False           # Add a Server-Timing header summarising the phases
+
+    # Orchestrator HTTP transport (shared by OrchestratorChatModel instances)
+    orchestrator_timeout: float = 60.0
+    orchestrator_max_connections: int = 64
+    orchestrator_http2: bool = True       # Used only when the optional 'h2' package is installed
     
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8")
 
 settings = Settings()
 
 # --- SSM ENHANCEMENT ---
-# In production, we override the .env/default token with the one from AWS SSM
-ssm = SSMConfigProvider()
+# In production, we override the .env/default token with the one from AWS SSM.
+# Nothing is fetched at import: ParameterCache loads lazily (encrypted disk cache
+# first, then one batched SSM call) and keeps refreshing in the background.
 # Path convention: /prod/keduka/{service}/moodle_token
-_ssm_token = ssm.get_parameter("/prod/keduka/md-api-secao/moodle_token", default=settings.moodle_token)
+MOODLE_TOKEN_PARAMETER = settings.ssm_moodle_token_path
+
+ssm = SSMConfigProvider(region_name=settings.ssm_region)
+parameters = ParameterCache(
+    ssm,
+    defaults={MOODLE_TOKEN_PARAMETER: settings.moodle_token},
+    prefix=settings.ssm_parameter_prefix,
+    cache_path=settings.ssm_cache_path,
+    cache_key=settings.ssm_cache_key,
+    refresh_interval=settings.ssm_refresh_interval
+)
+
+def get_moodle_token() -> str:
+    """Current service token (picks up SSM rotations without a restart)."""
+    if not settings.ssm_enabled:
+        return settings.moodle_token or "TOKEN_NAO_CONFIGURADO"
+    return parameters.get(MOODLE_TOKEN_PARAMETER) or "TOKEN_NAO_CONFIGURADO"
 
 # Expose as simple variables for compatibility with user's client code style
 MOODLE_URL = settings.moodle_url
 MOODLE_HOST = settings.moodle_host
-MOODLE_TOKEN = _ssm_token or "TOKEN_NAO_CONFIGURADO"
 ORCHESTRATOR_URL = settings.orchestrator_url
 
+def __getattr__(name):
+    # MOODLE_TOKEN is resolved on access, not at import
+    if name == "MOODLE_TOKEN":
+        return get_moodle_token()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
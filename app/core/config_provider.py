@@ -1,23 +1,40 @@
 import os
-import boto3
-from botocore.exceptions import ClientError, NoCredentialsError
+import json
+import time
+import threading
+from typing import Dict, List, Optional
+from app.core.log import get_logger
+
+log = get_logger("ssm")
 
 class SSMConfigProvider:
     """
     Fetches configuration secrets from AWS SSM Parameter Store.
     Falls back to environment variables if SSM is unreachable or key is missing.
     """
-    def __init__(self, region_name="us-east-1"):
+    def __init__(self, region_name="us-east-1", connect_timeout: float = 2.0, read_timeout: float = 3.0, max_attempts: int = 2):
         self.region_name = region_name
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_attempts = max_attempts
         self._ssm_client = None
 
     @property
     def ssm(self):
         if not self._ssm_client:
             try:
-                self._ssm_client = boto3.client("ssm", region_name=self.region_name)
+                # boto3 is imported on first use (it is slow to import and most processes never need it)
+                import boto3
+                from botocore.config import Config
+                # Short timeouts and few retries: a slow SSM must not stall startup on botocore's defaults
+                config = Config(
+                    connect_timeout=self.connect_timeout,
+                    read_timeout=self.read_timeout,
+                    retries={"max_attempts": self.max_attempts, "mode": "standard"}
+                )
+                self._ssm_client = boto3.client("ssm", region_name=self.region_name, config=config)
             except Exception as e:
-                print(f"[SSM] Warning: Failed to initialize Boto3 client: {e}")
+                log.warning(f"Warning: Failed to initialize Boto3 client: {e}")
                 return None
         return self._ssm_client
 
@@ -27,21 +44,185 @@ class SSMConfigProvider:
         If fails, returns the default value (which usually comes from .env).
         """
         if not self.ssm:
-            print(f"[SSM] Client unavailable. Using fallback for {path}.")
+            log.warning(f"Client unavailable. Using fallback for {path}.")
             return default
+        from botocore.exceptions import ClientError, NoCredentialsError
 
         try:
-            print(f"[SSM] Fetching {path}...")
+            log.info(f"Fetching {path}...")
             response = self.ssm.get_parameter(
                 Name=path,
                 WithDecryption=with_decryption
             )
             val = response["Parameter"]["Value"]
-            print(f"[SSM] Successfully loaded {path}")
+            log.info(f"Successfully loaded {path}")
             return val
         except (ClientError, NoCredentialsError) as e:
-            print(f"[SSM] Failed to fetch {path}: {e}. using fallback.")
+            log.warning(f"Failed to fetch {path}: {e}. using fallback.")
             return default
         except Exception as e:
-            print(f"[SSM] Unexpected error for {path}: {e}. using fallback.")
+            log.warning(f"Unexpected error for {path}: {e}. using fallback.")
             return default
+
+    def get_parameters(self, paths: List[str], with_decryption: bool = True) -> Dict[str, str]:
+        """
+        Fetches several parameters with GetParameters (10 names per call).
+        Returns only the parameters found; raises if SSM cannot be reached.
+        """
+        if not self.ssm:
+            raise RuntimeError("SSM client unavailable")
+        values = {}
+        for i in range(0, len(paths), 10):
+            response = self.ssm.get_parameters(Names=paths[i:i + 10], WithDecryption=with_decryption)
+            for param in response.get("Parameters", []):
+                values[param["Name"]] = param["Value"]
+            for name in response.get("InvalidParameters", []):
+                log.warning(f"Parameter not found: {name}")
+        return values
+
+    def get_parameters_by_path(self, prefix: str, with_decryption: bool = True) -> Dict[str, str]:
+        """Fetches every parameter under prefix (recursive, paginated). Raises if SSM cannot be reached."""
+        if not self.ssm:
+            raise RuntimeError("SSM client unavailable")
+        values = {}
+        paginator = self.ssm.get_paginator("get_parameters_by_path")
+        for page in paginator.paginate(Path=prefix, Recursive=True, WithDecryption=with_decryption):
+            for param in page.get("Parameters", []):
+                values[param["Name"]] = param["Value"]
+        return values
+
+def _fernet(key: Optional[str]):
+    """
+    Fernet cipher for `key`, a Fernet key (32 url-safe base64 bytes, from
+    Fernet.generate_key()). None, with a warning, when the key is unset or invalid.
+    """
+    if not key:
+        return None
+    try:
+        from cryptography.fernet import Fernet
+    except ImportError:
+        log.warning("'cryptography' not installed: on-disk parameter cache disabled")
+        return None
+    try:
+        return Fernet(key.encode("ascii"))
+    except (ValueError, UnicodeEncodeError):
+        log.warning("SSM_CACHE_KEY is not a valid Fernet key: on-disk parameter cache disabled")
+        return None
+
+class ParameterCache:
+    """
+    Serves SSM parameters without blocking startup or requests on AWS.
+
+    Nothing is fetched at import. start() (or the first get()) loads the last
+    known values from an encrypted file, if present, and begins a background
+    thread that fetches all parameters in one batched call (GetParametersByPath
+    when `prefix` is set, GetParameters otherwise) and then every
+    `refresh_interval` seconds. Refreshed values replace the current ones in
+    place, so rotated secrets apply without a restart.
+    get() never waits: until the first fetch lands it serves the disk cache or
+    the defaults (.env). A startup hook can call wait_loaded() in a worker
+    thread to hold the service back until then.
+    The file is only written when `cache_key` holds a Fernet key; secrets are
+    never written in plain text.
+    """
+    def __init__(self, provider: SSMConfigProvider, defaults: Dict[str, Optional[str]], prefix: str = None,
+                 cache_path: str = None, cache_key: str = None, refresh_interval: float = 300.0):
+        self.provider = provider
+        self.defaults = dict(defaults)
+        self.prefix = prefix
+        self.cache_path = cache_path
+        self.refresh_interval = refresh_interval
+        self._cipher = _fernet(cache_key)
+        self._values: Dict[str, str] = {}
+        self._loaded = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.source = "defaults"
+        self.refreshed_at: Optional[float] = None
+        self.refresh_failures = 0
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            if self._load_cache():
+                self._loaded.set()
+            self._thread = threading.Thread(target=self._run, name="ssm-refresh", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def wait_loaded(self, timeout: float) -> bool:
+        """Starts the cache and blocks up to `timeout` seconds for the first values. Not for the event loop."""
+        self.start()
+        return self._loaded.wait(timeout)
+
+    def get(self, path: str) -> Optional[str]:
+        """Current value, else the default. Never blocks on SSM."""
+        if self._thread is None:
+            self.start()
+        value = self._values.get(path)
+        return value if value is not None else self.defaults.get(path)
+
+    def refresh(self) -> bool:
+        try:
+            if self.prefix:
+                values = self.provider.get_parameters_by_path(self.prefix)
+            else:
+                values = self.provider.get_parameters(list(self.defaults))
+        except Exception as e:
+            self.refresh_failures += 1
+            log.warning(f"Refresh failed ({e}); keeping {self.source} values")
+            return False
+        # Swap in a new dict: readers never see a partially updated mapping
+        self._values = {**self._values, **values}
+        self.source = "ssm"
+        self.refreshed_at = time.time()
+        log.info(f"Loaded {len(values)} parameters")
+        self._save_cache()
+        return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.refresh()
+            self._loaded.set()
+            self._stop.wait(self.refresh_interval)
+
+    def _load_cache(self) -> bool:
+        if not (self._cipher and self.cache_path and os.path.exists(self.cache_path)):
+            return False
+        try:
+            with open(self.cache_path, "rb") as f:
+                data = json.loads(self._cipher.decrypt(f.read()))
+        except Exception as e:
+            log.warning(f"Ignoring unreadable parameter cache {self.cache_path}: {str(e) or e.__class__.__name__}")
+            return False
+        self._values = data.get("values", {})
+        self.source = "disk_cache"
+        self.refreshed_at = data.get("saved_at")
+        log.info(f"Serving {len(self._values)} parameters from disk cache")
+        return True
+
+    def _save_cache(self):
+        if not (self._cipher and self.cache_path):
+            return
+        try:
+            token = self._cipher.encrypt(json.dumps({"saved_at": time.time(), "values": self._values}).encode("utf-8"))
+            tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "wb") as f:
+                f.write(token)
+            os.replace(tmp_path, self.cache_path)
+        except Exception as e:
+            log.warning(f"Could not write parameter cache: {e}")
+
+    def state(self) -> dict:
+        return {
+            "source": self.source,
+            "parameters": sorted(self._values),
+            "refreshed_at": self.refreshed_at,
+            "refresh_failures": self.refresh_failures,
+            "disk_cache": bool(self._cipher and self.cache_path)
+        }
@@ -1,20 +1,16 @@
-import time
 import hashlib
-import uuid
-from typing import Dict, Set, Optional
+import threading
+from typing import Optional
+from starlette.concurrency import run_in_threadpool
+
+from app.core.guard_store import GuardStore, create_guard_store
+from app.core.log import get_logger
 
 # --- CONFIGURATION ---
 MAX_STEPS = 10         # Maximum number of steps per execution_id
 MAX_TTL = 60.0         # Seconds an execution_id remains valid
 MAX_TOKEN_ESTIMATE = 4000 # Rough estimate of max tokens per request
-
-class ExecutionData:
-    def __init__(self, execution_id: str):
-        self.execution_id = execution_id
-        self.start_time = time.time()
-        self.steps = 0
-        self.prompt_hashes: Set[str] = set()
-        self.is_active = True
+MAX_TRACKED = 100_000  # Hard cap on live execution_ids; the oldest are evicted beyond it
 
 class ExecutionGuardException(Exception):
     def __init__(self, message: str, code: str):
@@ -22,62 +18,78 @@ class ExecutionGuardException(Exception):
         self.code = code
         super().__init__(self.message)
 
+_MESSAGES = {
+    "TTL_EXCEEDED": f"Execution expired (TTL {MAX_TTL}s exceeded)",
+    "MAX_STEPS_EXCEEDED": f"Step limit reached ({MAX_STEPS})",
+    "LOOP_DETECTED": "Loop detected: Identical prompt repeated",
+}
+
 class ExecutionContext:
     """
-    In-Memory Guard for AI Executions.
+    Guard for AI Executions.
     Prevents loops, recursion, and excessive usage.
+    State lives in a GuardStore chosen by settings.guard_backend: "memory"
+    (per process), "sqlite" (shared by the workers of one host) or "redis"
+    (shared by every replica).
     """
-    _executions: Dict[str, ExecutionData] = {}
+    _store: Optional[GuardStore] = None
+    _store_lock = threading.Lock()
+
+    @classmethod
+    def get_store(cls) -> GuardStore:
+        if cls._store is None:
+            with cls._store_lock:
+                if cls._store is None:
+                    cls._store = cls._create_store()
+        return cls._store
 
     @classmethod
-    def get_context(cls, execution_id: str) -> ExecutionData:
-        # Cleanup expired keys on access (lazy cleanup)
-        cls._cleanup()
-        
-        if execution_id not in cls._executions:
-            cls._executions[execution_id] = ExecutionData(execution_id)
-        
-        return cls._executions[execution_id]
+    def _create_store(cls) -> GuardStore:
+        from app.config import settings
+        store = create_guard_store(
+            settings.guard_backend,
+            max_tracked=MAX_TRACKED,
+            memory_shards=settings.guard_memory_shards,
+            sqlite_path=settings.guard_sqlite_path,
+            redis_url=settings.guard_redis_url,
+            redis_prefix=settings.guard_redis_prefix,
+            timeout=settings.guard_store_timeout
+        )
+        get_logger("guard").info(f"Using {settings.guard_backend} backend")
+        return store
+
+    @classmethod
+    def set_store(cls, store: GuardStore):
+        cls._store = store
 
     @classmethod
     def validate_request(cls, execution_id: str, prompt: str):
         """
-        Validates the request against safety rules.
+        Validates the request against safety rules
+        (TTL, step limit, identical prompt repeated).
         """
         if not execution_id:
             raise ExecutionGuardException("Missing execution_id", "MISSING_ID")
 
-        ctx = cls.get_context(execution_id)
-        
-        # 1. TTL Check
-        elapsed = time.time() - ctx.start_time
-        if elapsed > MAX_TTL:
-             raise ExecutionGuardException(f"Execution expired (TTL {MAX_TTL}s exceeded)", "TTL_EXCEEDED")
-
-        # 2. Step Limit
-        if ctx.steps >= MAX_STEPS:
-            raise ExecutionGuardException(f"Step limit reached ({MAX_STEPS})", "MAX_STEPS_EXCEEDED")
+        prompt_hash = hashlib.md5(prompt.encode('utf-8')).digest()
+        code = cls.get_store().check_and_record(execution_id, prompt_hash, MAX_STEPS, MAX_TTL)
+        if code is not None:
+            raise ExecutionGuardException(_MESSAGES[code], code)
 
-        # 3. Recursive/Loop Check (Hash)
-        prompt_hash = hashlib.md5(prompt.encode('utf-8')).hexdigest()
-        if prompt_hash in ctx.prompt_hashes:
-            raise ExecutionGuardException("Loop detected: Identical prompt repeated", "LOOP_DETECTED")
-        
-        # 4. Update State
-        ctx.steps += 1
-        ctx.prompt_hashes.add(prompt_hash)
-        
         return True
 
     @classmethod
-    def _cleanup(cls):
-        """Remove expired contexts to free memory."""
-        now = time.time()
-        to_remove = [k for k, v in cls._executions.items() if (now - v.start_time) > MAX_TTL]
-        for k in to_remove:
-            del cls._executions[k]
+    async def avalidate_request(cls, execution_id: str, prompt: str):
+        """validate_request for async callers: I/O-backed stores run in a worker thread, off the event loop."""
+        if cls.get_store().blocking:
+            return await run_in_threadpool(cls.validate_request, execution_id, prompt)
+        return cls.validate_request(execution_id, prompt)
+
+    @classmethod
+    def stats(cls) -> dict:
+        return cls.get_store().stats()
 
     @classmethod
     def reset(cls):
         """Clear all contexts (Testing only)"""
-        cls._executions = {}
+        cls.get_store().reset()
@@ -0,0 +1,305 @@
+import abc
+import time
+import heapq
+import itertools
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+
+# Block codes returned by GuardStore.check_and_record (None = allowed)
+TTL_EXCEEDED = "TTL_EXCEEDED"
+MAX_STEPS_EXCEEDED = "MAX_STEPS_EXCEEDED"
+LOOP_DETECTED = "LOOP_DETECTED"
+
+class GuardStore(abc.ABC):
+    """
+    Storage behind ExecutionContext. check_and_record must be atomic: the step
+    check, the prompt-hash check and recording both happen as one operation,
+    so concurrent requests for the same execution_id cannot overshoot MAX_STEPS.
+    Stores doing I/O set `blocking = True`, and async callers then run them in
+    a worker thread instead of on the event loop.
+    """
+    blocking = False
+
+    @abc.abstractmethod
+    def check_and_record(self, execution_id: str, prompt_hash: bytes, max_steps: int, ttl: float) -> Optional[str]:
+        ...
+
+    def stats(self) -> dict:
+        return {}
+
+    @abc.abstractmethod
+    def reset(self):
+        ...
+
+class ExecutionData:
+    __slots__ = ("execution_id", "start_time", "expires_at", "steps", "prompt_hashes", "is_active")
+
+    def __init__(self, execution_id: str, ttl: float):
+        self.execution_id = execution_id
+        self.start_time = time.time()
+        self.expires_at = self.start_time + ttl
+        self.steps = 0
+        self.prompt_hashes: Set[bytes] = set()   # md5 digests (16 bytes each)
+        self.is_active = True
+
+class _MemoryShard:
+    """
+    One lock-protected slice of the memory store.
+
+    Contexts are also kept in a min-heap ordered by expiry, so cleanup only
+    touches entries that actually expired (amortised O(log n) per request
+    instead of a scan of every live id). Since every id gets the same TTL,
+    the heap top is also the oldest id, which is what the max_tracked cap evicts.
+    """
+    __slots__ = ("max_tracked", "lock", "executions", "expiry_heap")
+
+    def __init__(self, max_tracked: int):
+        self.max_tracked = max_tracked
+        self.lock = threading.Lock()
+        self.executions: Dict[str, ExecutionData] = {}
+        self.expiry_heap: List[Tuple[float, str]] = []
+
+    def get_context(self, execution_id: str, ttl: float) -> ExecutionData:
+        # Cleanup expired keys on access (lazy cleanup)
+        self.cleanup()
+
+        ctx = self.executions.get(execution_id)
+        if ctx is None:
+            while len(self.executions) >= self.max_tracked and self.pop_oldest() is not None:
+                pass
+            ctx = self.executions[execution_id] = ExecutionData(execution_id, ttl)
+            heapq.heappush(self.expiry_heap, (ctx.expires_at, execution_id))
+        return ctx
+
+    def pop_oldest(self) -> Optional[ExecutionData]:
+        """Removes the context with the earliest expiry; heap entries left by an evicted id are skipped."""
+        heap = self.expiry_heap
+        while heap:
+            expires_at, execution_id = heapq.heappop(heap)
+            ctx = self.executions.get(execution_id)
+            if ctx is not None and ctx.expires_at == expires_at:
+                del self.executions[execution_id]
+                return ctx
+        return None
+
+    def cleanup(self):
+        """Remove expired contexts to free memory."""
+        now = time.time()
+        heap = self.expiry_heap
+        while heap and heap[0][0] < now:
+            self.pop_oldest()
+
+class MemoryGuardStore(GuardStore):
+    """
+    Per-process store (limits hold per worker process only).
+    State is split into `shards` slices by execution_id, each with its own lock,
+    so threads checking different executions rarely contend, while the
+    read-check-increment for one execution_id is serialised by its shard lock.
+    """
+    def __init__(self, max_tracked: int = 100_000, shards: int = 16):
+        self.max_tracked = max_tracked
+        per_shard = max(1, -(-max_tracked // shards))
+        self._shards = [_MemoryShard(per_shard) for _ in range(shards)]
+
+    def _shard(self, execution_id: str) -> _MemoryShard:
+        return self._shards[hash(execution_id) % len(self._shards)]
+
+    def check_and_record(self, execution_id: str, prompt_hash: bytes, max_steps: int, ttl: float) -> Optional[str]:
+        shard = self._shard(execution_id)
+        with shard.lock:
+            ctx = shard.get_context(execution_id, ttl)
+            if time.time() - ctx.start_time > ttl:
+                return TTL_EXCEEDED
+            if ctx.steps >= max_steps:
+                return MAX_STEPS_EXCEEDED
+            if prompt_hash in ctx.prompt_hashes:
+                return LOOP_DETECTED
+            ctx.steps += 1
+            ctx.prompt_hashes.add(prompt_hash)
+            return None
+
+    def stats(self) -> dict:
+        tracked = heap_entries = 0
+        for shard in self._shards:
+            with shard.lock:
+                tracked += len(shard.executions)
+                heap_entries += len(shard.expiry_heap)
+        return {"backend": "memory", "shards": len(self._shards), "tracked": tracked, "heap_entries": heap_entries, "max_tracked": self.max_tracked}
+
+    def reset(self):
+        for shard in self._shards:
+            with shard.lock:
+                shard.executions = {}
+                shard.expiry_heap = []
+
+class SQLiteGuardStore(GuardStore):
+    """
+    Host-wide store in a SQLite file, shared by every uvicorn worker on the machine.
+    Each check runs in one BEGIN IMMEDIATE transaction (a write lock taken up front),
+    which makes check-and-record atomic across processes. A check waits at most
+    `timeout` seconds for the lock, then raises sqlite3.OperationalError.
+    """
+    blocking = True
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS guard_executions (
+            execution_id TEXT PRIMARY KEY,
+            start_time REAL NOT NULL,
+            expires_at REAL NOT NULL,
+            steps INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS guard_executions_expiry ON guard_executions (expires_at);
+        CREATE TABLE IF NOT EXISTS guard_prompts (
+            execution_id TEXT NOT NULL REFERENCES guard_executions (execution_id) ON DELETE CASCADE,
+            prompt_hash BLOB NOT NULL,
+            PRIMARY KEY (execution_id, prompt_hash)
+        ) WITHOUT ROWID;
+    """
+
+    def __init__(self, path: str, max_tracked: int = 100_000, sweep_every: int = 1000, timeout: float = 2.0):
+        self.path = path
+        self.timeout = timeout
+        self.max_tracked = max_tracked
+        self.sweep_every = sweep_every
+        self._local = threading.local()
+        self._calls = itertools.count(1)
+        with self._connect() as conn:
+            conn.executescript(self._SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def check_and_record(self, execution_id: str, prompt_hash: bytes, max_steps: int, ttl: float) -> Optional[str]:
+        conn = self._connect()
+        now = time.time()
+        if next(self._calls) % self.sweep_every == 0:
+            self._sweep(conn, now)
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT start_time, expires_at, steps FROM guard_executions WHERE execution_id = ?", (execution_id,)).fetchone()
+            if row is not None and row[1] < now:
+                # Expired: same as the memory store, the id starts over
+                conn.execute("DELETE FROM guard_executions WHERE execution_id = ?", (execution_id,))
+                row = None
+            if row is None:
+                conn.execute("INSERT INTO guard_executions (execution_id, start_time, expires_at, steps) VALUES (?, ?, ?, 0)", (execution_id, now, now + ttl))
+                start_time, steps = now, 0
+            else:
+                start_time, _, steps = row
+
+            code = None
+            if now - start_time > ttl:
+                code = TTL_EXCEEDED
+            elif steps >= max_steps:
+                code = MAX_STEPS_EXCEEDED
+            elif conn.execute("INSERT OR IGNORE INTO guard_prompts (execution_id, prompt_hash) VALUES (?, ?)", (execution_id, prompt_hash)).rowcount == 0:
+                code = LOOP_DETECTED
+            else:
+                conn.execute("UPDATE guard_executions SET steps = steps + 1 WHERE execution_id = ?", (execution_id,))
+            conn.execute("COMMIT")
+            return code
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _sweep(self, conn: sqlite3.Connection, now: float):
+        """Deletes expired executions, then the oldest ones beyond max_tracked."""
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM guard_executions WHERE expires_at < ?", (now,))
+            conn.execute(
+                "DELETE FROM guard_executions WHERE execution_id IN "
+                "(SELECT execution_id FROM guard_executions ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_tracked,)
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def stats(self) -> dict:
+        tracked = self._connect().execute("SELECT COUNT(*) FROM guard_executions").fetchone()[0]
+        return {"backend": "sqlite", "path": self.path, "tracked": tracked, "max_tracked": self.max_tracked}
+
+    def reset(self):
+        conn = self._connect()
+        conn.execute("DELETE FROM guard_executions")
+
+class RedisGuardStore(GuardStore):
+    """
+    Cluster-wide store for several hosts/ECS tasks. Needs the optional 'redis'
+    package; works with any server speaking the Redis protocol and Lua scripting.
+    The check runs as one Lua script, which Redis executes atomically. Keys expire
+    with the execution TTL, so no sweep is needed. Connecting and each command
+    time out after `timeout` seconds, so a slow Redis fails requests instead of
+    hanging them. `client` accepts a ready redis-py compatible client (e.g. a
+    local stand-in) instead of a URL.
+    """
+    blocking = True
+
+    _SCRIPT = """
+        local t = redis.call('TIME')
+        local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+        local ttl = tonumber(ARGV[1])
+        local start = redis.call('HGET', KEYS[1], 'start')
+        if not start then
+            redis.call('HSET', KEYS[1], 'start', tostring(now), 'steps', 0)
+            redis.call('PEXPIRE', KEYS[1], math.ceil(ttl * 1000))
+            start = now
+        else
+            start = tonumber(start)
+        end
+        if now - start > ttl then return 'TTL_EXCEEDED' end
+        if tonumber(redis.call('HGET', KEYS[1], 'steps')) >= tonumber(ARGV[2]) then return 'MAX_STEPS_EXCEEDED' end
+        if redis.call('SADD', KEYS[2], ARGV[3]) == 0 then return 'LOOP_DETECTED' end
+        redis.call('PEXPIRE', KEYS[2], math.max(1, math.ceil((start + ttl - now) * 1000)))
+        redis.call('HINCRBY', KEYS[1], 'steps', 1)
+        return ''
+    """
+
+    def __init__(self, url: str = None, prefix: str = "keduka:guard:", timeout: float = 0.5, client=None):
+        if client is None:
+            try:
+                import redis
+            except ImportError as e:
+                raise RuntimeError("guard_backend=redis requires the 'redis' package") from e
+            client = redis.Redis.from_url(url, socket_timeout=timeout, socket_connect_timeout=timeout)
+        self.prefix = prefix
+        self._client = client
+        self._script = self._client.register_script(self._SCRIPT)
+
+    def check_and_record(self, execution_id: str, prompt_hash: bytes, max_steps: int, ttl: float) -> Optional[str]:
+        # Hash tag keeps both keys of one execution in the same cluster slot
+        base = f"{self.prefix}{{{execution_id}}}"
+        code = self._script(keys=[base, base + ":prompts"], args=[ttl, max_steps, prompt_hash])
+        if isinstance(code, bytes):
+            code = code.decode()
+        return code or None
+
+    def stats(self) -> dict:
+        return {"backend": "redis", "prefix": self.prefix}
+
+    def reset(self):
+        for key in self._client.scan_iter(match=f"{self.prefix}*", count=1000):
+            self._client.delete(key)
+
+def create_guard_store(backend: str, max_tracked: int = 100_000, memory_shards: int = 16, sqlite_path: str = None,
+                       redis_url: str = None, redis_prefix: str = "keduka:guard:", timeout: float = 2.0) -> GuardStore:
+    if backend == "memory":
+        return MemoryGuardStore(max_tracked=max_tracked, shards=memory_shards)
+    if backend == "sqlite":
+        return SQLiteGuardStore(sqlite_path, max_tracked=max_tracked, timeout=timeout)
+    if backend == "redis":
+        if not redis_url:
+            raise ValueError("guard_backend=redis requires guard_redis_url")
+        return RedisGuardStore(redis_url, prefix=redis_prefix, timeout=timeout)
+    raise ValueError(f"Unknown guard backend: {backend}")
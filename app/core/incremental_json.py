@@ -0,0 +1,94 @@
+import json
+from typing import List
+
+class StringArrayStreamParser:
+    """
+    Incremental parser for one array-of-strings field inside a streamed JSON object,
+    e.g. the "topics" list of SyllabusOutput: {"topics": ["a", "b", ...]}.
+
+    feed(text) consumes the next chunk of model output and returns the strings
+    completed by that chunk, so each topic can be emitted as soon as its closing
+    quote arrives. Text before the object (prose, ```json fences) is ignored.
+    Only the first occurrence of the key is used.
+    """
+    _SEEK_KEY, _SEEK_COLON, _SEEK_ARRAY, _IN_ARRAY, _IN_STRING, _DONE = range(6)
+
+    def __init__(self, key: str = "topics"):
+        self.key = key
+        self._state = self._SEEK_KEY
+        self._scan = ""          # Tail kept while looking for "key"
+        self._buf: List[str] = []
+        self._escape = False
+        self.items: List[str] = []
+
+    @property
+    def done(self) -> bool:
+        return self._state == self._DONE
+
+    def feed(self, text: str) -> List[str]:
+        completed = []
+        i = 0
+        n = len(text)
+        while i < n and self._state != self._DONE:
+            state = self._state
+
+            if state == self._SEEK_KEY:
+                needle = f'"{self.key}"'
+                self._scan += text[i:]
+                pos = self._scan.find(needle)
+                if pos < 0:
+                    # Keep just enough tail to match a needle split across chunks
+                    self._scan = self._scan[-(len(needle) - 1):]
+                    return completed
+                rest = self._scan[pos + len(needle):]
+                self._scan = ""
+                self._state = self._SEEK_COLON
+                text, i, n = rest, 0, len(rest)
+                continue
+
+            ch = text[i]
+            if state == self._SEEK_COLON:
+                if ch == ":":
+                    self._state = self._SEEK_ARRAY
+                elif not ch.isspace():
+                    # "topics" appeared as a value, not a key: keep looking
+                    self._state = self._SEEK_KEY
+                    continue
+            elif state == self._SEEK_ARRAY:
+                if ch == "[":
+                    self._state = self._IN_ARRAY
+                elif not ch.isspace():
+                    self._state = self._SEEK_KEY
+                    continue
+            elif state == self._IN_ARRAY:
+                if ch == '"':
+                    self._state = self._IN_STRING
+                    self._buf = []
+                elif ch == "]":
+                    self._state = self._DONE
+            elif state == self._IN_STRING:
+                # Copy runs of plain characters at once
+                j = i
+                while j < n:
+                    c = text[j]
+                    if self._escape:
+                        self._escape = False
+                    elif c == "\\":
+                        self._escape = True
+                    elif c == '"':
+                        break
+                    j += 1
+                self._buf.append(text[i:j])
+                if j < n:
+                    raw = "".join(self._buf)
+                    try:
+                        value = json.loads(f'"{raw}"')
+                    except ValueError:
+                        value = raw
+                    self.items.append(value)
+                    completed.append(value)
+                    self._state = self._IN_ARRAY
+                i = j + 1
+                continue
+            i += 1
+        return completed
@@ -1,11 +1,14 @@
-from typing import Any, List, Optional, Mapping
-from langchain_core.callbacks.manager import CallbackManagerForLLMRun
+from typing import Any, AsyncIterator, Iterator, List, Optional, Mapping
+from langchain_core.callbacks.manager import CallbackManagerForLLMRun, AsyncCallbackManagerForLLMRun
 from langchain_core.language_models.chat_models import BaseChatModel
-from langchain_core.messages import BaseMessage, AIMessage, SystemMessage, HumanMessage
-from langchain_core.outputs import ChatResult, ChatGeneration
+from langchain_core.messages import BaseMessage, AIMessage, AIMessageChunk, SystemMessage, HumanMessage
+from langchain_core.outputs import ChatResult, ChatGeneration, ChatGenerationChunk
 from pydantic import Field
-import requests
-import json
+# Transport and guard live in a langchain-free module so the app can import them cheaply
+from app.core.orchestrator_transport import (
+    get_sync_session, get_async_client, get_orchestrator_guard,
+    parse_stream_line, is_streamed, transport_settings, observe_call
+)
 
 class OrchestratorChatModel(BaseChatModel):
     """
@@ -17,25 +20,20 @@ class OrchestratorChatModel(BaseChatModel):
     top_p: Optional[float] = None
     frequency_penalty: Optional[float] = None
     presence_penalty: Optional[float] = None
-    
+    timeout: Optional[float] = None
+
     @property
     def _llm_type(self) -> str:
         return "md-ai-orchestrator-adapter"
 
-    def _generate(
-        self,
-        messages: List[BaseMessage],
-        stop: Optional[List[str]] = None,
-        run_manager: Optional[CallbackManagerForLLMRun] = None,
-        **kwargs: Any,
-    ) -> ChatResult:
+    def _build_payload(self, messages: List[BaseMessage], **kwargs: Any) -> dict:
         # 1. Convert Messages to Single Prompt & System Prompt
         prompt_parts = []
         system_prompt = None
-        
+
         for m in messages:
             if isinstance(m, SystemMessage):
-                # If we have multiple system messages, join them or pick last? 
+                # If we have multiple system messages, join them or pick last?
                 # Orchestrator prefers one. We'll join them if multiple.
                 if system_prompt:
                     system_prompt += "\n" + m.content
@@ -47,12 +45,12 @@ class OrchestratorChatModel(BaseChatModel):
                 prompt_parts.append(f"AI: {m.content}")
             else:
                 prompt_parts.append(f"{m.type}: {m.content}")
-        
+
         full_prompt = "\n\n".join(prompt_parts)
 
         # 2. Prepare Payload
         # Priority: kwargs (bind) > self.field > default
-        payload = {
+        return {
             "origin": self.origin_service,
             "prompt": full_prompt,
             "system_prompt": system_prompt,
@@ -64,19 +62,120 @@ class OrchestratorChatModel(BaseChatModel):
             "max_tokens": kwargs.get("max_tokens", 4000)
         }
 
+    def _to_result(self, data: dict) -> ChatResult:
+        ai_text = data.get("response", "")
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=ai_text))])
+
+    def _timeout(self) -> float:
+        return self.timeout or transport_settings().orchestrator_timeout
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        payload = self._build_payload(messages, **kwargs)
+
         # 3. Call Orchestrator
-        try:
-            response = requests.post(f"{self.orchestrator_url}/execute", json=payload, timeout=60)
+        def _send():
+            response = get_sync_session().post(f"{self.orchestrator_url}/execute", json=payload, timeout=self._timeout())
             response.raise_for_status()
-            data = response.json()
-            ai_text = data.get("response", "")
-            
+            return response
+
+        try:
+            with observe_call("generate") as outcome:
+                response = get_orchestrator_guard().call(_send)
+                outcome["status"] = str(response.status_code)
+
             # 4. Return as ChatResult
-            return ChatResult(generations=[ChatGeneration(message=AIMessage(content=ai_text))])
-            
+            return self._to_result(response.json())
+
         except Exception as e:
             raise ValueError(f"Orchestrator Call Failed: {str(e)}")
 
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        payload = self._build_payload(messages, **kwargs)
+
+        async def _send():
+            response = await get_async_client().post(f"{self.orchestrator_url}/execute", json=payload, timeout=self._timeout())
+            response.raise_for_status()
+            return response
+
+        try:
+            with observe_call("generate") as outcome:
+                response = await get_orchestrator_guard().acall(_send)
+                outcome["status"] = str(response.status_code)
+            return self._to_result(response.json())
+
+        except Exception as e:
+            raise ValueError(f"Orchestrator Call Failed: {str(e)}")
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        """
+        Streams /execute with "stream": true. An orchestrator that ignores the flag
+        and answers with plain JSON yields its whole response as one chunk.
+        """
+        payload = {**self._build_payload(messages, **kwargs), "stream": True}
+
+        try:
+            with observe_call("stream") as outcome, get_orchestrator_guard().slot():
+                with get_sync_session().post(f"{self.orchestrator_url}/execute", json=payload, timeout=self._timeout(), stream=True) as response:
+                    response.raise_for_status()
+                    outcome["status"] = str(response.status_code)
+                    if not is_streamed(response.headers.get("content-type", "")):
+                        yield ChatGenerationChunk(message=AIMessageChunk(content=response.json().get("response", "")))
+                        return
+                    for line in response.iter_lines(decode_unicode=True):
+                        delta = parse_stream_line(line or "")
+                        if delta:
+                            if run_manager:
+                                run_manager.on_llm_new_token(delta)
+                            yield ChatGenerationChunk(message=AIMessageChunk(content=delta))
+        except Exception as e:
+            raise ValueError(f"Orchestrator Stream Failed: {str(e)}")
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        payload = {**self._build_payload(messages, **kwargs), "stream": True}
+
+        try:
+            with observe_call("stream") as outcome:
+                async with get_orchestrator_guard().aslot():
+                    async with get_async_client().stream("POST", f"{self.orchestrator_url}/execute", json=payload, timeout=self._timeout()) as response:
+                        response.raise_for_status()
+                        outcome["status"] = str(response.status_code)
+                        if not is_streamed(response.headers.get("content-type", "")):
+                            await response.aread()
+                            yield ChatGenerationChunk(message=AIMessageChunk(content=response.json().get("response", "")))
+                            return
+                        async for line in response.aiter_lines():
+                            delta = parse_stream_line(line)
+                            if delta:
+                                if run_manager:
+                                    await run_manager.on_llm_new_token(delta)
+                                yield ChatGenerationChunk(message=AIMessageChunk(content=delta))
+        except Exception as e:
+            raise ValueError(f"Orchestrator Stream Failed: {str(e)}")
+
     @property
     def _identifying_params(self) -> Mapping[str, Any]:
         return {"orchestrator_url": self.orchestrator_url}
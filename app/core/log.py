@@ -0,0 +1,133 @@
+"""
+Structured, non-blocking logging.
+
+Records are JSON lines (ts, level, category, msg, request/execution id and any
+`extra={"data": {...}}` fields; a data key that collides with one of those is
+written as "data.<key>"). Loggers only put records on an in-memory
+queue (QueueHandler); a QueueListener thread formats and writes them, so
+request threads and the event loop never block on stdout/CloudWatch I/O.
+DEBUG/INFO records can be sampled per category; WARNING and above are always kept.
+"""
+import sys
+import json
+import time
+import queue
+import random
+import atexit
+import logging
+import logging.handlers
+import contextvars
+from typing import Dict, Optional
+
+ROOT = "keduka"
+
+request_id_var: contextvars.ContextVar = contextvars.ContextVar("request_id", default=None)
+execution_id_var: contextvars.ContextVar = contextvars.ContextVar("execution_id", default=None)
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_sample_rates: Dict[str, float] = {}
+
+def get_logger(category: str) -> logging.Logger:
+    """Logger for one category (moodle, ai_service, guard, ssm, jobs, ...)."""
+    return logging.getLogger(f"{ROOT}.{category}")
+
+class Lazy:
+    """
+    Deferred log field: extra={"data": {"response": Lazy(log_preview, data)}} only
+    calls log_preview(data) when the record passes the level check and sampling.
+    """
+    __slots__ = ("fn", "args")
+
+    def __init__(self, fn, *args):
+        self.fn = fn
+        self.args = args
+
+    def __str__(self) -> str:
+        return str(self.fn(*self.args))
+
+class ContextFilter(logging.Filter):
+    """Stamps correlation ids (from contextvars) and applies per-category sampling."""
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING:
+            rate = _sample_rates.get(record.name[len(ROOT) + 1:], 1.0)
+            if rate < 1.0 and random.random() >= rate:
+                return False
+        # Resolved here, on the calling thread/task: the listener thread has no context
+        record.request_id = request_id_var.get()
+        record.execution_id = execution_id_var.get()
+        return True
+
+class JsonFormatter(logging.Formatter):
+    # Keys the formatter owns; caller data never overwrites them
+    RESERVED = frozenset({"ts", "level", "category", "msg", "request_id", "execution_id", "exc"})
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "category": record.name[len(ROOT) + 1:] or record.name,
+            "msg": record.getMessage()
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        if getattr(record, "execution_id", None):
+            entry["execution_id"] = record.execution_id
+        data = getattr(record, "data", None)
+        if data:
+            for key, value in data.items():
+                entry[f"data.{key}" if key in self.RESERVED else key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class TextFormatter(logging.Formatter):
+    """Human-readable variant for local runs: [category] msg key=value ..."""
+    def format(self, record: logging.LogRecord) -> str:
+        parts = [f"[{record.name[len(ROOT) + 1:].upper()}] {record.getMessage()}"]
+        if getattr(record, "execution_id", None):
+            parts.append(f"execution_id={record.execution_id}")
+        for key, value in (getattr(record, "data", None) or {}).items():
+            parts.append(f"{key}={value}")
+        return " ".join(parts)
+
+class _PreformattedQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Keep `data` and the correlation ids as attributes; only merge args into msg
+        record.msg = record.getMessage()
+        record.args = None
+        # Render Lazy fields now, on the caller's thread, while their inputs are still in scope and unchanged
+        data = getattr(record, "data", None)
+        if data and any(isinstance(value, Lazy) for value in data.values()):
+            record.data = {key: str(value) if isinstance(value, Lazy) else value for key, value in data.items()}
+        return record
+
+def setup_logging(level: str = "INFO", fmt: str = "json", sample_rates: Dict[str, float] = None):
+    """Installs the queue handler on the 'keduka' logger and starts the writer thread (idempotent)."""
+    global _listener
+    _sample_rates.clear()
+    _sample_rates.update(sample_rates or {})
+    if _listener is not None:
+        return
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+
+    handler = _PreformattedQueueHandler(log_queue)
+    handler.addFilter(ContextFilter())
+
+    root = logging.getLogger(ROOT)
+    root.handlers = [handler]
+    root.setLevel(level.upper())
+    root.propagate = False
+
+    _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=False)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+def shutdown_logging():
+    """Flushes queued records and stops the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
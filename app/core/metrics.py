@@ -0,0 +1,178 @@
+"""
+In-process metrics exposed in Prometheus text format (GET /metrics).
+
+Updates on hot paths take no lock: every thread owns its cells (threading.local)
+and a scrape sums the cells of all threads. Coroutines on the event loop share
+the loop thread's cells and never interleave inside an update. Point-in-time
+values (cache hit ratios, pool usage, breaker state) are not tracked at all;
+collectors read them from the existing stats() at scrape time.
+"""
+import bisect
+import math
+import threading
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+# Upstream calls range from cached lookups (ms) to LLM generations (minutes)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# (metric name, type, help, [(labels, value, name suffix), ...])
+Family = Tuple[str, str, str, List[Tuple[Dict[str, str], float, str]]]
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._cells: List[dict] = []
+        self._cells_lock = threading.Lock()
+
+    def _cell(self) -> dict:
+        cell = getattr(self._local, "cell", None)
+        if cell is None:
+            # Once per thread; every later update on this thread is lock-free
+            cell = self._local.cell = {}
+            with self._cells_lock:
+                self._cells.append(cell)
+        return cell
+
+    def _snapshots(self) -> List[dict]:
+        with self._cells_lock:
+            cells = list(self._cells)
+        # dict.copy() is atomic under the GIL, so a writer thread cannot break it
+        return [cell.copy() for cell in cells]
+
+    def _labels(self, values: Tuple[str, ...]) -> Dict[str, str]:
+        return dict(zip(self.labelnames, values))
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        cell = self._cell()
+        cell[labels] = cell.get(labels, 0.0) + amount
+
+    def collect(self) -> Iterable[Family]:
+        totals: Dict[tuple, float] = {}
+        for cell in self._snapshots():
+            for labels, value in cell.items():
+                totals[labels] = totals.get(labels, 0.0) + value
+        yield self.name, self.type, self.help, [(self._labels(k), v, "") for k, v in sorted(totals.items())]
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels: str):
+        cell = self._cell()
+        series = cell.get(labels)
+        if series is None:
+            # Per-bucket counts (+Inf last), then sum
+            series = cell[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def collect(self) -> Iterable[Family]:
+        totals: Dict[tuple, list] = {}
+        for cell in self._snapshots():
+            for labels, series in cell.items():
+                series = list(series)
+                total = totals.get(labels)
+                if total is None:
+                    totals[labels] = series
+                else:
+                    for i, value in enumerate(series):
+                        total[i] += value
+
+        samples = []
+        for key, series in sorted(totals.items()):
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), series):
+                cumulative += count
+                samples.append(({**labels, "le": _format_value(bound)}, cumulative, "_bucket"))
+            samples.append((labels, series[-1], "_sum"))
+            samples.append((labels, cumulative, "_count"))
+        yield self.name, self.type, self.help, samples
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], Iterable[Family]]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, fn: Callable[[], Iterable[Family]]):
+        """Registers fn() -> families of gauges read at scrape time (decorator)."""
+        self._collectors.append(fn)
+        return fn
+
+    def render(self) -> str:
+        lines: List[str] = []
+        sources = [metric.collect for metric in self._metrics] + self._collectors
+        for source in sources:
+            try:
+                families = list(source())
+            except Exception as e:
+                # A broken collector must not take down the whole scrape
+                lines.append(f"# collector {getattr(source, '__name__', source)} failed: {e}")
+                continue
+            for name, type_, help_, samples in families:
+                lines.append(f"# HELP {name} {help_}")
+                lines.append(f"# TYPE {name} {type_}")
+                for labels, value, suffix in samples:
+                    lines.append(f"{name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+REGISTRY = Registry()
+
+MOODLE_CALL_SECONDS = REGISTRY.register(Histogram(
+    "keduka_moodle_call_duration_seconds",
+    "Moodle web service call latency by wsfunction (result: hit = served from the read cache, ok, error)",
+    ("wsfunction", "result")
+))
+ORCHESTRATOR_SECONDS = REGISTRY.register(Histogram(
+    "keduka_orchestrator_request_duration_seconds",
+    "AI Orchestrator /execute latency (mode: generate or stream; status: HTTP status or error class)",
+    ("mode", "status")
+))
+HTTP_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "keduka_http_request_duration_seconds",
+    "API request latency by route template",
+    ("method", "route", "status")
+))
+GUARD_DECISIONS = REGISTRY.register(Counter(
+    "keduka_guard_decisions_total",
+    "Execution guard decisions by code (ALLOWED, LOOP_DETECTED, MAX_STEPS_EXCEEDED, MISSING_ID, RATE_LIMITED, ...)",
+    ("code",)
+))
+
+def error_status(exc: BaseException) -> str:
+    """HTTP status carried by a requests/httpx error, else the exception class name."""
+    response = getattr(exc, "response", None)
+    status = getattr(response, "status_code", None)
+    return str(status) if status is not None else exc.__class__.__name__
@@ -0,0 +1,121 @@
+"""
+Projected decoding of large Moodle responses.
+
+core_course_get_contents returns every section with every module (descriptions,
+contents, file lists) while the section sync only needs id/section/name/visible.
+SectionsDecoder is fed the raw response bytes as they arrive and keeps only those
+fields in slotted SectionRecords. With ijson (in requirements.txt) the JSON is
+parsed incrementally and only one section's modules exist at a time; if it is
+missing the body is buffered and decoded with json, then projected.
+"""
+import json
+import reprlib
+from typing import Any, List, Optional
+
+try:
+    import ijson
+except ImportError:  # Falls back to buffered json decoding
+    ijson = None
+
+class SectionRecord:
+    """
+    The fields of a core_course_get_contents section the syllabus sync uses.
+    Supports record["id"] and record.get("name") so code written against the raw
+    dicts (section_planner, execute_section_plan) works unchanged.
+    """
+    __slots__ = ("id", "section", "name", "visible")
+    FIELDS = __slots__
+
+    def __init__(self, id: int = None, section: int = None, name: str = None, visible: int = None):
+        self.id = id
+        self.section = section
+        self.name = name
+        self.visible = visible
+
+    def get(self, key: str, default: Any = None) -> Any:
+        value = getattr(self, key, None) if key in self.FIELDS else None
+        return default if value is None else value
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def to_dict(self) -> dict:
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    def __repr__(self) -> str:
+        return f"SectionRecord(id={self.id}, section={self.section}, name={self.name!r})"
+
+def _project(item: dict) -> SectionRecord:
+    return SectionRecord(item.get("id"), item.get("section"), item.get("name"), item.get("visible"))
+
+class SectionsDecoder:
+    """
+    Push decoder: feed(chunk) for each body chunk, then close() returns the list of
+    SectionRecords (or the Moodle exception dict, for parse_response to raise).
+
+    With ijson, items_coro yields one complete section object per array element;
+    its module lists are built in C, projected away and dropped before the next
+    section is parsed. A body that is an object rather than an array is a Moodle
+    exception: it is small, so it is buffered and decoded with json.
+    """
+    name = "sections"
+
+    # Returned for an empty body so parse_response raises its usual Moodle error
+    EMPTY_RESPONSE = {"exception": "invalid_response", "errorcode": "empty_response", "message": "Empty response body"}
+
+    def __init__(self):
+        self._records: List[SectionRecord] = []
+        self._chunks: List[bytes] = []
+        self._streaming: Optional[bool] = None if ijson is not None else False
+
+    def feed(self, chunk: bytes):
+        if self._streaming is None:
+            head = chunk.lstrip()
+            if not head:
+                return
+            self._streaming = head[:1] == b"["
+            if self._streaming:
+                self._items = ijson.sendable_list()
+                self._parser = ijson.items_coro(self._items, "item")
+        if not self._streaming:
+            self._chunks.append(chunk)
+            return
+        self._parser.send(chunk)
+        self._consume()
+
+    def _consume(self):
+        self._records.extend(_project(item) for item in self._items if isinstance(item, dict))
+        del self._items[:]
+
+    def close(self):
+        if not self._streaming:
+            body = b"".join(self._chunks)
+            if not body.strip():
+                return dict(self.EMPTY_RESPONSE)
+            data = json.loads(body)
+            if isinstance(data, list):
+                return [_project(item) for item in data if isinstance(item, dict)]
+            return data
+        self._parser.close()
+        self._consume()
+        return self._records
+
+    @classmethod
+    def decode(cls, body: bytes):
+        decoder = cls()
+        decoder.feed(body)
+        return decoder.close()
+
+# Bounded repr for logs: never stringifies a whole large response
+_log_repr = reprlib.Repr()
+_log_repr.maxlevel = 3
+_log_repr.maxlist = 4
+_log_repr.maxdict = 6
+_log_repr.maxstring = 80
+_log_repr.maxother = 80
+
+def log_preview(data: Any, limit: int = 200) -> str:
+    text = _log_repr.repr(data)
+    return text if len(text) <= limit else text[:limit] + "..."
@@ -0,0 +1,96 @@
+"""
+Moodle REST parameter encoding (PHP bracket notation).
+
+Moodle's REST server reads arrays and structures from form keys such as
+`courses[0][id]` or `competency[shortname]`. encode_params flattens nested
+dicts/lists into that form; ArrayParam is a pre-compiled template for the
+array parameter of one wsfunction, so bulk payloads with thousands of items
+are built with cached keys in a single zip/update pass.
+"""
+from typing import Any, Dict, List, Sequence
+
+_SCALARS = (str, int, float, bytes)
+
+def _scalar(value: Any) -> Any:
+    # Moodle PARAM_BOOL expects 1/0
+    if value is True:
+        return 1
+    if value is False:
+        return 0
+    return value
+
+def _flatten(prefix: str, value: Any, out: Dict[str, Any]):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            _flatten(f"{prefix}[{key}]", item, out)
+    elif isinstance(value, (list, tuple)):
+        for i, item in enumerate(value):
+            _flatten(f"{prefix}[{i}]", item, out)
+    elif value is not None:
+        out[prefix] = _scalar(value)
+
+def encode_params(params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Flattens nested dicts/lists into bracketed keys:
+    {"competency": {"shortname": "x"}, "ids": [4, 5]} ->
+    {"competency[shortname]": "x", "ids[0]": 4, "ids[1]": 5}.
+    Already-flat keys ("courses[0][id]") pass through unchanged; None values are dropped.
+    """
+    if not params:
+        return {}
+    out: Dict[str, Any] = {}
+    for key, value in params.items():
+        if isinstance(value, _SCALARS) and not isinstance(value, bool):
+            out[key] = value
+        else:
+            _flatten(key, value, out)
+    return out
+
+class ArrayParam:
+    """
+    Compiled key template for one array parameter, e.g. sections[i][name].
+    Keys generated for index i are kept and reused by later calls, so encoding
+    n items costs one zip/update per field instead of n string formats.
+    """
+    def __init__(self, name: str, fields: Sequence[str] = ()):
+        self.name = name
+        self.fields = tuple(fields)
+        self._columns: Dict[str, List[str]] = {field: [] for field in self.fields} if self.fields else {"": []}
+
+    def _keys(self, field: str, n: int) -> List[str]:
+        keys = self._columns[field]
+        if len(keys) < n:
+            # Grow by replacement (never in place), so concurrent callers always see a consistent list
+            suffix = f"[{field}]" if field else ""
+            keys = keys + [f"{self.name}[{i}]{suffix}" for i in range(len(keys), max(n, 2 * len(keys)))]
+            self._columns[field] = keys
+        return keys
+
+    def encode(self, items: Sequence[Any], out: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Scalar items for a plain array (ids[i]); dicts for a structure array (sections[i][name])."""
+        out = {} if out is None else out
+        n = len(items)
+        if not self.fields:
+            out.update(zip(self._keys("", n), map(_scalar, items)))
+            return out
+        for field in self.fields:
+            out.update((k, _scalar(item[field])) for k, item in zip(self._keys(field, n), items) if item.get(field) is not None)
+        return out
+
+    def encode_columns(self, out: Dict[str, Any] = None, **columns: Sequence[Any]) -> Dict[str, Any]:
+        """Column-wise variant: encode_columns(name=[...]) for sections[i][name] without building dicts."""
+        out = {} if out is None else out
+        for field, values in columns.items():
+            out.update(zip(self._keys(field, len(values)), map(_scalar, values)))
+        return out
+
+# Array parameters of the bulk wsfunctions this service calls
+WS_ARRAYS: Dict[str, ArrayParam] = {
+    "core_course_create_sections": ArrayParam("courseids"),
+    "core_course_delete_sections": ArrayParam("ids"),
+    "local_sectionmanager_create_sections": ArrayParam("sections", ("name",)),
+    "core_courseformat_update_course": ArrayParam("ids"),
+}
+
+def array_param(function: str) -> ArrayParam:
+    return WS_ARRAYS[function]
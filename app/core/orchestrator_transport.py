@@ -0,0 +1,145 @@
+import importlib.util
+import threading
+import asyncio
+import time
+import requests
+import httpx
+import json
+from typing import Optional
+from contextlib import contextmanager
+from requests.adapters import HTTPAdapter
+from app.core.resilience import AIMDLimiter, CircuitBreaker, UpstreamGuard, get_upstream_guard
+from app.core.metrics import ORCHESTRATOR_SECONDS, error_status
+from app.core.tracing import span
+
+# --- SHARED TRANSPORT ---
+# One keep-alive pool per process, shared by every OrchestratorChatModel instance
+# (ai_service builds a new model per request, so the pool must not live on the instance).
+_sync_session: Optional[requests.Session] = None
+_async_client: Optional[httpx.AsyncClient] = None
+_transport_lock = threading.Lock()
+
+def transport_settings():
+    """App settings, imported lazily so this module stays importable on its own."""
+    from app.config import settings
+    return settings
+
+def get_sync_session() -> requests.Session:
+    global _sync_session
+    if _sync_session is None:
+        with _transport_lock:
+            if _sync_session is None:
+                settings = transport_settings()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=settings.orchestrator_max_connections)
+                session = requests.Session()
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _sync_session = session
+    return _sync_session
+
+def get_async_client() -> httpx.AsyncClient:
+    """
+    Shared async pool. HTTP/2 is negotiated (ALPN) when the optional 'h2' package is
+    installed, so concurrent calls multiplex over one connection; otherwise HTTP/1.1 keep-alive.
+    """
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        settings = transport_settings()
+        http2 = settings.orchestrator_http2 and importlib.util.find_spec("h2") is not None
+        _async_client = httpx.AsyncClient(
+            http2=http2,
+            timeout=settings.orchestrator_timeout,
+            limits=httpx.Limits(
+                max_connections=settings.orchestrator_max_connections,
+                max_keepalive_connections=settings.orchestrator_max_connections
+            )
+        )
+    return _async_client
+
+def is_orchestrator_failure(e: BaseException) -> bool:
+    """Transport errors and 5xx count against the orchestrator; 4xx (bad payload) do not."""
+    status = getattr(getattr(e, "response", None), "status_code", None)
+    if status is not None:
+        return status >= 500
+    return isinstance(e, (requests.RequestException, httpx.TransportError))
+
+def get_orchestrator_guard() -> UpstreamGuard:
+    settings = transport_settings()
+    return get_upstream_guard("orchestrator", lambda: UpstreamGuard(
+        "orchestrator",
+        AIMDLimiter(
+            "orchestrator",
+            initial=settings.orchestrator_limit_initial,
+            min_limit=settings.orchestrator_limit_min,
+            max_limit=settings.orchestrator_limit_max,
+            latency_threshold=settings.orchestrator_limit_latency_threshold,
+            backoff=settings.limit_backoff,
+            queue_timeout=settings.orchestrator_limit_queue_timeout
+        ),
+        CircuitBreaker(
+            error_threshold=settings.breaker_error_threshold,
+            min_requests=settings.breaker_min_requests,
+            window=settings.breaker_window,
+            open_seconds=settings.breaker_open_seconds,
+            half_open_max=settings.breaker_half_open_max
+        ),
+        is_failure=is_orchestrator_failure
+    ))
+
+def parse_stream_line(line: str) -> Optional[str]:
+    """
+    Extracts the text delta from one line of a streamed /execute response.
+    Accepts SSE ("data: {...}") and NDJSON lines; the delta is read from
+    'delta', 'content' or 'response'. Returns None for keep-alives, event
+    names, comments and the "[DONE]" terminator.
+    """
+    line = line.strip()
+    if not line or line.startswith(":") or line.startswith("event:") or line.startswith("id:"):
+        return None
+    if line.startswith("data:"):
+        line = line[5:].strip()
+    if not line or line == "[DONE]":
+        return None
+    try:
+        obj = json.loads(line)
+    except ValueError:
+        return line
+    if isinstance(obj, dict):
+        return obj.get("delta") or obj.get("content") or obj.get("response") or None
+    return obj if isinstance(obj, str) else None
+
+def is_streamed(content_type: str) -> bool:
+    """True when the orchestrator answered with an SSE / NDJSON stream rather than one JSON body."""
+    return "text/event-stream" in content_type or "ndjson" in content_type
+
+@contextmanager
+def observe_call(mode: str):
+    """
+    Times one /execute call (a whole stream, for streaming modes) into
+    ORCHESTRATOR_SECONDS and an orchestrator.<mode> span. The block sets
+    outcome["status"] from the response; an error records its HTTP status or
+    class, an abandoned stream "cancelled".
+    """
+    start = time.perf_counter()
+    outcome = {"status": "unknown"}
+    with span(f"orchestrator.{mode}") as current:
+        try:
+            yield outcome
+        except (GeneratorExit, asyncio.CancelledError):
+            outcome["status"] = "cancelled"
+            raise
+        except BaseException as e:
+            outcome["status"] = error_status(e)
+            raise
+        finally:
+            ORCHESTRATOR_SECONDS.observe(time.perf_counter() - start, mode, outcome["status"])
+            current.set_attribute("http.status_code", outcome["status"])
+
+async def close_transports():
+    global _sync_session, _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+    if _sync_session is not None:
+        _sync_session.close()
+        _sync_session = None
@@ -0,0 +1,52 @@
+import time
+import hashlib
+import threading
+from typing import Dict, Optional
+
+class GCRALimiter:
+    """
+    Generic cell rate algorithm (equivalent to a token bucket of `burst` tokens
+    refilled at `rate` per second), one stored float per key: the key's
+    theoretical arrival time (TAT). Each check is O(1).
+    Keys whose TAT is in the past hold no state worth keeping and are pruned
+    once the table grows past max_keys.
+    """
+    def __init__(self, name: str, rate: float, burst: int, max_keys: int = 100_000):
+        self.name = name
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.interval = 1.0 / rate
+        self.max_keys = max_keys
+        self.limited = 0
+        self._tat: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def check(self, key: str) -> Optional[float]:
+        """Admits one request for key. Returns None when allowed, else seconds until it would be."""
+        now = time.monotonic()
+        with self._lock:
+            tat = max(self._tat.get(key, now), now)
+            new_tat = tat + self.interval
+            allow_at = new_tat - self.burst * self.interval
+            if now < allow_at:
+                self.limited += 1
+                return allow_at - now
+            self._tat[key] = new_tat
+            if len(self._tat) > self.max_keys:
+                self._prune(now)
+        return None
+
+    def _prune(self, now: float):
+        self._tat = {k: t for k, t in self._tat.items() if t > now}
+        if len(self._tat) > self.max_keys:
+            # Every key is mid-burst: keep the busiest half (latest TAT)
+            keep = sorted(self._tat.items(), key=lambda kv: kv[1])[len(self._tat) // 2:]
+            self._tat = dict(keep)
+
+    def state(self) -> dict:
+        with self._lock:
+            return {"rate": self.rate, "burst": self.burst, "tracked_keys": len(self._tat), "limited": self.limited}
+
+def token_key(token: str) -> str:
+    """Rate-limit key for a Moodle token; the raw token is never stored."""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()[:16]
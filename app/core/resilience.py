@@ -0,0 +1,311 @@
+import time
+import asyncio
+import threading
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+class ResilienceException(Exception):
+    def __init__(self, message: str, code: str):
+        self.message = message
+        self.code = code
+        super().__init__(self.message)
+
+class CircuitOpenError(ResilienceException):
+    def __init__(self, name: str, retry_in: float):
+        self.retry_in = retry_in
+        super().__init__(f"Circuit open for {name} (retry in {retry_in:.1f}s)", "CIRCUIT_OPEN")
+
+class LimiterRejectedError(ResilienceException):
+    def __init__(self, name: str, limit: int):
+        super().__init__(f"Concurrency limit reached for {name} (limit {limit})", "CONCURRENCY_LIMITED")
+
+class _Waiter:
+    __slots__ = ("event", "loop", "future", "granted")
+
+    def __init__(self, event=None, loop=None, future=None):
+        self.event = event
+        self.loop = loop
+        self.future = future
+        self.granted = False
+
+    def wake(self):
+        if self.event is not None:
+            self.event.set()
+        elif not self.future.done():
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+class AIMDLimiter:
+    """
+    Adaptive concurrency limit (additive increase / multiplicative decrease).
+    Each fast success grows the limit by ~1 per limit-sized window; a call slower
+    than latency_threshold, or a failure, multiplies it by backoff. Callers over
+    the limit wait up to queue_timeout, then are rejected (fail fast instead of
+    piling up threads). Usable from worker threads and the event loop at once.
+    """
+    def __init__(self, name: str = "upstream", initial: int = 16, min_limit: int = 1, max_limit: int = 64,
+                 latency_threshold: float = 2.0, backoff: float = 0.7, queue_timeout: float = 5.0):
+        self.name = name
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_threshold = latency_threshold
+        self.backoff = backoff
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.rejected = 0
+        self._waiters: deque = deque()
+        self._lock = threading.Lock()
+
+    def _try_acquire_locked(self) -> bool:
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            return True
+        return False
+
+    def acquire(self, timeout: float = None):
+        timeout = self.queue_timeout if timeout is None else timeout
+        with self._lock:
+            if self._try_acquire_locked():
+                return
+            waiter = _Waiter(event=threading.Event())
+            self._waiters.append(waiter)
+        waiter.event.wait(timeout)
+        self._settle(waiter)
+
+    async def aacquire(self, timeout: float = None):
+        timeout = self.queue_timeout if timeout is None else timeout
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._try_acquire_locked():
+                return
+            waiter = _Waiter(loop=loop, future=loop.create_future())
+            self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            with self._lock:
+                granted = waiter.granted
+                if not granted:
+                    self._waiters.remove(waiter)
+            if granted:
+                self.release()
+            raise
+        self._settle(waiter)
+
+    def _settle(self, waiter: _Waiter):
+        with self._lock:
+            if waiter.granted:
+                return
+            self._waiters.remove(waiter)
+            self.rejected += 1
+            limit = int(self.limit)
+        raise LimiterRejectedError(self.name, limit)
+
+    def release(self, latency: Optional[float] = None, failed: bool = False):
+        with self._lock:
+            self.in_flight -= 1
+            if failed or (latency is not None and latency > self.latency_threshold):
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+            elif latency is not None:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            to_wake = []
+            while self._waiters and self.in_flight < int(self.limit):
+                waiter = self._waiters.popleft()
+                waiter.granted = True
+                self.in_flight += 1
+                to_wake.append(waiter)
+        for waiter in to_wake:
+            waiter.wake()
+
+    def state(self) -> dict:
+        with self._lock:
+            return {
+                "limit": int(self.limit),
+                "limit_exact": round(self.limit, 3),
+                "min_limit": self.min_limit,
+                "max_limit": self.max_limit,
+                "in_flight": self.in_flight,
+                "queued": len(self._waiters),
+                "rejected": self.rejected,
+                "latency_threshold": self.latency_threshold
+            }
+
+class CircuitBreaker:
+    """
+    Error-rate circuit breaker over a sliding time window.
+    CLOSED -> OPEN once at least min_requests were seen in `window` seconds and the
+    failure ratio reaches error_threshold. OPEN fails fast for open_seconds, then
+    HALF_OPEN lets half_open_max probes through: a success closes, a failure re-opens.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, error_threshold: float = 0.5, min_requests: int = 20, window: float = 30.0,
+                 open_seconds: float = 15.0, half_open_max: int = 1):
+        self.error_threshold = error_threshold
+        self.min_requests = min_requests
+        self.window = window
+        self.open_seconds = open_seconds
+        self.half_open_max = half_open_max
+        self.state_name = self.CLOSED
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._probes = 0
+        self._outcomes: deque = deque()   # (timestamp, failed)
+        self._failures = 0
+        self._lock = threading.Lock()
+
+    def _trim(self, now: float):
+        while self._outcomes and now - self._outcomes[0][0] > self.window:
+            _, failed = self._outcomes.popleft()
+            self._failures -= failed
+
+    def before_call(self, name: str):
+        now = time.monotonic()
+        with self._lock:
+            if self.state_name == self.OPEN:
+                remaining = self.open_seconds - (now - self.opened_at)
+                if remaining > 0:
+                    raise CircuitOpenError(name, remaining)
+                self.state_name = self.HALF_OPEN
+                self._probes = 0
+            if self.state_name == self.HALF_OPEN:
+                if self._probes >= self.half_open_max:
+                    raise CircuitOpenError(name, 0.0)
+                self._probes += 1
+
+    def record(self, failed: bool):
+        now = time.monotonic()
+        with self._lock:
+            if self.state_name == self.HALF_OPEN:
+                self._probes = max(0, self._probes - 1)
+                if failed:
+                    self._open(now)
+                else:
+                    self.state_name = self.CLOSED
+                    self._outcomes.clear()
+                    self._failures = 0
+                return
+
+            self._outcomes.append((now, failed))
+            self._failures += failed
+            self._trim(now)
+            total = len(self._outcomes)
+            if self.state_name == self.CLOSED and total >= self.min_requests and self._failures / total >= self.error_threshold:
+                self._open(now)
+
+    def abandon(self):
+        """A call admitted by before_call ended without an outcome (rejected/cancelled)."""
+        with self._lock:
+            if self.state_name == self.HALF_OPEN:
+                self._probes = max(0, self._probes - 1)
+
+    def _open(self, now: float):
+        self.state_name = self.OPEN
+        self.opened_at = now
+        self.times_opened += 1
+
+    def state(self) -> dict:
+        with self._lock:
+            self._trim(time.monotonic())
+            total = len(self._outcomes)
+            return {
+                "state": self.state_name,
+                "window_requests": total,
+                "window_failures": self._failures,
+                "error_rate": round(self._failures / total, 4) if total else 0.0,
+                "error_threshold": self.error_threshold,
+                "times_opened": self.times_opened
+            }
+
+class UpstreamGuard:
+    """
+    Concurrency limiter + circuit breaker in front of one upstream host.
+    `is_failure(exc)` decides which exceptions count against the host
+    (transport errors, 5xx) versus application errors that prove it is alive.
+    """
+    def __init__(self, name: str, limiter: AIMDLimiter, breaker: CircuitBreaker,
+                 is_failure: Callable[[BaseException], bool] = lambda e: True):
+        self.name = name
+        self.limiter = limiter
+        self.breaker = breaker
+        self.is_failure = is_failure
+
+    @contextmanager
+    def slot(self):
+        """Holds one limiter slot for the duration of the block (e.g. a streamed response)."""
+        self.breaker.before_call(self.name)
+        try:
+            self.limiter.acquire()
+        except LimiterRejectedError:
+            self.breaker.abandon()
+            raise
+        start = time.monotonic()
+        failed = False
+        try:
+            yield
+        except BaseException as e:
+            failed = self.is_failure(e)
+            raise
+        finally:
+            self.limiter.release(time.monotonic() - start, failed)
+            self.breaker.record(failed)
+
+    @asynccontextmanager
+    async def aslot(self):
+        self.breaker.before_call(self.name)
+        try:
+            await self.limiter.aacquire()
+        except (LimiterRejectedError, asyncio.CancelledError):
+            self.breaker.abandon()
+            raise
+        start = time.monotonic()
+        try:
+            yield
+        except (asyncio.CancelledError, GeneratorExit):
+            # Caller went away: neither a latency sample nor a host failure
+            self.limiter.release()
+            self.breaker.abandon()
+            raise
+        except BaseException as e:
+            failed = self.is_failure(e)
+            self.limiter.release(time.monotonic() - start, failed)
+            self.breaker.record(failed)
+            raise
+        self.limiter.release(time.monotonic() - start, False)
+        self.breaker.record(False)
+
+    def call(self, fn: Callable[[], Any]) -> Any:
+        with self.slot():
+            return fn()
+
+    async def acall(self, fn: Callable[[], Awaitable[Any]]) -> Any:
+        async with self.aslot():
+            return await fn()
+
+    def state(self) -> dict:
+        return {"limiter": self.limiter.state(), "breaker": self.breaker.state()}
+
+_guards: Dict[str, UpstreamGuard] = {}
+_guards_lock = threading.Lock()
+
+def get_upstream_guard(name: str, factory: Callable[[], UpstreamGuard]) -> UpstreamGuard:
+    """Process-wide registry: one guard per upstream name (e.g. Moodle host)."""
+    guard = _guards.get(name)
+    if guard is None:
+        with _guards_lock:
+            guard = _guards.get(name)
+            if guard is None:
+                guard = _guards[name] = factory()
+    return guard
+
+def resilience_state() -> dict:
+    return {name: guard.state() for name, guard in list(_guards.items())}
@@ -0,0 +1,281 @@
+"""
+Lightweight request tracing.
+
+`span(name, **attributes)` times a block as a child of the current span
+(tracked in a contextvar, so asyncio tasks started inside a span inherit it).
+TracingMiddleware opens one root span per HTTP request; requests carrying the
+same X-Execution-ID share a trace id, so every step of an execution lands in
+one trace. Finished spans go on an in-memory queue and a background thread
+batches them to the exporters: a JSON-lines file and/or an OTLP/HTTP (JSON)
+collector. With tracing disabled span() is a no-op.
+"""
+import os
+import json
+import time
+import queue
+import atexit
+import hashlib
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+import requests
+from app.core.log import get_logger
+
+log = get_logger("tracing")
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent", "start_ns", "end_ns", "attributes", "status", "phases")
+
+    def __init__(self, name: str, trace_id: str, parent: "Span" = None, attributes: dict = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent = parent
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes or {}
+        self.status = "ok"
+        # Root spans only: total ms per direct child name (Server-Timing)
+        self.phases: Optional[Dict[str, float]] = {} if parent is None else None
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end - self.start_ns) / 1e6
+
+    def finish(self):
+        self.end_ns = time.time_ns()
+        parent = self.parent
+        if parent is not None and parent.phases is not None and parent.end_ns is None:
+            parent.phases[self.name] = parent.phases.get(self.name, 0.0) + self.duration_ms
+        _processor.enqueue(self)
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent.span_id if self.parent is not None else None,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "status": self.status,
+            "attributes": self.attributes
+        }
+
+class _NoopSpan:
+    """Returned by span() while tracing is disabled."""
+    phases = None
+
+    def set_attribute(self, key: str, value):
+        pass
+
+_NOOP = _NoopSpan()
+
+def trace_id_for(execution_id: Optional[str]) -> str:
+    """Stable 128-bit trace id per execution id (random when there is none)."""
+    if execution_id:
+        return hashlib.md5(execution_id.encode("utf-8")).hexdigest()
+    return os.urandom(16).hex()
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+def start_root(name: str, execution_id: Optional[str] = None, **attributes):
+    """Starts a request's root span and makes it current. Returns None while disabled."""
+    if not _processor.enabled:
+        return None
+    if execution_id:
+        attributes["execution.id"] = execution_id
+    root = Span(name, trace_id_for(execution_id), attributes=attributes)
+    _current_span.set(root)
+    return root
+
+def tag_execution(execution_id: Optional[str]):
+    """
+    Attaches an execution id found after the root span started (request body or
+    query string). Called before any child span exists, so the trace id can
+    still be switched to the execution's.
+    """
+    root = _current_span.get()
+    if root is None or not execution_id or root.parent is not None or "execution.id" in root.attributes:
+        return
+    root.attributes["execution.id"] = execution_id
+    root.trace_id = trace_id_for(execution_id)
+
+def finish_root(root: Span):
+    """Ends a root span started by start_root and clears the current span."""
+    _current_span.set(None)
+    root.finish()
+
+@contextmanager
+def span(name: str, **attributes):
+    """Times the block as a child of the current span; errors mark it failed and propagate."""
+    parent = _current_span.get()
+    if not _processor.enabled or parent is None:
+        yield _NOOP
+        return
+
+    current = Span(name, parent.trace_id, parent, attributes)
+    _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.status = "error"
+        current.attributes["error"] = str(e) or e.__class__.__name__
+        raise
+    finally:
+        # set() rather than reset(token): async generators may resume in another context
+        _current_span.set(parent)
+        current.finish()
+
+def server_timing(root: Optional[Span]) -> Optional[str]:
+    """Server-Timing header value: one entry per phase so far, plus the elapsed total."""
+    if root is None or root.phases is None:
+        return None
+    entries = [f"{name.replace(' ', '_')};dur={ms:.1f}" for name, ms in root.phases.items()]
+    entries.append(f"total;dur={root.duration_ms:.1f}")
+    return ", ".join(entries)
+
+# --- EXPORT ---
+
+class FileSpanExporter:
+    """Appends one JSON line per span."""
+    def __init__(self, path: str):
+        self.path = path
+
+    def export(self, spans: List[Span]):
+        with open(self.path, "a", encoding="utf-8") as f:
+            for s in spans:
+                f.write(json.dumps(s.to_dict(), ensure_ascii=False, default=str) + "\n")
+
+class OTLPHttpExporter:
+    """POSTs spans to an OTLP/HTTP collector ({endpoint}/v1/traces) using the JSON encoding."""
+    def __init__(self, endpoint: str, service_name: str, timeout: float = 5.0):
+        self.url = endpoint.rstrip("/") + ("" if endpoint.rstrip("/").endswith("/v1/traces") else "/v1/traces")
+        self.service_name = service_name
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    @staticmethod
+    def _value(value) -> dict:
+        if isinstance(value, bool):
+            return {"boolValue": value}
+        if isinstance(value, int):
+            return {"intValue": str(value)}
+        if isinstance(value, float):
+            return {"doubleValue": value}
+        return {"stringValue": str(value)}
+
+    def _span(self, s: Span) -> dict:
+        entry = {
+            "traceId": s.trace_id,
+            "spanId": s.span_id,
+            "name": s.name,
+            "kind": 2 if s.parent is None else 1,  # SERVER for request roots, INTERNAL otherwise
+            "startTimeUnixNano": str(s.start_ns),
+            "endTimeUnixNano": str(s.end_ns),
+            "attributes": [{"key": k, "value": self._value(v)} for k, v in s.attributes.items()],
+            "status": {"code": 2 if s.status == "error" else 1}
+        }
+        if s.parent is not None:
+            entry["parentSpanId"] = s.parent.span_id
+        return entry
+
+    def export(self, spans: List[Span]):
+        body = {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+            "scopeSpans": [{"scope": {"name": "app.core.tracing"}, "spans": [self._span(s) for s in spans]}]
+        }]}
+        response = self.session.post(self.url, json=body, timeout=self.timeout)
+        response.raise_for_status()
+
+class _BatchProcessor:
+    """Queues finished spans; a daemon thread exports them in batches off the request path."""
+    def __init__(self, max_batch: int = 256, interval: float = 1.0, max_queue: int = 10000):
+        self.enabled = False
+        self.exporters: list = []
+        self.max_batch = max_batch
+        self.interval = interval
+        self.max_queue = max_queue
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def enqueue(self, s: Span):
+        if not self.exporters:
+            return
+        try:
+            self._queue.put_nowait(s)
+        except queue.Full:
+            # Exporters fell behind: shed spans rather than grow without bound
+            self.dropped += 1
+
+    def start(self):
+        if self._thread is None and self.exporters:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join(timeout=10)
+            self._thread = None
+        self._flush()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._flush()
+
+    def _flush(self):
+        while True:
+            batch = []
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return
+            for exporter in self.exporters:
+                try:
+                    exporter.export(batch)
+                except Exception as e:
+                    log.warning(f"{exporter.__class__.__name__} failed for {len(batch)} spans: {e}")
+
+    def state(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "exporters": [e.__class__.__name__ for e in self.exporters],
+            "queued": self._queue.qsize(),
+            "dropped": self.dropped
+        }
+
+_processor = _BatchProcessor()
+
+def setup_tracing(enabled: bool, file_path: str = None, otlp_endpoint: str = None, service_name: str = "keduka-api-syllabus"):
+    """Configures the exporters and starts the export thread (idempotent)."""
+    _processor.enabled = enabled
+    if not enabled or _processor.exporters:
+        return
+    if file_path:
+        _processor.exporters.append(FileSpanExporter(file_path))
+    if otlp_endpoint:
+        _processor.exporters.append(OTLPHttpExporter(otlp_endpoint, service_name))
+    _processor.start()
+    atexit.register(shutdown_tracing)
+
+def shutdown_tracing():
+    """Exports the spans still queued and stops the export thread."""
+    _processor.stop()
+
+def tracing_state() -> dict:
+    return _processor.state()
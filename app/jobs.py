@@ -0,0 +1,165 @@
+import time
+import uuid
+import asyncio
+import contextvars
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from app.core.log import get_logger
+from app.core.tracing import span
+
+log = get_logger("jobs")
+
+class JobQueueFullError(Exception):
+    pass
+
+class Job:
+    """
+    One background pipeline run. Steps are recorded with timings so callers
+    polling GET .../jobs/{id} can see where time went and which step failed.
+    """
+    def __init__(self, kind: str, params: dict = None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params or {}
+        self.status = "queued"          # queued | running | succeeded | failed
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.steps: List[dict] = []
+        self.result: Any = None
+        self.error: Optional[str] = None
+        # Submitter's context (log correlation ids, trace span); the job's task runs in a copy of it
+        self.context = contextvars.copy_context()
+
+    @asynccontextmanager
+    async def step(self, name: str):
+        """Records a named step (and a trace span); an exception marks the step (and job) failed and propagates."""
+        entry = {"name": name, "status": "running", "started_at": time.time(), "duration_ms": None}
+        self.steps.append(entry)
+        start = time.monotonic()
+        with span(name, job_id=self.id):
+            try:
+                yield entry
+            except BaseException as e:
+                entry["status"] = "failed"
+                entry["error"] = str(e) or e.__class__.__name__
+                raise
+            else:
+                if entry["status"] == "running":
+                    entry["status"] = "succeeded"
+            finally:
+                entry["duration_ms"] = round((time.monotonic() - start) * 1000, 1)
+
+    def to_dict(self) -> dict:
+        now = time.time()
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "params": self.params,
+            "timings": {
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "queued_ms": round(((self.started_at or now) - self.created_at) * 1000, 1),
+                "run_ms": round(((self.finished_at or now) - self.started_at) * 1000, 1) if self.started_at else None
+            },
+            "steps": self.steps,
+            "result": self.result,
+            "error": self.error
+        }
+
+class JobManager:
+    """
+    Bounded asyncio worker pool for background jobs.
+    `workers` jobs run at once; up to `queue_size` wait. Finished jobs are kept
+    for `ttl` seconds (and at most `max_jobs`) so their status can be polled.
+    Jobs and their state live in this process only: run a single worker process
+    (or route polls back to the submitting process), otherwise a poll can 404.
+    """
+    def __init__(self, workers: int = 4, queue_size: int = 100, ttl: float = 3600.0, max_jobs: int = 1000):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.ttl = ttl
+        self.max_jobs = max_jobs
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self):
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+
+    def submit(self, kind: str, fn: Callable[[Job], Awaitable[Any]], params: dict = None) -> Job:
+        """Queues fn(job); its return value becomes job.result. Raises JobQueueFullError when saturated."""
+        self.start()
+        self._prune()
+        job = Job(kind, params)
+        try:
+            self._queue.put_nowait((job, fn))
+        except asyncio.QueueFull:
+            raise JobQueueFullError(f"Job queue full ({self.queue_size} pending)")
+        self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    async def _worker(self, index: int):
+        while True:
+            job, fn = await self._queue.get()
+            try:
+                # Own task per job, created inside the submitter's context: the task runs in
+                # a copy of it, so one job's correlation ids and spans never reach the next
+                await job.context.run(asyncio.ensure_future, self._run(job, fn))
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: Job, fn: Callable[[Job], Awaitable[Any]]):
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            job.result = await fn(job)
+            job.status = "failed" if any(s["status"] == "failed" for s in job.steps) else "succeeded"
+        except asyncio.CancelledError:
+            job.status = "failed"
+            job.error = "cancelled"
+            raise
+        except Exception as e:
+            log.error(f"Job {job.id} ({job.kind}) failed: {e}", extra={"data": {"job_id": job.id}})
+            job.status = "failed"
+            job.error = str(e) or e.__class__.__name__
+        finally:
+            job.finished_at = time.time()
+
+    def _prune(self):
+        now = time.time()
+        for job_id in list(self._jobs.keys()):
+            job = self._jobs[job_id]
+            expired = job.finished_at is not None and now - job.finished_at > self.ttl
+            if expired or (len(self._jobs) > self.max_jobs and job.finished_at is not None):
+                del self._jobs[job_id]
+            elif len(self._jobs) <= self.max_jobs:
+                break
+
+    def stats(self) -> dict:
+        counts: Dict[str, int] = {}
+        for job in self._jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "pending": self._queue.qsize() if self._queue else 0,
+            "tracked": len(self._jobs),
+            "by_status": counts
+        }
@@ -1,57 +1,109 @@
-from fastapi import FastAPI, HTTPException, Header, Depends
-from typing import Optional
-from .schemas import CourseRequest, ProgramResponse, CreateSectionRequest, DeleteSectionRequest, CreateBulkSectionsRequest
-from .moodle_client import call_moodle, create_moodle_section, delete_course_sections, update_section
-from .ai_service import generate_syllabus_ai
-from .middleware.execution_guard import execution_guard
+import asyncio
+import inspect
+import json
+import time
+from fastapi import FastAPI, HTTPException, Header, Depends, Query
+from fastapi.encoders import jsonable_encoder
+from typing import Callable, Optional
+from .schemas import CourseRequest, BatchCourseRequest, ProgramResponse, CreateSectionRequest, DeleteSectionRequest, CreateBulkSectionsRequest, SectionPlan, SectionOperation
+from .section_planner import plan_section_sync
+from .config import settings, parameters
+from .moodle_client import get_pool_stats, get_cache_stats, get_moodle_client, map_created_sections, read_cache
+from .async_moodle_client import call_moodle, create_moodle_section, create_moodle_sections, show_sections, delete_course_sections, update_section, update_section_name, move_section_after, get_course_sections, close_async_moodle_client
+from . import async_moodle_client
+from .ai_service import agenerate_syllabus_ai, astream_syllabus_ai, syllabus_cache, warmup
+from .core.orchestrator_transport import close_transports
+from .core.resilience import resilience_state, ResilienceException, CircuitOpenError
+from .middleware.execution_guard import execution_guard, rate_limit_state
+from .middleware.body_limit import BodySizeLimitMiddleware
+from .middleware.request_context import RequestContextMiddleware
+from .middleware.metrics import MetricsMiddleware
+from .core.metrics import REGISTRY
+from .core.tracing import span, setup_tracing, shutdown_tracing, tracing_state
+from .middleware.tracing import TracingMiddleware
+from .core.log import get_logger, setup_logging, shutdown_logging
+from .core.execution_context import ExecutionContext
+from .jobs import Job, JobManager, JobQueueFullError
 
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, JSONResponse, StreamingResponse, PlainTextResponse
+
+setup_logging(settings.log_level, settings.log_format, settings.log_sample_rates)
+setup_tracing(settings.tracing_enabled, settings.tracing_file, settings.tracing_otlp_endpoint)
+log = get_logger("ai_service")
 
 app = FastAPI(
     title="Course Program API"
 )
+app.add_middleware(BodySizeLimitMiddleware, max_bytes=settings.max_request_body_bytes)
+app.add_middleware(TracingMiddleware, server_timing=settings.tracing_server_timing)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(RequestContextMiddleware)
+
+job_manager = JobManager(
+    workers=settings.jobs_workers,
+    queue_size=settings.jobs_queue_size,
+    ttl=settings.jobs_ttl,
+    max_jobs=settings.jobs_max_tracked
+)
+
+@app.on_event("startup")
+async def start_job_workers():
+    job_manager.start()
+    if settings.ssm_enabled:
+        # Disk cache + SSM refresh thread; the first fetch is awaited here (in a
+        # worker thread, at most ssm_initial_wait) so requests never wait on AWS
+        loaded = await asyncio.get_running_loop().run_in_executor(None, parameters.wait_loaded, settings.ssm_initial_wait)
+        if not loaded:
+            log.warning(f"SSM parameters not loaded after {settings.ssm_initial_wait}s; serving defaults until the refresh lands")
+    if settings.warmup_on_startup:
+        # Heavy imports (LangChain) in a worker thread: startup does not wait for them
+        asyncio.get_running_loop().run_in_executor(None, warmup)
+
+@app.on_event("shutdown")
+async def close_moodle_pool():
+    await job_manager.stop()
+    parameters.stop()
+    get_moodle_client().close()
+    await close_async_moodle_client()
+    await close_transports()
+    shutdown_tracing()
+    shutdown_logging()
+
+@app.exception_handler(ResilienceException)
+async def upstream_unavailable_handler(request, exc: ResilienceException):
+    # Limiter/breaker rejections are load shedding, not server bugs: 503 + Retry-After
+    retry_after = max(1, int(getattr(exc, "retry_in", 1) or 1)) if isinstance(exc, CircuitOpenError) else 1
+    return JSONResponse(
+        status_code=503,
+        content={"detail": {"error": "Upstream Unavailable", "code": exc.code, "message": exc.message}},
+        headers={"Retry-After": str(retry_after)}
+    )
 
 @app.get("/", include_in_schema=False)
 async def root():
     return RedirectResponse(url="/docs")
 
 @app.post("/api/course/program/sections/create")
-def create_section_endpoint(data: CreateSectionRequest, x_moodle_token: Optional[str] = Header(None, alias="X-Moodle-Token")):
+async def create_section_endpoint(data: CreateSectionRequest, x_moodle_token: Optional[str] = Header(None, alias="X-Moodle-Token")):
     try:
-        result = create_moodle_section(data.course_id, data.name, token=x_moodle_token)
+        result = await create_moodle_section(data.course_id, data.name, token=x_moodle_token)
         # Ensure it is visible - Moodle sometimes defaults to hidden for new sections?
         # result is likely a list: [{"id": 123, "name": "..."}]
         if isinstance(result, list) and len(result) > 0 and "id" in result[0]:
              sec_id = result[0]["id"]
              # Force show
-             update_section(sec_id, data.name, visible=1, token=x_moodle_token)
+             await update_section(sec_id, data.name, visible=1, token=x_moodle_token)
 
         return {"status": "success", "data": result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/course/program/sections/create/batch")
-def create_bulk_sections_endpoint(data: CreateBulkSectionsRequest, x_moodle_token: Optional[str] = Header(None, alias="X-Moodle-Token")):
-    results = []
-    errors = []
+async def create_bulk_sections_endpoint(data: CreateBulkSectionsRequest, x_moodle_token: Optional[str] = Header(None, alias="X-Moodle-Token")):
     try:
-        print(f"[AI SERVICE] Bulk creating {len(data.names)} sections for course {data.course_id}")
-        for name in data.names:
-            try:
-                # 1. Create
-                res = create_moodle_section(data.course_id, name, token=x_moodle_token)
-                
-                # 2. Force Visible
-                if isinstance(res, list) and len(res) > 0 and "id" in res[0]:
-                    sec_id = res[0]["id"]
-                    update_section(sec_id, name, visible=1, token=x_moodle_token)
-                    results.append({"name": name, "id": sec_id, "status": "created"})
-                else:
-                    results.append({"name": name, "status": "error", "detail": "No ID returned"})
-            except Exception as inner_e:
-                print(f"[AI SERVICE] Error creating section '{name}': {inner_e}")
-                errors.append({"name": name, "error": str(inner_e)})
-                
+        log.info(f"Bulk creating {len(data.names)} sections for course {data.course_id}")
+        results, errors = await create_visible_sections(data.course_id, data.names, token=x_moodle_token)
+
         return {
             "status": "success", 
             "created_count": len(results),
@@ -61,29 +113,60 @@ def create_bulk_sections_endpoint(data: CreateBulkSectionsRequest, x_moodle_toke
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/api/course/program/sections/delete")
-def delete_sections_endpoint(data: DeleteSectionRequest, x_moodle_token: Optional[str] = Header(None, alias="X-Moodle-Token")):
+async def create_visible_sections(course_id: int, names: list[str], token: str = None):
+    """
+    Creates all sections in one plugin call, then shows them in one bulk call.
+    Returns (results, errors), each in input order. Every error carries the
+    step that failed ("create" or "show"): a section whose show failed was still created.
+    """
+    results = []
+    errors = []
+    if not names:
+        return results, errors
+
     try:
-        # Assuming delete_course_sections returns something useful or throws
-        result = delete_course_sections(data.section_ids, token=x_moodle_token)
-        return {"status": "success", "data": result}
+        # 1. Create (single request)
+        created = map_created_sections(names, await create_moodle_sections(course_id, names, token=token))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        log.warning(f"Error creating sections {names}: {e}")
+        return results, [{"name": name, "op": "create", "error": str(e)} for name in names]
 
-@app.post("/api/course/programa", response_model=ProgramResponse, dependencies=[Depends(execution_guard)])
-def gerar_programa(data: CourseRequest, x_moodle_token: Optional[str] = Header(None, alias="X-Moodle-Token"), x_execution_id: Optional[str] = Header(None, alias="X-Execution-ID")):
+    # 2. Force Visible (single request)
+    new_ids = [c["id"] for c in created if c]
+    show_error = None
+    if new_ids:
+        try:
+            await show_sections(course_id, new_ids, token=token)
+        except Exception as e:
+            log.warning(f"Error showing sections {new_ids}: {e}")
+            show_error = str(e)
+
+    for name, section in zip(names, created):
+        if not section:
+            results.append({"name": name, "status": "error", "detail": "No ID returned"})
+            continue
+        results.append({"name": name, "id": section["id"], "status": "created"})
+        if show_error:
+            errors.append({"name": name, "id": section["id"], "op": "show", "error": show_error})
 
-    # 1. Dados do curso
+    return results, errors
+
+@app.post("/api/course/program/sections/delete")
+async def delete_sections_endpoint(data: DeleteSectionRequest, x_moodle_token: Optional[str] = Header(None, alias="X-Moodle-Token")):
     try:
-        # 1. Dados do curso
-        course = call_moodle(
-            "core_course_get_courses",
-            {"options[ids][0]": data.course_id},
-            token=x_moodle_token
-        )
+        # Assuming delete_course_sections returns something useful or throws
+        result = await delete_course_sections(data.section_ids, token=x_moodle_token)
+        return {"status": "success", "data": result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def _validate_course(course) -> dict:
+    """Maps the core_course_get_courses result (or the exception it raised) to course_data."""
+    if isinstance(course, ResilienceException):
+        raise course
+    if isinstance(course, BaseException):
+        raise HTTPException(status_code=500, detail=str(course))
+
     if not course or (isinstance(course, list) and len(course) == 0):
         # Fallback debug info or 404
         raise HTTPException(404, "Curso não encontrado (Resposta vazia do Moodle)")
@@ -93,14 +176,41 @@ def gerar_programa(data: CourseRequest, x_moodle_token: Optional[str] = Header(N
          # If Moodle returns a single object implies error was missed or structure changed
          raise HTTPException(500, f"Formato de resposta inesperado do Moodle: {course}")
 
-    course_data = course[0]
+    return course[0]
 
-    # 2. Competências do curso
-    competencies = call_moodle(
-        "core_competency_list_course_competencies",
-        {"id": data.course_id},
-        token=x_moodle_token
-    )
+async def load_course_inputs(course_id: int, token: str = None):
+    """
+    Reads everything the pipeline needs from Moodle.
+    Returns (course_data, competencies, formatted_competencies, sections_task); the
+    sections task is a prefetch of core_course_get_contents for apply_syllabus_structure.
+    """
+    # Prefetch current sections now: they are only needed by apply_syllabus_structure,
+    # but do not depend on the course/competency reads or on the LLM result.
+    sections_task = asyncio.create_task(get_course_sections(course_id, token=token))
+
+    try:
+        # 1. Dados do curso + 2. Competências do curso (concurrent reads)
+        course_result, competencies = await asyncio.gather(
+            call_moodle(
+                "core_course_get_courses",
+                {"options[ids][0]": course_id},
+                token=token
+            ),
+            call_moodle(
+                "core_competency_list_course_competencies",
+                {"id": course_id},
+                token=token
+            ),
+            return_exceptions=True
+        )
+        course_data = _validate_course(course_result)
+        if isinstance(competencies, BaseException):
+            raise competencies
+    except BaseException:
+        sections_task.cancel()
+        # Retrieve the prefetch outcome so a failed task does not log "exception never retrieved"
+        sections_task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        raise
 
     # Formatting competencies for response
     formatted_competencies = []
@@ -113,8 +223,11 @@ def gerar_programa(data: CourseRequest, x_moodle_token: Optional[str] = Header(N
                     "description": c["competency"].get("description", "")
                 })
 
-    # 3. Geração de conteúdo programático (IA)
-    programa = generate_syllabus_ai(
+    return course_data, competencies, formatted_competencies, sections_task
+
+def syllabus_kwargs(data: CourseRequest, course_data: dict, formatted_competencies: list[dict]) -> dict:
+    """Arguments shared by agenerate_syllabus_ai and astream_syllabus_ai."""
+    return dict(
         course_name=course_data.get("fullname", "Curso sem nome"),
         course_desc=course_data.get("summary", ""),
         competencies=formatted_competencies,
@@ -122,11 +235,14 @@ def gerar_programa(data: CourseRequest, x_moodle_token: Optional[str] = Header(N
         temperature=data.temperature,
         top_p=data.top_p,
         frequency_penalty=data.frequency_penalty,
-        presence_penalty=data.presence_penalty
+        presence_penalty=data.presence_penalty,
+        force_regenerate=data.force_regenerate
     )
 
+def fallback_programa(programa: list[str], competencies) -> list[str]:
     # fallback se a IA falhar ou retornar vazio
     if not programa:
+        programa = []
         # Fallback para competências se não houver programa gerado
         if isinstance(competencies, list):
              for comp in competencies:
@@ -141,86 +257,494 @@ def gerar_programa(data: CourseRequest, x_moodle_token: Optional[str] = Header(N
                 "Aplicações práticas",
                 "Avaliação final"
             ]
+    return programa
+
+def course_summary(course_data: dict) -> dict:
+    return {
+        "id": course_data.get("id"),
+        "name": course_data.get("fullname"),
+        "description": course_data.get("summary", "")
+    }
+
+@app.post("/api/course/programa", response_model=ProgramResponse, dependencies=[Depends(execution_guard)])
+async def gerar_programa(data: CourseRequest, async_mode: bool = Query(False, alias="async"), x_moodle_token: Optional[str] = Header(None, alias="X-Moodle-Token"), x_execution_id: Optional[str] = Header(None, alias="X-Execution-ID")):
+    """
+    Generates the syllabus and writes it to Moodle. With ?async=true the work is
+    queued instead: the response is 202 with a job id to poll at
+    GET /api/course/programa/jobs/{id}.
+    """
+    if async_mode:
+        try:
+            job = job_manager.submit(
+                "programa",
+                lambda job: run_programa_job(job, data, x_moodle_token),
+                params={"course_id": data.course_id, "dry_run": data.dry_run, "execution_id": x_execution_id}
+            )
+        except JobQueueFullError as e:
+            return JSONResponse(status_code=503, content={"detail": {"error": "Job Queue Full", "message": str(e)}}, headers={"Retry-After": "5"})
+        return JSONResponse(
+            status_code=202,
+            content={"job_id": job.id, "status": job.status, "status_url": f"/api/course/programa/jobs/{job.id}"},
+            headers={"Location": f"/api/course/programa/jobs/{job.id}"}
+        )
+
+    # 1. Dados do curso + 2. Competências do curso
+    with span("moodle_read", course_id=data.course_id):
+        course_data, competencies, formatted_competencies, sections_task = await load_course_inputs(data.course_id, token=x_moodle_token)
+
+    # 3. Geração de conteúdo programático (IA)
+    with span("generate") as current:
+        programa = await agenerate_syllabus_ai(**syllabus_kwargs(data, course_data, formatted_competencies))
+        programa = fallback_programa(programa, competencies)
+        current.set_attribute("topics", len(programa))
 
     # 4. Gravar no Moodle (Persistence) via Sections
-    apply_syllabus_structure(data.course_id, programa, token=x_moodle_token)
+    with span("persist", dry_run=data.dry_run):
+        plan = await apply_syllabus_structure(data.course_id, programa, token=x_moodle_token, sections=sections_task, dry_run=data.dry_run)
 
     return {
-        "course": {
-            "id": course_data.get("id"),
-            "name": course_data.get("fullname"),
-            "description": course_data.get("summary", "")
-        },
+        "course": course_summary(course_data),
         "competencies": formatted_competencies,
-        "programa": programa
+        "programa": programa,
+        "plan": plan
     }
 
-def apply_syllabus_structure(course_id: int, programa: list[str], token: str = None):
+async def run_programa_job(job: Job, data: CourseRequest, token: str = None) -> dict:
+    """Background version of gerar_programa: same steps, recorded on the job, write failures surfaced."""
+    async with job.step("moodle_read"):
+        course_data, competencies, formatted_competencies, sections_task = await load_course_inputs(data.course_id, token=token)
+
+    async with job.step("generate") as step:
+        programa = await agenerate_syllabus_ai(**syllabus_kwargs(data, course_data, formatted_competencies))
+        programa = fallback_programa(programa, competencies)
+        step["topics"] = len(programa)
+
+    async with job.step("persist") as step:
+        step["results"] = results = []
+        plan = await apply_syllabus_structure(
+            data.course_id, programa, token=token, sections=sections_task,
+            dry_run=data.dry_run, on_result=results.append, raise_errors=True
+        )
+        failed = [r for r in results if r["status"] != "ok"]
+        if failed:
+            step["status"] = "failed"
+            step["error"] = f"{len(failed)} of {len(results)} section operations failed"
+
+    return jsonable_encoder({
+        "course": course_summary(course_data),
+        "competencies": formatted_competencies,
+        "programa": programa,
+        "plan": plan
+    })
+
+@app.get("/api/course/programa/jobs/{job_id}")
+async def get_programa_job(job_id: str):
     """
-    Updates course sections to match the generated syllabus using local_sectionmanager.
-    REV 18 - ROBUST PLUGIN IMPLEMENTATION
+    Status, step timings and result of a job queued with ?async=true. Jobs are
+    kept in the memory of the process that accepted them, so this only finds
+    them when served by that same process (the image runs one uvicorn worker).
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(404, "Job não encontrado (inexistente ou expirado)")
+    return job.to_dict()
+
+@app.post("/api/course/programa/batch", dependencies=[Depends(execution_guard)])
+async def gerar_programa_batch(data: BatchCourseRequest, x_moodle_token: Optional[str] = Header(None, alias="X-Moodle-Token"), x_execution_id: Optional[str] = Header(None, alias="X-Execution-ID")):
+    """
+    Runs the /api/course/programa pipeline for many courses. Moodle reads, LLM
+    generation and section writes each have their own concurrency limit
+    (batch_*_concurrency). The response is NDJSON: one line per course, in
+    completion order, then a final {"done": true, ...} summary line.
     """
-    from .moodle_client import get_course_contents, update_section_name, create_moodle_section, delete_course_sections
+    course_ids = list(dict.fromkeys(data.course_ids))
+    if not course_ids:
+        raise HTTPException(422, "course_ids vazio")
+    if len(course_ids) > settings.batch_max_courses:
+        raise HTTPException(422, f"Máximo de {settings.batch_max_courses} cursos por lote")
 
+    limits = {
+        "read": asyncio.Semaphore(settings.batch_read_concurrency),
+        "llm": asyncio.Semaphore(settings.batch_llm_concurrency),
+        "write": asyncio.Semaphore(settings.batch_write_concurrency)
+    }
+    log.info(f"Batch of {len(course_ids)} courses (execution {x_execution_id})")
+
+    async def lines():
+        started = time.monotonic()
+        tasks = [asyncio.create_task(run_batch_course(data.course_request(cid), limits, x_moodle_token)) for cid in course_ids]
+        succeeded = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                succeeded += result["status"] == "ok"
+                yield json.dumps(jsonable_encoder(result), ensure_ascii=False) + "\n"
+            yield json.dumps({
+                "done": True,
+                "total": len(course_ids),
+                "succeeded": succeeded,
+                "failed": len(course_ids) - succeeded,
+                "duration_ms": round((time.monotonic() - started) * 1000, 1)
+            }) + "\n"
+        finally:
+            # Client disconnected: stop the courses still queued or running
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+async def run_batch_course(data: CourseRequest, limits: dict, token: str = None) -> dict:
+    """One course of a batch. Never raises: failures become a status "error" line."""
+    started = time.monotonic()
+    result = {"course_id": data.course_id, "status": "ok", "step": None}
     try:
-        print("[AI SERVICE] VERSION: REV 18 - LOCAL PLUGIN POWERED")
-        print(f"[AI SERVICE] Fetching sections for course {course_id}...")
-        sections = get_course_contents(course_id, token=token)
-        
-        # Filter only real sections (exclude Section 0 'General')
-        real_sections = [s for s in sections if s.get("section", 0) != 0]
-        current_count = len(real_sections)
-        
-        print(f"[AI SERVICE] Current Sections: {current_count}")
-        print(f"[AI SERVICE] Syllabus Items: {len(programa)}")
-
-        # 1. Update Existing Sections
-        # We iterate through existing sections and rename them to match the syllabus topics.
-        limit = min(current_count, len(programa))
-        for i in range(limit):
-            topic = programa[i]
-            sec_id = real_sections[i]["id"]
-            print(f"[AI SERVICE] Updating Section {sec_id} -> {topic}")
-            update_section_name(sec_id, topic, token=token)
-
-        # 2. Create New Sections (if needed)
-        if len(programa) > current_count:
-            diff = len(programa) - current_count
-            print(f"[AI SERVICE] Creating {diff} new sections via Plugin...")
-            
-            for i in range(current_count, len(programa)):
-                topic_name = programa[i]
-                print(f"[AI SERVICE] Creating new section: '{topic_name}'")
-                topic_name = programa[i]
-                print(f"[AI SERVICE] Creating new section: '{topic_name}'")
-                created = create_moodle_section(course_id, topic_name, token=token)
-                
-                # Force visibility
-                if isinstance(created, list) and len(created) > 0 and "id" in created[0]:
-                    new_id = created[0]["id"]
-                    print(f"[AI SERVICE] Ensuring Section {new_id} is visible...")
-                    update_section(new_id, topic_name, visible=1, token=token)
-
-        # 3. Delete Excess Sections (if needed)
-        elif current_count > len(programa):
-            diff = current_count - len(programa)
-            print(f"[AI SERVICE] Deleting {diff} excess sections...")
-            
-            to_delete = real_sections[len(programa):]
-            ids_to_delete = [s["id"] for s in to_delete]
-            
-            print(f"[AI SERVICE] Deleting Section IDs: {ids_to_delete}")
-            delete_course_sections(ids_to_delete, token=token)
-
-        print("[AI SERVICE] Course structure updated successfully (Plugin Hybrid Strategy).")
+        result["step"] = "moodle_read"
+        async with limits["read"]:
+            with span("moodle_read", course_id=data.course_id):
+                course_data, competencies, formatted_competencies, sections_task = await load_course_inputs(data.course_id, token=token)
+                sections = await sections_task
+
+        result["step"] = "generate"
+        async with limits["llm"]:
+            with span("generate", course_id=data.course_id):
+                programa = await agenerate_syllabus_ai(**syllabus_kwargs(data, course_data, formatted_competencies))
+        programa = fallback_programa(programa, competencies)
+        result.update(course=course_summary(course_data), programa=programa)
+
+        result["step"] = "persist"
+        writes = []
+        async with limits["write"]:
+            with span("persist", course_id=data.course_id):
+                result["plan"] = await apply_syllabus_structure(
+                    data.course_id, programa, token=token, sections=sections,
+                    dry_run=data.dry_run, on_result=writes.append, raise_errors=True
+                )
+        failed = [w for w in writes if w["status"] != "ok"]
+        if failed:
+            result.update(status="error", error=f"{len(failed)} of {len(writes)} section operations failed", failed_operations=failed)
+        else:
+            result["step"] = None
+    except HTTPException as e:
+        result.update(status="error", error=e.detail, status_code=e.status_code)
+    except Exception as e:
+        result.update(status="error", error=str(e) or e.__class__.__name__)
+    result["duration_ms"] = round((time.monotonic() - started) * 1000, 1)
+    return result
+
+# Section plans whose stream client disconnected: referenced here until they finish
+_detached_writes: set = set()
+
+def _detached_write_done(task: asyncio.Task):
+    _detached_writes.discard(task)
+    if task.cancelled():
+        log.warning("Detached section plan was cancelled")
+    elif task.exception() is not None:
+        log.error(f"Detached section plan failed: {task.exception()}")
+    else:
+        plan = task.result()
+        log.info(f"Detached section plan finished ({len(plan.operations) if plan else 0} operations)")
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data), ensure_ascii=False)}\n\n"
+
+@app.post("/api/course/programa/stream", dependencies=[Depends(execution_guard)])
+async def gerar_programa_stream(data: CourseRequest, x_moodle_token: Optional[str] = Header(None, alias="X-Moodle-Token"), x_execution_id: Optional[str] = Header(None, alias="X-Execution-ID")):
+    """
+    Server-sent events variant of /api/course/programa. Events, in order:
+    course, competencies, topic (one per topic, as soon as the model emits it),
+    programa, section (one per write result, while the plan executes), plan, done.
+    Failures emit `error`.
+
+    If the client disconnects while sections are being written, the plan still
+    runs to completion in the background (outcome logged): stopping between
+    writes would leave the course half-edited (e.g. deleted but not yet reordered).
+    """
+    # Course lookup errors (404/500) are raised before the stream starts
+    with span("moodle_read", course_id=data.course_id):
+        course_data, competencies, formatted_competencies, sections_task = await load_course_inputs(data.course_id, token=x_moodle_token)
+
+    async def events():
+        apply_task = None
+        getter = None
+        try:
+            yield sse_event("course", course_summary(course_data))
+            yield sse_event("competencies", formatted_competencies)
+
+            programa = []
+            with span("generate"):
+                async for kind, value in astream_syllabus_ai(**syllabus_kwargs(data, course_data, formatted_competencies)):
+                    if kind == "topic":
+                        yield sse_event("topic", {"index": len(programa) + 1, "name": value})
+                        programa.append(value)
+                    else:
+                        programa = value
+            programa = fallback_programa(programa, competencies)
+            yield sse_event("programa", programa)
+
+            # Forward per-section write results while the plan executes
+            with span("persist", dry_run=data.dry_run):
+                results: asyncio.Queue = asyncio.Queue()
+                apply_task = asyncio.create_task(apply_syllabus_structure(
+                    data.course_id, programa, token=x_moodle_token, sections=sections_task,
+                    dry_run=data.dry_run, on_result=results.put_nowait
+                ))
+                while not (apply_task.done() and results.empty()):
+                    getter = asyncio.ensure_future(results.get())
+                    await asyncio.wait({getter, apply_task}, return_when=asyncio.FIRST_COMPLETED)
+                    if getter.done():
+                        yield sse_event("section", getter.result())
+                    else:
+                        getter.cancel()
+
+            yield sse_event("plan", apply_task.result())
+            yield sse_event("done", {"course_id": data.course_id, "topics": len(programa)})
+        except (asyncio.CancelledError, GeneratorExit):
+            # Client went away (Starlette closes the generator or cancels its task).
+            # Once the plan has started it owns sections_task, so leave that to it.
+            if apply_task is None and not sections_task.done():
+                sections_task.cancel()
+            raise
+        except Exception as e:
+            log.error(f"Stream failed: {e}")
+            yield sse_event("error", {"message": str(e)})
+        finally:
+            if getter is not None and not getter.done():
+                getter.cancel()
+            if apply_task is not None and not apply_task.done():
+                log.warning(f"Stream for course {data.course_id} closed mid-write; finishing the section plan in the background")
+                _detached_writes.add(apply_task)
+                apply_task.add_done_callback(_detached_write_done)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+async def apply_syllabus_structure(course_id: int, programa: list[str], token: str = None, sections=None, dry_run: bool = False, on_result: Callable[[dict], None] = None, raise_errors: bool = False) -> Optional[SectionPlan]:
+    """
+    Updates course sections to match the generated syllabus using local_sectionmanager.
+    REV 19 - MINIMAL-EDIT PLAN (see section_planner.plan_section_sync)
+
+    `sections` may be a prefetched get_course_sections result, or an awaitable
+    (task) resolving to it; when omitted the contents are fetched here.
+    With dry_run=True the plan is computed and returned without any write call.
+    `on_result` is called with one dict per executed operation.
+    Failures are logged and return None unless raise_errors=True.
+    """
+    try:
+        log.info("VERSION: REV 19 - MINIMAL-EDIT PLAN")
+        if sections is None:
+            log.info(f"Fetching sections for course {course_id}...")
+            sections = await get_course_sections(course_id, token=token)
+        elif inspect.isawaitable(sections):
+            sections = await sections
+
+        with span("section.plan") as current:
+            plan = plan_section_sync(course_id, sections, programa, dry_run=dry_run)
+            current.set_attribute("operations", len(plan.operations))
+        log.info(f"Syllabus Items: {len(programa)} | Unchanged: {plan.unchanged} | Operations: {len(plan.operations)}")
+
+        if dry_run or plan.is_noop:
+            return plan
+
+        await execute_section_plan(plan, sections, token=token, on_result=on_result)
+        log.info("Course structure updated successfully (Minimal-Edit Plan).")
+        return plan
 
     except Exception as e:
-        print(f"[AI SERVICE] Failed to update course structure: {e}")
+        log.error(f"Failed to update course structure: {e}")
+        if raise_errors:
+            raise
+        return None
+
+async def execute_section_plan(plan: SectionPlan, sections: list[dict], token: str = None, on_result: Callable[[dict], None] = None):
+    """
+    Runs a SectionPlan against Moodle: renames (bounded concurrency), one bulk create (and show),
+    one bulk delete, then moves in syllabus order. A failed operation is reported
+    through on_result and does not stop the others.
+    """
+    ops = {kind: [o for o in plan.operations if o.op == kind] for kind in ("rename", "create", "delete", "move")}
+    semaphore = asyncio.Semaphore(settings.moodle_bulk_write_concurrency)
+
+    def report(op: SectionOperation, section_id=None, error=None, kind: str = None):
+        result = {"op": kind or op.op, "section_id": section_id or op.section_id, "name": op.name, "position": op.position}
+        if error is None:
+            result["status"] = "ok"
+        else:
+            result.update(status="error", error=str(error))
+            log.warning(f"Section {result['op']} failed ({result['section_id']}): {error}")
+        if on_result:
+            on_result(result)
+
+    # 1. Rename reused sections
+    async def _rename(op):
+        async with semaphore:
+            log.info(f"Updating Section {op.section_id} -> {op.name}")
+            try:
+                with span("section.rename", section_id=op.section_id):
+                    await update_section_name(op.section_id, op.name, token=token)
+                report(op)
+            except Exception as e:
+                report(op, error=e)
+
+    await asyncio.gather(*[_rename(op) for op in ops["rename"]])
+
+    # 2. Create missing sections (single request)
+    created_ids = {}
+    if ops["create"]:
+        names = [op.name for op in ops["create"]]
+        log.info(f"Creating {len(names)} new sections via Plugin (single request)...")
+        with span("section.create", count=len(names)):
+            results, create_errors = await create_visible_sections(plan.course_id, names, token=token)
+        errors_by_step = {(err["op"], err["name"]): err["error"] for err in create_errors}
+        for op, res in zip(ops["create"], results or [{}] * len(names)):
+            if res.get("id"):
+                created_ids[op.position] = res["id"]
+            report(op, section_id=res.get("id"), error=errors_by_step.get(("create", op.name)) or res.get("detail"))
+            # A section that was created but not shown is its own failure, not a failed create
+            if ("show", op.name) in errors_by_step:
+                report(op, section_id=res.get("id"), error=errors_by_step[("show", op.name)], kind="show")
+
+    # 3. Delete excess sections (single request)
+    if ops["delete"]:
+        ids_to_delete = [op.section_id for op in ops["delete"]]
+        log.info(f"Deleting Section IDs: {ids_to_delete}")
+        try:
+            with span("section.delete", count=len(ids_to_delete)):
+                await delete_course_sections(ids_to_delete, token=token)
+            error = None
+        except Exception as e:
+            error = e
+        for op in ops["delete"]:
+            report(op, error=error)
+
+    # 4. Reorder: each moved section goes right after its syllabus predecessor
+    if ops["move"]:
+        position_ids = {i + 1: sid for i, sid in enumerate(plan.section_ids) if sid is not None}
+        position_ids.update(created_ids)
+        general_id = next((s.get("id") for s in sections if s.get("section", 0) == 0), None)
+        for op in ops["move"]:
+            section_id = position_ids.get(op.position)
+            target_id = position_ids.get(op.after_position) if op.after_position else general_id
+            if section_id is None or target_id is None:
+                report(op, error="section not resolved")
+                continue
+            log.info(f"Moving Section {section_id} after {target_id}")
+            try:
+                with span("section.move", section_id=section_id, after_id=target_id):
+                    await move_section_after(plan.course_id, section_id, target_id, token=token)
+                report(op, section_id=section_id)
+            except Exception as e:
+                report(op, section_id=section_id, error=e)
 
 @app.get("/health")
 def health_check():
     return {"status": "ok"}
 
+# --- METRICS ---
+# Counters/histograms are recorded where the work happens (app.core.metrics);
+# the gauges below are read from the same stats the /debug endpoints serve.
+
+def _gauge(name: str, help_: str, samples):
+    return name, "gauge", help_, [(labels, value, "") for labels, value in samples]
+
+@REGISTRY.collector
+def collect_cache_gauges():
+    moodle = read_cache.stats()
+    syllabus = syllabus_cache.stats()
+    flights = get_cache_stats()["single_flight"]
+    yield _gauge("keduka_cache_hit_ratio", "Hit ratio since start per cache", [
+        ({"cache": "moodle_read"}, moodle["hit_ratio"]),
+        ({"cache": "syllabus"}, syllabus["hit_ratio"])
+    ])
+    yield ("keduka_cache_lookups_total", "counter", "Cache lookups by outcome", [
+        ({"cache": "moodle_read", "outcome": "hit"}, moodle["hits"], ""),
+        ({"cache": "moodle_read", "outcome": "miss"}, moodle["misses"], ""),
+        ({"cache": "syllabus", "outcome": "hit"}, syllabus["hits"], ""),
+        ({"cache": "syllabus", "outcome": "disk_hit"}, syllabus["disk_hits"], ""),
+        ({"cache": "syllabus", "outcome": "miss"}, syllabus["misses"], "")
+    ])
+    yield _gauge("keduka_cache_entries", "Entries held per cache", [
+        ({"cache": "moodle_read"}, moodle["size"]),
+        ({"cache": "syllabus"}, syllabus["size"])
+    ])
+    yield ("keduka_single_flight_total", "counter", "Moodle reads executed vs coalesced onto an in-flight call", [
+        ({"client": client, "outcome": outcome}, flights[client][outcome], "")
+        for client in ("sync", "async") for outcome in ("executions", "coalesced")
+    ])
+
+@REGISTRY.collector
+def collect_pool_gauges():
+    sync_pool = get_pool_stats()
+    async_pool = async_moodle_client.get_pool_stats()
+    yield _gauge("keduka_moodle_pool_in_flight", "Moodle requests in flight per client", [
+        ({"client": "sync"}, sync_pool["in_flight"]),
+        ({"client": "async"}, async_pool["in_flight"])
+    ])
+    yield _gauge("keduka_moodle_pool_capacity", "Connection limit per client (pool saturation = in_flight / capacity)", [
+        ({"client": "sync"}, sync_pool["pool_maxsize"]),
+        ({"client": "async"}, async_pool["max_connections"])
+    ])
+    yield _gauge("keduka_moodle_pool_connections_idle", "Keep-alive connections parked in the pool", [
+        ({"client": "sync"}, sum(p["idle"] for p in sync_pool["pools"])),
+        ({"client": "async"}, async_pool["idle"])
+    ])
+
+    upstreams = resilience_state()
+    yield _gauge("keduka_upstream_in_flight", "Calls holding an AIMD limiter slot per upstream", [
+        ({"upstream": name}, state["limiter"]["in_flight"]) for name, state in upstreams.items()
+    ])
+    yield _gauge("keduka_upstream_limit", "Current AIMD concurrency limit per upstream", [
+        ({"upstream": name}, state["limiter"]["limit"]) for name, state in upstreams.items()
+    ])
+    yield _gauge("keduka_upstream_queued", "Calls waiting for a limiter slot per upstream", [
+        ({"upstream": name}, state["limiter"]["queued"]) for name, state in upstreams.items()
+    ])
+    yield _gauge("keduka_upstream_circuit_open", "1 while the upstream's circuit breaker is not closed", [
+        ({"upstream": name}, int(state["breaker"]["state"] != "closed")) for name, state in upstreams.items()
+    ])
+
+    jobs = job_manager.stats()
+    yield _gauge("keduka_jobs_pending", "Background jobs waiting for a worker", [({}, jobs["pending"])])
+    yield _gauge("keduka_jobs_queue_capacity", "Background job queue size", [({}, jobs["queue_size"])])
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/debug/moodle/pool")
+async def debug_moodle_pool():
+    return {
+        "sync": get_pool_stats(),
+        "async": async_moodle_client.get_pool_stats()
+    }
+
+@app.get("/debug/moodle/cache")
+async def debug_moodle_cache():
+    return get_cache_stats()
+
+@app.get("/debug/syllabus/cache")
+async def debug_syllabus_cache():
+    return syllabus_cache.stats()
+
+@app.get("/debug/jobs")
+async def debug_jobs():
+    return job_manager.stats()
+
+@app.get("/debug/guard")
+def debug_guard():
+    # Sync on purpose: sqlite/redis stats are blocking calls, so this runs in the threadpool
+    return {"executions": ExecutionContext.stats(), "rate_limits": rate_limit_state()}
+
+@app.get("/debug/ssm")
+async def debug_ssm():
+    return parameters.state()
+
+@app.get("/debug/tracing")
+async def debug_tracing():
+    return tracing_state()
+
+@app.get("/debug/resilience")
+async def debug_resilience():
+    return resilience_state()
+
 @app.get("/debug/connectivity")
 def debug_connectivity():
     import requests
@@ -0,0 +1,55 @@
+import json
+from starlette.exceptions import HTTPException
+
+class BodySizeLimitMiddleware:
+    """
+    ASGI middleware rejecting request bodies over max_bytes with 413.
+    A declared Content-Length is checked before anything is read; chunked or
+    undeclared bodies are counted while they stream in, so an oversized body
+    is never buffered in full.
+    """
+    def __init__(self, app, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.max_bytes <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope.get("headers", []):
+            if name == b"content-length":
+                try:
+                    declared = int(value)
+                except ValueError:
+                    declared = 0
+                if declared > self.max_bytes:
+                    await self._reject(send)
+                    return
+                break
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # HTTPException passes through FastAPI's body reading to the exception handlers
+                    raise HTTPException(status_code=413, detail=self._detail())
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    def _detail(self) -> dict:
+        return {"error": "Payload Too Large", "code": "BODY_TOO_LARGE", "message": f"Request body exceeds {self.max_bytes} bytes"}
+
+    async def _reject(self, send):
+        body = json.dumps({"detail": self._detail()}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()), (b"connection", b"close")]
+        })
+        await send({"type": "http.response.body", "body": body})
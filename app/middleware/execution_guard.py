@@ -1,28 +1,103 @@
 from fastapi import Request, HTTPException, status
 from app.core.execution_context import ExecutionContext, ExecutionGuardException
+from app.core.rate_limit import GCRALimiter, token_key
+from app.core.log import get_logger, execution_id_var
+from app.core.metrics import GUARD_DECISIONS
+from app.core.tracing import tag_execution
+from typing import Dict
+import math
 import json
 
+log = get_logger("guard")
+
+_rate_limiters: Dict[str, GCRALimiter] = {}
+
+def get_rate_limiters() -> Dict[str, GCRALimiter]:
+    """Per-tenant ("token") and per-origin ("origin") limiters; a rate of 0 disables one."""
+    if not _rate_limiters:
+        from app.config import settings
+        if settings.rate_limit_token_rate > 0:
+            _rate_limiters["token"] = GCRALimiter("token", settings.rate_limit_token_rate, settings.rate_limit_token_burst)
+        if settings.rate_limit_origin_rate > 0:
+            _rate_limiters["origin"] = GCRALimiter("origin", settings.rate_limit_origin_rate, settings.rate_limit_origin_burst)
+    return _rate_limiters
+
+def rate_limit_state() -> dict:
+    return {name: limiter.state() for name, limiter in get_rate_limiters().items()}
+
+def enforce_rate_limits(request: Request):
+    """
+    Throttles callers before any execution step is counted, so minting new
+    execution ids does not get around the limits. Raises 429 with Retry-After.
+
+    Keys are the tenant's X-Moodle-Token and the client IP. The IP comes from
+    uvicorn's proxy-headers handling (X-Forwarded-For, trusted only from
+    FORWARDED_ALLOW_IPS). Client-chosen headers such as Origin are not used,
+    because rotating them would give a fresh bucket on every request.
+
+    LMS callers generating many courses should use /api/course/programa/batch
+    (one guarded request) or pace per-course calls and retry after Retry-After.
+    """
+    from app.config import settings
+    if not settings.rate_limit_enabled:
+        return
+
+    keys = {}
+    token = request.headers.get("X-Moodle-Token")
+    if token:
+        keys["token"] = token_key(token)
+    if request.client:
+        keys["origin"] = request.client.host
+
+    for name, limiter in get_rate_limiters().items():
+        key = keys.get(name)
+        if key is None:
+            continue
+        retry_after = limiter.check(key)
+        if retry_after is not None:
+            GUARD_DECISIONS.inc("RATE_LIMITED")
+            log.warning(f"RATE LIMITED: {name}={key} retry_in={retry_after:.2f}s", extra={"data": {"code": "RATE_LIMITED", "limiter": name}})
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail={
+                    "error": "Execution Blocked",
+                    "code": "RATE_LIMITED",
+                    "message": f"Rate limit exceeded for {name} ({limiter.rate:g}/s, burst {limiter.burst})"
+                },
+                headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+            )
+
+# Fields hashed for loop detection, by schema: AgentInput ('objetivo'), CourseRequest ('system_prompt')
+PROMPT_FIELDS = ("prompt", "input", "objetivo", "system_prompt")
+
+def extract_prompt(payload: dict) -> str:
+    for field in PROMPT_FIELDS:
+        value = payload.get(field)
+        if value:
+            return value if isinstance(value, str) else json.dumps(value, sort_keys=True)
+    return ""
+
 async def execution_guard(request: Request):
     """
     Dependency/Middleware to guard AI executions.
     Extracts execution_id and prompt to validate against limits.
     """
+    enforce_rate_limits(request)
+
     exec_id = request.headers.get("X-Execution-ID")
     prompt = ""
     payload = {}
 
-    # Read body safely to extract ID/Prompt if not in headers
-    # Note: request.body() caches the result, allowing Pydantic to read it later.
+    # FastAPI has already read and decoded the body to build the endpoint model
+    # (BodySizeLimitMiddleware capped its size); request.json() returns that cached
+    # result, so the payload is not parsed a second time here.
     try:
-        body_bytes = await request.body()
-        if body_bytes:
-            payload = json.loads(body_bytes)
+        if request.headers.get("content-type", "").startswith("application/json"):
+            payload = await request.json()
+        if isinstance(payload, dict):
             if not exec_id:
                 exec_id = payload.get("execution_id")
-            
-            # extract prompt/input for hash check
-            # Supports 'prompt', 'input', 'objetivo' (from existing schemas)
-            prompt = payload.get("prompt") or payload.get("input") or payload.get("objetivo") or ""
+            prompt = extract_prompt(payload)
     except Exception:
         # If body is not JSON or unreadable, we proceed with limited info
         pass
@@ -37,10 +112,11 @@ async def execution_guard(request: Request):
     
     # Validation
     try:
-        ExecutionContext.validate_request(exec_id, str(prompt))
+        await ExecutionContext.avalidate_request(exec_id, str(prompt))
     except ExecutionGuardException as e:
         # Log and Block
-        print(f"[EXECUTION GUARD] BLOCKED: ID={exec_id} REASON={e.code} MSG={e.message}")
+        GUARD_DECISIONS.inc(e.code)
+        log.warning(f"BLOCKED: ID={exec_id} REASON={e.code} MSG={e.message}", extra={"data": {"code": e.code}})
         
         err_status = status.HTTP_429_TOO_MANY_REQUESTS
         if e.code == "MISSING_ID":
@@ -57,4 +133,7 @@ async def execution_guard(request: Request):
 
     # Inject context info into request state if needed
     request.state.execution_id = exec_id
-    print(f"[EXECUTION GUARD] ALLOWED: ID={exec_id} PromptLen={len(str(prompt))}")
+    execution_id_var.set(exec_id)
+    tag_execution(exec_id)
+    GUARD_DECISIONS.inc("ALLOWED")
+    log.info(f"ALLOWED: ID={exec_id} PromptLen={len(str(prompt))}", extra={"data": {"code": "ALLOWED"}})
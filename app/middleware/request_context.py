@@ -0,0 +1,33 @@
+import uuid
+from app.core.log import request_id_var, execution_id_var
+
+class RequestContextMiddleware:
+    """
+    ASGI middleware setting the log correlation ids for the request:
+    X-Request-ID (generated when absent, echoed in the response) and X-Execution-ID.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers", []))
+        request_id = headers.get(b"x-request-id", b"").decode("latin-1") or uuid.uuid4().hex
+        execution_id = headers.get(b"x-execution-id", b"").decode("latin-1") or None
+        request_token = request_id_var.set(request_id)
+        execution_token = execution_id_var.set(execution_id)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            request_id_var.reset(request_token)
+            execution_id_var.reset(execution_token)
@@ -0,0 +1,47 @@
+from app.core.tracing import start_root, finish_root, server_timing
+
+class TracingMiddleware:
+    """
+    ASGI middleware opening the root span of each HTTP request (same trace id for
+    every request of one X-Execution-ID). With server_timing=True the response
+    carries a Server-Timing header summarising the phases finished before the
+    response started; streaming responses therefore report only their setup.
+    """
+    def __init__(self, app, server_timing: bool = False):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers", []))
+        execution_id = headers.get(b"x-execution-id", b"").decode("latin-1") or None
+        root = start_root(f"{scope['method']} {scope['path']}", execution_id, **{"http.method": scope["method"], "http.target": scope["path"]})
+        if root is None:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                root.set_attribute("http.status_code", message["status"])
+                if message["status"] >= 500:
+                    root.status = "error"
+                if self.server_timing:
+                    message["headers"] = list(message.get("headers", [])) + [(b"server-timing", server_timing(root).encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        except BaseException as e:
+            root.status = "error"
+            root.set_attribute("error", str(e) or e.__class__.__name__)
+            raise
+        finally:
+            # Name by route template once routing has matched (low cardinality)
+            route = getattr(scope.get("route"), "path", None)
+            if route:
+                root.name = f"{scope['method']} {route}"
+                root.set_attribute("http.route", route)
+            finish_root(root)
@@ -1,45 +1,392 @@
+import re
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+import httpx
 import requests
-from .config import MOODLE_URL, MOODLE_TOKEN, MOODLE_HOST
+from requests.adapters import HTTPAdapter
+from .config import MOODLE_URL, MOODLE_HOST, settings, get_moodle_token
+from .core.single_flight import SingleFlight
+from .core.moodle_params import encode_params, array_param
+from .core.moodle_decode import SectionsDecoder, log_preview
+from .core.log import get_logger, Lazy
+from .core.metrics import MOODLE_CALL_SECONDS
+from .core.tracing import span
+from .core.resilience import AIMDLimiter, CircuitBreaker, UpstreamGuard, get_upstream_guard
 
-def call_moodle(function, params, token: str = None):
+log = get_logger("moodle")
+
+def build_payload(function, params, token: str = None) -> dict:
+    """Builds the REST form payload shared by the sync and async clients."""
     # Use provided token, or fallback to config
-    active_token = token if token else MOODLE_TOKEN
+    active_token = token if token else get_moodle_token()
 
     payload = {
         "wstoken": active_token,
         "wsfunction": function,
         "moodlewsrestformat": "json",
     }
-    # User's snippet used **params but explicitly. Let's match their signature.
-    # The user snippet: 
-    # def call_moodle(function, params):
-    #    payload = { ... **params }
     if params:
-        payload.update(params)
+        # Nested dicts/lists (e.g. create_competency) become PHP bracket keys
+        payload.update(encode_params(params))
+    return payload
+
+def parse_response(function, status_code: int, data):
+    """Logs the decoded response and raises if Moodle returned an exception object."""
+    # Log response for debugging (print to stdout which goes to CloudWatch)
+    log.info(f"{function} -> {status_code}", extra={"data": {"wsfunction": function, "status": status_code, "response": Lazy(log_preview, data)}})
+
+    if isinstance(data, dict) and "exception" in data:
+        raise Exception(f"Moodle Error: {data.get('message')} ({data.get('errorcode')})")
+
+    return data
+
+# --- READ-THROUGH CACHE ---
+# Write functions -> cached read functions whose entries they make stale.
+# Writes not listed here (and not read-like by name) clear the whole cache.
+CACHE_INVALIDATES = {
+    "core_update_inplace_editable": {"core_course_get_contents"},
+    "core_course_edit_section": {"core_course_get_contents"},
+    "core_course_create_sections": {"core_course_get_contents"},
+    "core_course_delete_sections": {"core_course_get_contents"},
+    "core_courseformat_update_course": {"core_course_get_contents"},
+    "local_sectionmanager_create_sections": {"core_course_get_contents"},
+    "core_course_update_courses": {"core_course_get_courses", "core_course_get_contents"},
+    "core_course_create_courses": {"core_course_get_courses"},
+    "core_competency_create_competency_framework": {"core_competency_list_course_competencies"},
+    "core_competency_create_competency": {"core_competency_list_course_competencies"},
+}
+_READ_FUNCTION = re.compile(r"_(get|list|search|view)_|_get$|get_site_info$")
+
+class MoodleReadCache:
+    """
+    LRU + per-function TTL cache for Moodle read calls.
+    Keyed by (token identity, wsfunction, params); the token is hashed so raw
+    tokens never sit in memory as dict keys. Cached values are shared objects:
+    callers must treat them as read-only.
+    """
+    def __init__(self, ttls: dict, max_entries: int = 2048, enabled: bool = True):
+        self.ttls = dict(ttls)
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self._entries: OrderedDict = OrderedDict()   # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def is_cacheable(self, function) -> bool:
+        return self.enabled and function in self.ttls
+
+    @staticmethod
+    def make_key(function, params, token: str, variant: str = None) -> tuple:
+        """`variant` separates differently decoded results of the same call (e.g. projected sections)."""
+        token_id = hashlib.sha256((token or "").encode("utf-8")).hexdigest()[:16]
+        return (token_id, function, json.dumps(params or {}, sort_keys=True, default=str), variant)
+
+    def get(self, key):
+        """Returns (hit, value)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, entry[1]
+                del self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value):
+        ttl = self.ttls.get(key[1])
+        if not ttl:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate_for(self, function):
+        """Drops entries made stale by a call to `function` (no-op for reads)."""
+        if function in self.ttls:
+            return
+        stale = CACHE_INVALIDATES.get(function)
+        if stale is None and _READ_FUNCTION.search(function):
+            return
+        with self._lock:
+            if stale is None:
+                removed = len(self._entries)
+                self._entries.clear()
+            else:
+                keys = [k for k in self._entries if k[1] in stale]
+                for k in keys:
+                    del self._entries[k]
+                removed = len(keys)
+            self.invalidations += removed
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
 
-    # Force Host header to bypass Cloudflare/IP access issues and match VirtualHost
-    headers = {
-        "Host": MOODLE_HOST,
-        "User-Agent": "MoodleMobile" # Also match the mobile app UA just in case
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "ttls": self.ttls
+            }
+
+read_cache = MoodleReadCache(
+    settings.moodle_cache_ttls,
+    max_entries=settings.moodle_cache_max_entries,
+    enabled=settings.moodle_cache_enabled
+)
+
+# --- SINGLE-FLIGHT ---
+# Read-only core_* functions safe to coalesce: concurrent identical calls
+# (same wsfunction, params and token) share one in-flight request.
+COALESCE_FUNCTIONS = {
+    "core_course_get_courses",
+    "core_course_get_courses_by_field",
+    "core_course_get_contents",
+    "core_course_get_categories",
+    "core_competency_list_course_competencies",
+    "core_competency_read_competency",
+    "core_competency_read_competency_framework",
+    "core_webservice_get_site_info",
+}
+
+flight = SingleFlight()
+
+def get_cache_stats() -> dict:
+    from .async_moodle_client import async_flight
+    return {
+        **read_cache.stats(),
+        "single_flight": {
+            "enabled": settings.moodle_coalesce_enabled,
+            "sync": {"executions": flight.executions, "coalesced": flight.coalesced},
+            "async": {"executions": async_flight.executions, "coalesced": async_flight.coalesced}
+        }
     }
-    
-    # Public routing via HTTPS requires enabled SSL verification
-    try:
-        r = requests.post(MOODLE_URL, data=payload, headers=headers, timeout=20)
+
+# --- UPSTREAM PROTECTION ---
+def is_moodle_failure(e: BaseException) -> bool:
+    """Transport errors and 5xx count against the Moodle host; 4xx and Moodle exceptions do not."""
+    status = getattr(getattr(e, "response", None), "status_code", None)
+    if status is not None:
+        return status >= 500
+    return isinstance(e, (requests.RequestException, httpx.TransportError))
+
+def get_moodle_guard() -> UpstreamGuard:
+    """Adaptive limiter + circuit breaker shared by the sync and async clients for MOODLE_URL."""
+    return get_upstream_guard(f"moodle:{MOODLE_HOST}", lambda: UpstreamGuard(
+        f"moodle:{MOODLE_HOST}",
+        AIMDLimiter(
+            f"moodle:{MOODLE_HOST}",
+            initial=settings.moodle_limit_initial,
+            min_limit=settings.moodle_limit_min,
+            max_limit=settings.moodle_limit_max,
+            latency_threshold=settings.moodle_limit_latency_threshold,
+            backoff=settings.limit_backoff,
+            queue_timeout=settings.moodle_limit_queue_timeout
+        ),
+        CircuitBreaker(
+            error_threshold=settings.breaker_error_threshold,
+            min_requests=settings.breaker_min_requests,
+            window=settings.breaker_window,
+            open_seconds=settings.breaker_open_seconds,
+            half_open_max=settings.breaker_half_open_max
+        ),
+        is_failure=is_moodle_failure
+    ))
+
+MOODLE_HEADERS = {
+    "Host": MOODLE_HOST,
+    "User-Agent": "MoodleMobile", # Also match the mobile app UA just in case
+    "Connection": "keep-alive"
+}
+
+class MoodleClient:
+    """
+    Shared Moodle Web Service client.
+    Keeps a keep-alive connection pool (requests.Session + HTTPAdapter) so consecutive
+    calls reuse TCP/TLS connections instead of opening a new one per call.
+    """
+    def __init__(self, url: str = MOODLE_URL, host: str = MOODLE_HOST,
+                 pool_connections: int = None, pool_maxsize: int = None, pool_block: bool = None,
+                 connect_timeout: float = None, read_timeout: float = None):
+        self.url = url
+        self.host = host
+        self.pool_connections = pool_connections or settings.moodle_pool_connections
+        self.pool_maxsize = pool_maxsize or settings.moodle_pool_maxsize
+        self.pool_block = settings.moodle_pool_block if pool_block is None else pool_block
+        self.timeout = (
+            connect_timeout or settings.moodle_connect_timeout,
+            read_timeout or settings.moodle_read_timeout
+        )
+
+        self._adapter = HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            pool_block=self.pool_block
+        )
+        self.session = requests.Session()
+        self.session.mount("https://", self._adapter)
+        self.session.mount("http://", self._adapter)
+        # Force Host header to bypass Cloudflare/IP access issues and match VirtualHost
+        self.session.headers.update({**MOODLE_HEADERS, "Host": self.host})
+
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._in_flight = 0
+        self._peak_in_flight = 0
+        self._errors = 0
+
+    def call(self, function, params, token: str = None, timeout=None, decoder=None):
+        """
+        `decoder` (e.g. SectionsDecoder) streams the response body into a projected
+        result instead of decoding the full JSON.
+        """
+        with span(f"moodle.{function}", **{"moodle.wsfunction": function}) as current:
+            start = time.perf_counter()
+            result = "error"
+            try:
+                cacheable = read_cache.is_cacheable(function)
+                coalesce = settings.moodle_coalesce_enabled and function in COALESCE_FUNCTIONS
+                if not cacheable and not coalesce:
+                    # Writes invalidate even when they fail: Moodle may have applied part of them
+                    try:
+                        data = self._post(function, params, token, timeout, decoder)
+                    finally:
+                        read_cache.invalidate_for(function)
+                    result = "ok"
+                    return data
+
+                key = read_cache.make_key(function, params, token or get_moodle_token(), decoder.name if decoder else None)
+                if cacheable:
+                    hit, value = read_cache.get(key)
+                    if hit:
+                        result = "hit"
+                        return value
+
+                if coalesce:
+                    # Identical concurrent reads share one in-flight request
+                    data = flight.do(key, lambda: self._post(function, params, token, timeout, decoder))
+                else:
+                    data = self._post(function, params, token, timeout, decoder)
+
+                if cacheable:
+                    read_cache.put(key, data)
+                result = "ok"
+                return data
+            finally:
+                MOODLE_CALL_SECONDS.observe(time.perf_counter() - start, function, result)
+                current.set_attribute("moodle.result", result)
+
+    def _post(self, function, params, token: str = None, timeout=None, decoder=None):
+        payload = build_payload(function, params, token)
+
+        with self._lock:
+            self._requests += 1
+            self._in_flight += 1
+            self._peak_in_flight = max(self._peak_in_flight, self._in_flight)
+
+        # Public routing via HTTPS requires enabled SSL verification
+        try:
+            if decoder is not None:
+                status_code, data = get_moodle_guard().call(lambda: self._send_decoded(payload, decoder(), timeout))
+                return parse_response(function, status_code, data)
+            r = get_moodle_guard().call(lambda: self._send(payload, timeout))
+            return parse_response(function, r.status_code, r.json())
+        except Exception as e:
+            with self._lock:
+                self._errors += 1
+            log.error(f"{function} failed: {e}", extra={"data": {"wsfunction": function}})
+            # Re-raise to be handled by FastAPI or crash safely
+            raise e
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def _send(self, payload: dict, timeout=None):
+        r = self.session.post(self.url, data=payload, timeout=timeout or self.timeout)
         r.raise_for_status()
-        data = r.json()
-        
-        # Log response for debugging (print to stdout which goes to CloudWatch)
-        print(f"[MOODLE LOG] Function: {function} | Status: {r.status_code} | Response: {str(data)[:200]}...")
-
-        if isinstance(data, dict) and "exception" in data:
-            raise Exception(f"Moodle Error: {data.get('message')} ({data.get('errorcode')})")
-            
-        return data
-    except Exception as e:
-        print(f"[MOODLE ERROR] {str(e)}")
-        # Re-raise to be handled by FastAPI or crash safely
-        raise e
+        return r
+
+    def _send_decoded(self, payload: dict, decoder, timeout=None):
+        with self.session.post(self.url, data=payload, timeout=timeout or self.timeout, stream=True) as r:
+            r.raise_for_status()
+            for chunk in r.iter_content(chunk_size=65536):
+                decoder.feed(chunk)
+            return r.status_code, decoder.close()
+
+    def pool_stats(self) -> dict:
+        """
+        Snapshot of connection pool usage, per host pool plus client-level counters.
+        'idle' is the number of keep-alive connections currently parked in the pool
+        (urllib3 pre-fills the queue with None placeholders, which are not counted).
+        """
+        pools = []
+        manager = self._adapter.poolmanager
+        for key in list(manager.pools.keys()):
+            pool = manager.pools.get(key)
+            if pool is None:
+                continue
+            pools.append({
+                "host": pool.host,
+                "port": pool.port,
+                "scheme": pool.scheme,
+                "connections_opened": pool.num_connections,
+                "requests": pool.num_requests,
+                "idle": sum(1 for conn in list(pool.pool.queue) if conn is not None) if pool.pool is not None else 0,
+                "maxsize": pool.pool.maxsize if pool.pool is not None else self.pool_maxsize
+            })
+
+        with self._lock:
+            return {
+                "pool_connections": self.pool_connections,
+                "pool_maxsize": self.pool_maxsize,
+                "pool_block": self.pool_block,
+                "timeout": {"connect": self.timeout[0], "read": self.timeout[1]},
+                "requests": self._requests,
+                "errors": self._errors,
+                "in_flight": self._in_flight,
+                "peak_in_flight": self._peak_in_flight,
+                "pools": pools
+            }
+
+    def close(self):
+        self.session.close()
+
+_client: MoodleClient = None
+_client_lock = threading.Lock()
+
+def get_moodle_client() -> MoodleClient:
+    """Returns the process-wide MoodleClient, creating it on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = MoodleClient()
+    return _client
+
+def call_moodle(function, params, token: str = None):
+    return get_moodle_client().call(function, params, token)
+
+def get_pool_stats() -> dict:
+    return get_moodle_client().pool_stats()
 
 def update_course(course_id: int, summary: str, token: str = None):
     """
@@ -61,6 +408,13 @@ def get_course_contents(course_id: int, token: str = None):
     }
     return call_moodle("core_course_get_contents", params, token)
 
+def get_course_sections(course_id: int, token: str = None):
+    """
+    core_course_get_contents projected to SectionRecords (id, section, name, visible),
+    streamed so module data is never fully materialised.
+    """
+    return get_moodle_client().call("core_course_get_contents", {"courseid": course_id}, token, decoder=SectionsDecoder)
+
 def update_section(section_id: int, name: str, summary: str = "", visible: int = 1, token: str = None):
     """
     Update a course section properties (visibility, etc).
@@ -108,18 +462,14 @@ def create_course_sections(course_ids: list[int], token: str = None):
     Pass a list of course IDs. One section is created for each ID in the list.
     To create 3 sections in course 2, pass [2, 2, 2].
     """
-    params = {}
-    for i, cid in enumerate(course_ids):
-        params[f"courseids[{i}]"] = cid
+    params = array_param("core_course_create_sections").encode(course_ids)
     return call_moodle("core_course_create_sections", params, token)
 
 def delete_course_sections(section_ids: list[int], token: str = None):
     """
     Deletes sections using core_course_delete_sections.
     """
-    params = {}
-    for i, sid in enumerate(section_ids):
-        params[f"ids[{i}]"] = sid
+    params = array_param("core_course_delete_sections").encode(section_ids)
     return call_moodle("core_course_delete_sections", params, token)
 
 def create_moodle_section(course_id: int, section_name: str, token: str = None):
@@ -135,6 +485,37 @@ def create_moodle_section(course_id: int, section_name: str, token: str = None):
     # (Checking if current token is compatible happens at runtime)
     return call_moodle("local_sectionmanager_create_sections", params, token)
 
+def map_created_sections(section_names: list[str], result) -> list:
+    """
+    Aligns a local_sectionmanager_create_sections response with the requested names.
+    Returns one entry per input name, in input order: the created {"id", "name", ...}
+    dict, or None when the plugin did not return that section.
+    """
+    created = [r for r in result if isinstance(r, dict) and "id" in r] if isinstance(result, list) else []
+
+    # Plugin echoes sections in request order: trust positions when counts and names line up
+    if len(created) == len(section_names) and all(c.get("name", n) == n for c, n in zip(created, section_names)):
+        return created
+
+    # Otherwise match by name (duplicates consumed in order)
+    by_name = {}
+    for c in created:
+        by_name.setdefault(c.get("name"), []).append(c)
+    return [by_name[n].pop(0) if by_name.get(n) else None for n in section_names]
+
+def move_section_after(course_id: int, section_id: int, target_section_id: int, token: str = None):
+    """
+    Moves a section right after target_section_id (pass the general section id to move it to the top).
+    Uses core_courseformat_update_course 'section_move_after' (Moodle 4.4+).
+    """
+    params = {
+        "action": "section_move_after",
+        "courseid": course_id,
+        "targetsectionid": target_section_id
+    }
+    array_param("core_courseformat_update_course").encode([section_id], params)
+    return call_moodle("core_courseformat_update_course", params, token)
+
 def create_competency_framework(idnumber: str, shortname: str, description: str, token: str = None):
     """
     Creates a new competency framework.
@@ -1,4 +1,4 @@
-from typing import List, Optional
+from typing import List, Literal, Optional
 from pydantic import BaseModel
 
 class CourseRequest(BaseModel):
@@ -8,16 +8,51 @@ class CourseRequest(BaseModel):
     top_p: Optional[float] = None
     frequency_penalty: Optional[float] = None
     presence_penalty: Optional[float] = None
+    dry_run: bool = False  # Plan section changes without writing to Moodle
+    force_regenerate: bool = False  # Bypass the syllabus result cache
+
+class BatchCourseRequest(BaseModel):
+    course_ids: List[int]
+    # Shared by every course in the batch (same meaning as in CourseRequest)
+    system_prompt: Optional[str] = None
+    temperature: Optional[float] = 0.7
+    top_p: Optional[float] = None
+    frequency_penalty: Optional[float] = None
+    presence_penalty: Optional[float] = None
+    dry_run: bool = False
+    force_regenerate: bool = False
+
+    def course_request(self, course_id: int) -> CourseRequest:
+        return CourseRequest(course_id=course_id, **self.model_dump(exclude={"course_ids"}))
 
 class Competency(BaseModel):
     id: int
     name: str
     description: Optional[str] = ""
 
+class SectionOperation(BaseModel):
+    op: Literal["rename", "create", "delete", "move"]
+    section_id: Optional[int] = None      # Existing section (None for sections created by this plan)
+    name: Optional[str] = None            # Target name (rename/create)
+    position: Optional[int] = None        # 1-based position of the topic in the syllabus
+    after_position: Optional[int] = None  # move: place after this syllabus position (0 = top)
+
+class SectionPlan(BaseModel):
+    course_id: int
+    dry_run: bool = False
+    unchanged: int = 0
+    operations: List[SectionOperation] = []
+    section_ids: List[Optional[int]] = []   # Section serving each syllabus position (None = created by this plan)
+
+    @property
+    def is_noop(self) -> bool:
+        return not self.operations
+
 class ProgramResponse(BaseModel):
     course: dict
     competencies: List[Competency]
     programa: List[str]
+    plan: Optional[SectionPlan] = None
 
 class CreateSectionRequest(BaseModel):
     course_id: int
@@ -0,0 +1,91 @@
+from bisect import bisect_left
+from .schemas import SectionOperation, SectionPlan
+
+def plan_section_sync(course_id: int, sections: list[dict], programa: list[str], dry_run: bool = False) -> SectionPlan:
+    """
+    Computes the smallest set of section writes that turns the course's current
+    sections (core_course_get_contents) into the target syllabus.
+
+    1. Sections whose name already matches a topic are kept as-is (no write).
+    2. Remaining sections are renamed, in order, to the remaining topics.
+    3. Topics left over are created; sections left over are deleted.
+    4. Only sections outside the longest already-ordered run are moved.
+    A course that is already in sync yields an empty plan.
+    """
+    # Filter only real sections (exclude Section 0 'General')
+    current = [s for s in sections if s.get("section", 0) != 0]
+
+    # assigned[i] = index in `current` serving topic i (None -> needs a new section)
+    assigned = [None] * len(programa)
+    used = set()
+    unchanged = 0
+
+    # 1. Keep exact name matches
+    by_name = {}
+    for idx, s in enumerate(current):
+        by_name.setdefault(s.get("name"), []).append(idx)
+    for i, topic in enumerate(programa):
+        if by_name.get(topic):
+            idx = by_name[topic].pop(0)
+            assigned[i] = idx
+            used.add(idx)
+            unchanged += 1
+
+    operations = []
+
+    # 2. Reuse leftover sections by renaming them
+    spare = [idx for idx in range(len(current)) if idx not in used]
+    for i, topic in enumerate(programa):
+        if assigned[i] is None and spare:
+            idx = spare.pop(0)
+            assigned[i] = idx
+            used.add(idx)
+            operations.append(SectionOperation(op="rename", section_id=current[idx]["id"], name=topic, position=i + 1))
+
+    # 3. Create missing topics / delete unused sections
+    created = [i for i in range(len(programa)) if assigned[i] is None]
+    for i in created:
+        operations.append(SectionOperation(op="create", name=programa[i], position=i + 1))
+    for idx in spare:
+        operations.append(SectionOperation(op="delete", section_id=current[idx]["id"]))
+
+    # 4. Reorder. After creates/deletes the course order is: kept sections in their
+    # current order, then created sections appended in topic order.
+    order_key = {}
+    for i in range(len(programa)):
+        order_key[i] = assigned[i] if assigned[i] is not None else len(current) + created.index(i)
+    stay = _longest_increasing_run([order_key[i] for i in range(len(programa))])
+    for i in range(len(programa)):
+        if i not in stay:
+            section_id = current[assigned[i]]["id"] if assigned[i] is not None else None
+            operations.append(SectionOperation(op="move", section_id=section_id, position=i + 1, after_position=i))
+
+    return SectionPlan(
+        course_id=course_id,
+        dry_run=dry_run,
+        unchanged=unchanged,
+        operations=operations,
+        section_ids=[current[idx]["id"] if idx is not None else None for idx in assigned]
+    )
+
+def _longest_increasing_run(keys: list[int]) -> set[int]:
+    """Indexes of one longest strictly increasing subsequence of keys (patience sorting)."""
+    tails = []       # tails[k] = index into keys ending the best run of length k+1
+    tail_keys = []
+    parent = [None] * len(keys)
+    for i, key in enumerate(keys):
+        k = bisect_left(tail_keys, key)
+        parent[i] = tails[k - 1] if k > 0 else None
+        if k == len(tails):
+            tails.append(i)
+            tail_keys.append(key)
+        else:
+            tails[k] = i
+            tail_keys[k] = key
+
+    result = set()
+    i = tails[-1] if tails else None
+    while i is not None:
+        result.add(i)
+        i = parent[i]
+    return result
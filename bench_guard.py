@@ -0,0 +1,58 @@
+"""
+Execution guard latency vs. number of live execution_ids.
+
+    python bench_guard.py > bench_output.txt
+
+For each population size the store is filled with live ids, then the cost of
+validate_request is measured for new ids and for repeat steps on existing ids.
+"""
+import sys
+import time
+import statistics
+from app.core.execution_context import ExecutionContext, ExecutionGuardException
+from app.core.guard_store import MemoryGuardStore
+
+SIZES = [10, 1_000, 100_000, 1_000_000]
+SAMPLES = 20_000
+
+def fill(n: int):
+    ExecutionContext.reset()
+    for i in range(n):
+        ExecutionContext.validate_request(f"live-{i}", "seed")
+
+def attempt(execution_id: str, prompt: str):
+    try:
+        ExecutionContext.validate_request(execution_id, prompt)
+    except ExecutionGuardException:
+        pass  # Blocked requests (step limit) are part of the measured path
+
+def measure(label: str, fn) -> dict:
+    timings = []
+    for i in range(SAMPLES):
+        start = time.perf_counter_ns()
+        fn(i)
+        timings.append(time.perf_counter_ns() - start)
+    timings.sort()
+    return {
+        "case": label,
+        "mean_us": statistics.fmean(timings) / 1000,
+        "p50_us": timings[len(timings) // 2] / 1000,
+        "p99_us": timings[int(len(timings) * 0.99)] / 1000
+    }
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or SIZES
+    ExecutionContext.set_store(MemoryGuardStore(max_tracked=max(sizes) + 2 * SAMPLES))
+    print(f"{'live_ids':>10} {'case':<12} {'mean_us':>9} {'p50_us':>9} {'p99_us':>9}")
+    for n in sizes:
+        fill(n)
+        rows = [
+            measure("new_id", lambda i: attempt(f"bench-new-{n}-{i}", "p")),
+            measure("repeat_step", lambda i: attempt(f"bench-rep-{i % 1000}", f"p{i}"))
+        ]
+        for row in rows:
+            print(f"{n:>10} {row['case']:<12} {row['mean_us']:>9.2f} {row['p50_us']:>9.2f} {row['p99_us']:>9.2f}")
+    ExecutionContext.reset()
+
+if __name__ == "__main__":
+    main()
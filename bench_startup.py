@@ -0,0 +1,63 @@
+"""
+Cold-start benchmark: import time of app.main and time-to-first-200 on /health.
+
+    python bench_startup.py [runs] > bench_output.txt
+
+Each run is a fresh interpreter, so nothing is cached between runs beyond the
+OS page cache. SSM is disabled so AWS reachability does not skew the numbers.
+"""
+import os
+import sys
+import time
+import socket
+import statistics
+import subprocess
+import urllib.request
+
+RUNS = 5
+HEALTH_TIMEOUT = 30.0
+
+ENV = {**os.environ, "SSM_ENABLED": "false"}
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import app.main; print(time.perf_counter() - t)"
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def import_time() -> float:
+    out = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], env=ENV, capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+def time_to_first_200() -> float:
+    port = free_port()
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        env=ENV, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.perf_counter() - start < HEALTH_TIMEOUT:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as resp:
+                    if resp.status == 200:
+                        return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.01)
+        raise RuntimeError("/health did not answer 200 in time")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+def summary(label: str, values: list) -> str:
+    ms = [v * 1000 for v in values]
+    return f"{label:<20} median {statistics.median(ms):8.1f} ms   min {min(ms):8.1f} ms   max {max(ms):8.1f} ms"
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else RUNS
+    import_time()  # Prime the page cache and bytecode
+    print(summary("import app.main", [import_time() for _ in range(runs)]))
+    print(summary("first 200 /health", [time_to_first_200() for _ in range(runs)]))
+
+if __name__ == "__main__":
+    main()
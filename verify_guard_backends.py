@@ -0,0 +1,162 @@
+import os
+import sys
+import time
+import asyncio
+import sqlite3
+import tempfile
+import threading
+import multiprocessing
+from collections import Counter
+from app.core.execution_context import ExecutionContext, ExecutionGuardException, MAX_STEPS
+from app.core.guard_store import SQLiteGuardStore, RedisGuardStore
+
+PROCESSES = 8
+THREADS = 8
+EXECUTIONS = 20
+ATTEMPTS = 300   # Per worker; each execution gets ATTEMPTS // EXECUTIONS (> MAX_STEPS) distinct prompts
+
+# Redis: a real server when VERIFY_REDIS_URL is set, else fakeredis (runs the Lua script via lupa)
+REDIS_URL = os.environ.get("VERIFY_REDIS_URL")
+
+def _hammer(counts: Counter):
+    for i in range(ATTEMPTS):
+        exec_id = f"exec-{i % EXECUTIONS}"
+        try:
+            ExecutionContext.validate_request(exec_id, f"Prompt {i // EXECUTIONS}")
+            counts[exec_id] += 1
+        except ExecutionGuardException as e:
+            counts[e.code] += 1
+
+def _sqlite_process(path: str, queue):
+    ExecutionContext.set_store(SQLiteGuardStore(path, timeout=30.0))
+    counts = Counter()
+    threads = [threading.Thread(target=_hammer, args=(counts,)) for _ in range(THREADS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    queue.put(dict(counts))
+
+def _check(name: str, counts: Counter, workers: int):
+    allowed = {k: v for k, v in counts.items() if k.startswith("exec-")}
+    expected = min(MAX_STEPS, ATTEMPTS // EXECUTIONS)
+    wrong = {k: v for k, v in allowed.items() if v != expected}
+    if wrong or len(allowed) != EXECUTIONS:
+        print(f"FAIL: {name}: expected {expected} steps per execution, got {dict(list(wrong.items())[:3])}")
+    else:
+        print(f"PASS: {name}: each of {EXECUTIONS} executions admitted exactly {expected} steps across {workers} workers")
+    total = sum(counts.values())
+    if total != workers * ATTEMPTS:
+        print(f"FAIL: {name}: {workers * ATTEMPTS - total} requests lost")
+
+def _semantics(name: str, store):
+    """Same rules as the memory store: loop, step limit, TTL restart."""
+    ExecutionContext.set_store(store)
+    store.reset()
+    codes = []
+    for prompt in ["A", "A"] + [f"P{i}" for i in range(MAX_STEPS)]:
+        try:
+            ExecutionContext.validate_request("sem-1", prompt)
+            codes.append(None)
+        except ExecutionGuardException as e:
+            codes.append(e.code)
+    ok = codes[1] == "LOOP_DETECTED" and codes.count(None) == MAX_STEPS and codes[-1] == "MAX_STEPS_EXCEEDED"
+
+    h = b"\x00" * 16
+    first = store.check_and_record("ttl-1", h, MAX_STEPS, 0.2)
+    time.sleep(0.4)
+    # Expired ids start over, so the same prompt is accepted again
+    again = store.check_and_record("ttl-1", h, MAX_STEPS, 0.2)
+    if ok and first is None and again is None:
+        print(f"PASS: {name}: loop, step limit and TTL behave like the memory store")
+    else:
+        print(f"FAIL: {name}: codes={codes} ttl=({first}, {again})")
+
+def test_sqlite(tmpdir: str):
+    path = os.path.join(tmpdir, "guard.sqlite3")
+    _semantics("sqlite", SQLiteGuardStore(path))
+    SQLiteGuardStore(path).reset()
+
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    procs = [ctx.Process(target=_sqlite_process, args=(path, queue)) for _ in range(PROCESSES)]
+    for p in procs:
+        p.start()
+    counts = Counter()
+    for _ in procs:
+        counts.update(queue.get(timeout=300))
+    for p in procs:
+        p.join()
+    _check("sqlite", counts, PROCESSES * THREADS)
+
+def test_sqlite_off_loop(tmpdir: str):
+    """A locked database must delay the guarded request, not the event loop."""
+    path = os.path.join(tmpdir, "locked.sqlite3")
+    store = SQLiteGuardStore(path, timeout=1.0)
+    ExecutionContext.set_store(store)
+    holder = sqlite3.connect(path, isolation_level=None)
+    holder.execute("BEGIN IMMEDIATE")
+
+    async def main():
+        lags = []
+        async def ticker():
+            while True:
+                start = time.monotonic()
+                await asyncio.sleep(0.01)
+                lags.append(time.monotonic() - start - 0.01)
+        tick = asyncio.create_task(ticker())
+        try:
+            await ExecutionContext.avalidate_request("locked-1", "prompt")
+            outcome = "allowed"
+        except sqlite3.OperationalError as e:
+            outcome = str(e)
+        tick.cancel()
+        return outcome, max(lags)
+
+    outcome, worst_lag = asyncio.run(main())
+    holder.execute("ROLLBACK")
+    if worst_lag < 0.2 and outcome == "database is locked":
+        print(f"PASS: sqlite: lock wait ran off the event loop (max loop lag {worst_lag * 1000:.0f}ms, then '{outcome}')")
+    else:
+        print(f"FAIL: sqlite: max loop lag {worst_lag * 1000:.0f}ms, outcome {outcome!r}")
+
+def _redis_store() -> RedisGuardStore:
+    prefix = f"verify:{os.getpid()}:"
+    if REDIS_URL:
+        return RedisGuardStore(REDIS_URL, prefix=prefix)
+    import fakeredis
+    return RedisGuardStore(prefix=prefix, client=fakeredis.FakeRedis(server=fakeredis.FakeServer()))
+
+def test_redis():
+    try:
+        store = _redis_store()
+    except ImportError:
+        print("SKIP: redis: set VERIFY_REDIS_URL or install fakeredis + lupa")
+        return
+    _semantics("redis", store)
+    store.reset()
+
+    ExecutionContext.set_store(store)
+    counts = Counter()
+    lock = threading.Lock()
+    def worker():
+        local = Counter()
+        _hammer(local)
+        with lock:
+            counts.update(local)
+    threads = [threading.Thread(target=worker) for _ in range(PROCESSES * THREADS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    _check("redis", counts, PROCESSES * THREADS)
+    store.reset()
+
+if __name__ == "__main__":
+    print("Testing shared execution guard backends...")
+    sys.setswitchinterval(1e-5)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        test_sqlite(tmpdir)
+        test_sqlite_off_loop(tmpdir)
+    test_redis()
+    print("Test Complete.")
@@ -0,0 +1,64 @@
+import sys
+import threading
+from collections import Counter
+from app.core.execution_context import ExecutionContext, ExecutionGuardException, MAX_STEPS
+from app.core.guard_store import MemoryGuardStore
+
+THREADS = 32
+EXECUTIONS = 200
+ATTEMPTS_PER_THREAD = 2000
+
+def test_guard_concurrency():
+    print("Testing Execution Guard under concurrent threads...")
+    # Switch threads as often as possible to surface read-check-increment races
+    sys.setswitchinterval(1e-6)
+    ExecutionContext.set_store(MemoryGuardStore(max_tracked=10_000))
+
+    allowed = Counter()
+    blocked = Counter()
+    counts_lock = threading.Lock()
+    barrier = threading.Barrier(THREADS)
+
+    def worker(n: int):
+        local_allowed, local_blocked = Counter(), Counter()
+        barrier.wait()
+        for i in range(ATTEMPTS_PER_THREAD):
+            exec_id = f"exec-{i % EXECUTIONS}"
+            # Every thread sends the same prompt sequence, so each prompt races against itself too
+            prompt = f"Prompt {i // EXECUTIONS}"
+            try:
+                ExecutionContext.validate_request(exec_id, prompt)
+                local_allowed[exec_id] += 1
+            except ExecutionGuardException as e:
+                local_blocked[e.code] += 1
+        with counts_lock:
+            allowed.update(local_allowed)
+            blocked.update(local_blocked)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(THREADS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    over = {k: v for k, v in allowed.items() if v > MAX_STEPS}
+    expected_steps = min(MAX_STEPS, ATTEMPTS_PER_THREAD // EXECUTIONS)
+    under = {k: v for k, v in allowed.items() if v != expected_steps}
+    total = THREADS * ATTEMPTS_PER_THREAD
+
+    if over:
+        print(f"FAIL: Step limit overshoot on {len(over)} executions (e.g. {next(iter(over.items()))})")
+    elif under or len(allowed) != EXECUTIONS:
+        print(f"FAIL: Expected exactly {expected_steps} steps for each of {EXECUTIONS} executions, got {dict(list(under.items())[:3])}")
+    else:
+        print(f"PASS: Each execution admitted exactly {expected_steps} steps")
+
+    if sum(allowed.values()) + sum(blocked.values()) == total:
+        print(f"PASS: All {total} requests accounted for {dict(blocked)}")
+    else:
+        print("FAIL: Lost requests")
+
+    print("Test Complete.")
+
+if __name__ == "__main__":
+    test_guard_concurrency()
@@ -0,0 +1,73 @@
+import json
+from app.core import moodle_decode
+from app.core.moodle_decode import SectionsDecoder
+from app.moodle_client import parse_response
+
+def _decode_chunked(body: bytes, size: int):
+    decoder = SectionsDecoder()
+    for i in range(0, len(body), size):
+        decoder.feed(body[i:i + size])
+    return decoder.close()
+
+def _fields(records):
+    return [r.to_dict() if hasattr(r, "to_dict") else r for r in records]
+
+def test_moodle_decode():
+    print("Testing SectionsDecoder...")
+    streaming = moodle_decode.ijson is not None
+    print(f"Mode: {'streaming (ijson)' if streaming else 'buffered (ijson not installed)'}")
+
+    # 1. Adjacent sections with disjoint keys stay separate records
+    records = SectionsDecoder.decode(b'[{"id":1},{"name":"x","section":2}]')
+    if _fields(records) == [
+        {"id": 1, "section": None, "name": None, "visible": None},
+        {"id": None, "section": 2, "name": "x", "visible": None}
+    ]:
+        print("PASS: Sections with disjoint keys decode as two records")
+    else:
+        print(f"FAIL: Disjoint sections decoded as {records}")
+
+    # 2. Same projection for any chunking, with nested modules ignored
+    sections = [
+        {"id": 10 + i, "section": i, "name": f"Topic {i}", "visible": i % 2, "summary": "s" * 50,
+         "modules": [{"id": 100 * i + j, "name": f"mod {j}", "section": 99, "contents": [{"filename": "f"}]} for j in range(3)]}
+        for i in range(20)
+    ]
+    body = json.dumps(sections).encode()
+    expected = [{"id": s["id"], "section": s["section"], "name": s["name"], "visible": s["visible"]} for s in sections]
+    mismatched = [size for size in (1, 7, 64, 4096, len(body)) if _fields(_decode_chunked(body, size)) != expected]
+    if not mismatched:
+        print("PASS: Projection is identical for every chunk size (module fields never leak into sections)")
+    else:
+        print(f"FAIL: Wrong projection for chunk sizes {mismatched}")
+
+    # 3. Exception objects and empty bodies take parse_response's Moodle error path
+    error = SectionsDecoder.decode(b'{"exception":"moodle_exception","errorcode":"invalidrecord","message":"No course"}')
+    for label, raw in (("exception object", None), ("empty body", b""), ("whitespace body", b" \r\n ")):
+        data = error if raw is None else _decode_chunked(raw, 1)
+        try:
+            parse_response("core_course_get_contents", 200, data)
+            print(f"FAIL: {label} did not raise")
+        except Exception as e:
+            if str(e).startswith("Moodle Error:"):
+                print(f"PASS: {label} raised the Moodle error ({e})")
+            else:
+                print(f"FAIL: {label} raised {e.__class__.__name__}: {e}")
+
+    # 4. The buffered fallback matches the streaming path
+    if streaming:
+        saved, moodle_decode.ijson = moodle_decode.ijson, None
+        try:
+            buffered = _fields(_decode_chunked(body, 64))
+            disjoint = _fields(SectionsDecoder.decode(b'[{"id":1},{"name":"x","section":2}]'))
+        finally:
+            moodle_decode.ijson = saved
+        if buffered == expected and len(disjoint) == 2:
+            print("PASS: Buffered fallback returns the same records")
+        else:
+            print("FAIL: Buffered fallback differs from the streaming decoder")
+
+    print("Test Complete.")
+
+if __name__ == "__main__":
+    test_moodle_decode()
@@ -0,0 +1,85 @@
+import asyncio
+from app import moodle_client, async_moodle_client
+from app.core.moodle_params import WS_ARRAYS, ArrayParam, encode_params
+
+def check(label: str, got, expected):
+    if got == expected:
+        print(f"PASS: {label}")
+    else:
+        print(f"FAIL: {label}\n  expected {expected}\n  got      {got}")
+
+def capture(module, call, is_async: bool = False):
+    """Runs a client helper with call_moodle swapped for a recorder; returns (function, encoded payload)."""
+    sent = []
+    def record(function, params, token=None, *args, **kwargs):
+        sent.append((function, moodle_client.build_payload(function, params, "t")))
+    async def arecord(function, params, token=None, *args, **kwargs):
+        record(function, params, token)
+    original = module.call_moodle
+    module.call_moodle = arecord if is_async else record
+    try:
+        asyncio.run(call()) if is_async else call()
+    finally:
+        module.call_moodle = original
+    function, payload = sent[0]
+    return function, {k: v for k, v in payload.items() if k not in ("wstoken", "wsfunction", "moodlewsrestformat")}
+
+def test_moodle_params():
+    print("Testing Moodle parameter encoding...")
+
+    # 1. encode_params: nested dicts/lists, booleans, None, already-flat keys
+    check("encode_params flattens structures, lists and lists of structures", encode_params({
+        "competency": {"shortname": "C1", "visible": True, "parentid": None},
+        "ids": [4, 5],
+        "options": [{"name": "excludemodules", "value": False}],
+        "courses[0][id]": 7
+    }), {
+        "competency[shortname]": "C1", "competency[visible]": 1,
+        "ids[0]": 4, "ids[1]": 5,
+        "options[0][name]": "excludemodules", "options[0][value]": 0,
+        "courses[0][id]": 7
+    })
+
+    # 2. ArrayParam: cached keys stay correct as batches grow and shrink
+    param = ArrayParam("sections", ("name", "visible"))
+    for n in (2, 9, 3):
+        items = [{"name": f"S{i}", "visible": i % 2} for i in range(n)]
+        expected = {}
+        for i in range(n):
+            expected[f"sections[{i}][name]"] = f"S{i}"
+            expected[f"sections[{i}][visible]"] = i % 2
+        check(f"ArrayParam.encode with {n} structures", param.encode(items), expected)
+    check("ArrayParam.encode_columns matches encode", param.encode_columns(name=["a", "b"], visible=[True, False]),
+          {"sections[0][name]": "a", "sections[1][name]": "b", "sections[0][visible]": 1, "sections[1][visible]": 0})
+
+    # 3. Exact form pairs sent for every wsfunction registered in WS_ARRAYS (sync and async helpers)
+    cases = {
+        "core_course_create_sections": [
+            ("create_course_sections", ([2, 2, 2], "t"), {"courseids[0]": 2, "courseids[1]": 2, "courseids[2]": 2})
+        ],
+        "core_course_delete_sections": [
+            ("delete_course_sections", ([31, 32], "t"), {"ids[0]": 31, "ids[1]": 32})
+        ],
+        "local_sectionmanager_create_sections": [
+            ("create_moodle_sections", (5, ["Intro", "Unit 1"], "t"), {"courseid": 5, "sections[0][name]": "Intro", "sections[1][name]": "Unit 1"})
+        ],
+        "core_courseformat_update_course": [
+            ("show_sections", (5, [100, 101, 102], "t"), {"action": "section_show", "courseid": 5, "ids[0]": 100, "ids[1]": 101, "ids[2]": 102}),
+            ("move_section_after", (5, 11, 10, "t"), {"action": "section_move_after", "courseid": 5, "ids[0]": 11, "targetsectionid": 10})
+        ]
+    }
+    for function in WS_ARRAYS:
+        if function not in cases:
+            print(f"FAIL: {function} is registered in WS_ARRAYS but not covered here")
+            continue
+        for helper, args, expected in cases[function]:
+            for module, is_async in ((moodle_client, False), (async_moodle_client, True)):
+                if not hasattr(module, helper):
+                    continue
+                call = lambda: getattr(module, helper)(*args)
+                check(f"{function} via {helper} ({'async' if is_async else 'sync'})", capture(module, call, is_async), (function, expected))
+
+    print("Test Complete.")
+
+if __name__ == "__main__":
+    test_moodle_params()
@@ -0,0 +1,192 @@
+import time
+import asyncio
+import threading
+import httpx
+import requests
+from app.core.resilience import AIMDLimiter, CircuitBreaker, UpstreamGuard, CircuitOpenError, LimiterRejectedError
+from app.core.orchestrator_transport import is_orchestrator_failure
+from app.moodle_client import is_moodle_failure
+
+def check(label: str, ok: bool, detail=""):
+    print(f"{'PASS' if ok else 'FAIL'}: {label}" + ("" if ok else f" -> {detail}"))
+
+def http_error(status: int, client: str = "requests") -> Exception:
+    if client == "httpx":
+        request = httpx.Request("POST", "http://upstream/ws")
+        return httpx.HTTPStatusError(f"{status}", request=request, response=httpx.Response(status, request=request))
+    response = requests.Response()
+    response.status_code = status
+    return requests.HTTPError(f"{status}", response=response)
+
+def test_limiter():
+    # 1. Additive increase: ~+1 per limit-sized window of fast successes, capped at max_limit
+    limiter = AIMDLimiter("t", initial=4, max_limit=6, latency_threshold=1.0, backoff=0.5)
+    for _ in range(4):
+        limiter.acquire()
+    for _ in range(4):
+        limiter.release(latency=0.01)
+    check("Additive increase: 4 fast calls at limit 4 raise it by ~1", 4.9 < limiter.limit < 5.0, limiter.limit)
+    for _ in range(50):
+        limiter.acquire()
+        limiter.release(latency=0.01)
+    check("Limit never exceeds max_limit", limiter.limit == 6, limiter.limit)
+
+    # 2. Multiplicative decrease on a slow call and on a failure, floored at min_limit
+    limiter = AIMDLimiter("t", initial=16, min_limit=2, latency_threshold=1.0, backoff=0.5)
+    limiter.acquire()
+    limiter.release(latency=1.5)
+    slow = limiter.limit
+    limiter.acquire()
+    limiter.release(latency=0.01, failed=True)
+    failed = limiter.limit
+    for _ in range(10):
+        limiter.acquire()
+        limiter.release(failed=True)
+    check("Multiplicative decrease: slow call 16 -> 8, failure 8 -> 4, floor at min_limit",
+          (slow, failed, limiter.limit) == (8, 4, 2), (slow, failed, limiter.limit))
+
+    # 3. Release without a latency sample (cancelled caller) leaves the limit alone
+    limiter = AIMDLimiter("t", initial=4)
+    limiter.acquire()
+    limiter.release()
+    check("Release without latency does not move the limit", limiter.limit == 4 and limiter.in_flight == 0, limiter.state())
+
+    # 4. Queue timeout: callers over the limit wait queue_timeout, then are rejected
+    limiter = AIMDLimiter("t", initial=1, queue_timeout=0.2)
+    limiter.acquire()
+    start = time.monotonic()
+    try:
+        limiter.acquire()
+        outcome = "acquired"
+    except LimiterRejectedError as e:
+        outcome = e.code
+    waited = time.monotonic() - start
+    check("Sync caller over the limit is rejected after queue_timeout",
+          outcome == "CONCURRENCY_LIMITED" and 0.15 < waited < 1.0 and limiter.rejected == 1 and limiter.in_flight == 1,
+          (outcome, round(waited, 3), limiter.state()))
+
+    async def over_limit():
+        try:
+            await limiter.aacquire()
+            return "acquired"
+        except LimiterRejectedError as e:
+            return e.code
+    start = time.monotonic()
+    outcome = asyncio.run(over_limit())
+    waited = time.monotonic() - start
+    check("Async caller over the limit is rejected after queue_timeout",
+          outcome == "CONCURRENCY_LIMITED" and 0.15 < waited < 1.0 and not limiter.state()["queued"], (outcome, round(waited, 3)))
+
+    # 5. A queued caller gets the slot as soon as one is released (FIFO hand-off)
+    granted = []
+    def queued():
+        limiter.acquire(timeout=2.0)
+        granted.append(time.monotonic())
+    waiter = threading.Thread(target=queued)
+    waiter.start()
+    time.sleep(0.1)
+    released = time.monotonic()
+    limiter.release(latency=0.01)
+    waiter.join()
+    check("Queued caller is granted the released slot", granted and granted[0] - released < 0.1 and limiter.in_flight == 1, limiter.state())
+
+def test_breaker():
+    # 6. closed -> open on error rate (after min_requests), fail fast while open
+    breaker = CircuitBreaker(error_threshold=0.5, min_requests=4, window=10.0, open_seconds=0.2, half_open_max=2)
+    for failed in (False, False, True):
+        breaker.record(failed)
+    closed_below_min = breaker.state_name == CircuitBreaker.CLOSED
+    breaker.record(True)
+    check("Stays closed below min_requests, opens at the error threshold",
+          closed_below_min and breaker.state_name == CircuitBreaker.OPEN and breaker.times_opened == 1, breaker.state())
+    try:
+        breaker.before_call("t")
+        check("Open breaker fails fast", False, "call admitted")
+    except CircuitOpenError as e:
+        check("Open breaker fails fast", e.code == "CIRCUIT_OPEN" and 0 < e.retry_in <= 0.2, e.retry_in)
+
+    # 7. open -> half-open after open_seconds; at most half_open_max probes; a success closes
+    time.sleep(0.25)
+    admitted = 0
+    for _ in range(3):
+        try:
+            breaker.before_call("t")
+            admitted += 1
+        except CircuitOpenError:
+            pass
+    check("Half-open admits exactly half_open_max probes", admitted == 2 and breaker.state_name == CircuitBreaker.HALF_OPEN, admitted)
+    breaker.record(False)
+    check("A successful probe closes the breaker with a fresh window",
+          breaker.state_name == CircuitBreaker.CLOSED and breaker.state()["window_requests"] == 0, breaker.state())
+
+    # 8. A failed probe re-opens it; an abandoned probe frees its slot
+    for _ in range(4):
+        breaker.record(True)
+    time.sleep(0.25)
+    breaker.before_call("t")
+    breaker.abandon()
+    breaker.before_call("t")
+    breaker.before_call("t")
+    breaker.record(True)
+    check("Abandoned probe frees its slot; a failed probe re-opens",
+          breaker.state_name == CircuitBreaker.OPEN and breaker.times_opened == 3, breaker.state())
+
+def test_guard():
+    # 9. 4xx and Moodle exceptions prove the host is alive; 5xx and transport errors count
+    for label, is_failure in (("Moodle", is_moodle_failure), ("orchestrator", is_orchestrator_failure)):
+        guard = UpstreamGuard(label, AIMDLimiter(label, initial=8, backoff=0.5),
+                              CircuitBreaker(min_requests=5, error_threshold=0.5, open_seconds=60), is_failure)
+        client_errors = [http_error(400), http_error(404, "httpx"), Exception("Moodle Error: invalidrecord")]
+        for e in client_errors * 4:
+            try:
+                guard.call(_raiser(e))
+            except Exception:
+                pass
+        state = guard.state()
+        healthy = state["breaker"]["state"] == "closed" and state["breaker"]["window_failures"] == 0 and state["limiter"]["limit_exact"] >= 8
+        check(f"{label}: 4xx responses and application errors are not failures", healthy, state)
+
+        server_errors = [http_error(503), http_error(502, "httpx"), requests.ConnectionError("refused"), httpx.ConnectTimeout("timeout")]
+        for e in server_errors:
+            try:
+                guard.call(_raiser(e))
+            except Exception:
+                pass
+        state = guard.state()
+        # 8 -> 4 -> 2 -> 1, then held at min_limit
+        check(f"{label}: 5xx and transport errors back off the limit and count against the breaker",
+              state["breaker"]["window_failures"] == 4 and state["limiter"]["limit_exact"] == 1, state)
+
+    # 10. Async slots follow the same rules; a cancelled caller is neither a sample nor a failure
+    guard = UpstreamGuard("async", AIMDLimiter("async", initial=4), CircuitBreaker(min_requests=1, open_seconds=60), is_moodle_failure)
+    async def scenario():
+        async def slow():
+            await asyncio.sleep(1)
+        task = asyncio.create_task(guard.acall(slow))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        try:
+            await guard.acall(lambda: _araise(http_error(404, "httpx")))
+        except httpx.HTTPStatusError:
+            pass
+    asyncio.run(scenario())
+    state = guard.state()
+    check("Async: cancellation and 4xx leave limiter and breaker untouched",
+          state["limiter"]["in_flight"] == 0 and state["limiter"]["limit_exact"] >= 4 and state["breaker"]["state"] == "closed"
+          and state["breaker"]["window_failures"] == 0, state)
+
+def _raiser(e: Exception):
+    def fn():
+        raise e
+    return fn
+
+async def _araise(e: Exception):
+    raise e
+
+if __name__ == "__main__":
+    print("Testing resilience primitives...")
+    test_limiter()
+    test_breaker()
+    test_guard()
+    print("Test Complete.")
@@ -0,0 +1,109 @@
+import random
+from app.section_planner import plan_section_sync
+
+GENERAL_ID = 1
+
+def make_course(names: list[str], general_name: str = "General") -> list[dict]:
+    """core_course_get_contents shape: section 0 first, then numbered sections with ids 10, 11, ..."""
+    return [{"id": GENERAL_ID, "section": 0, "name": general_name}] + [
+        {"id": 10 + i, "section": i + 1, "name": name} for i, name in enumerate(names)
+    ]
+
+def apply_plan(sections: list[dict], plan) -> list[str]:
+    """
+    Replays a plan the way execute_section_plan does (renames, one create appended
+    at the end, deletes, then moves in order) and returns the resulting topic names.
+    """
+    course = [dict(s) for s in sections if s["section"] != 0]
+    ops = {kind: [o for o in plan.operations if o.op == kind] for kind in ("rename", "create", "delete", "move")}
+    by_id = {s["id"]: s for s in course}
+    for op in ops["rename"]:
+        by_id[op.section_id]["name"] = op.name
+    created_ids = {}
+    for n, op in enumerate(ops["create"]):
+        created_ids[op.position] = 1000 + n
+        course.append({"id": 1000 + n, "name": op.name})
+    deleted = {op.section_id for op in ops["delete"]}
+    course = [s for s in course if s["id"] not in deleted]
+
+    position_ids = {i + 1: sid for i, sid in enumerate(plan.section_ids) if sid is not None}
+    position_ids.update(created_ids)
+    for op in ops["move"]:
+        moving = next(s for s in course if s["id"] == position_ids[op.position])
+        course.remove(moving)
+        at = 0 if not op.after_position else next(i for i, s in enumerate(course) if s["id"] == position_ids[op.after_position]) + 1
+        course.insert(at, moving)
+    return [s["name"] for s in course]
+
+def kinds(plan) -> list[str]:
+    return [o.op for o in plan.operations]
+
+def check(label: str, ok: bool, detail=""):
+    print(f"{'PASS' if ok else 'FAIL'}: {label}" + ("" if ok else f" -> {detail}"))
+
+def test_section_planner():
+    print("Testing minimal-edit section planner...")
+
+    # 1. Already in sync: nothing to write
+    sections = make_course(["A", "B", "C"])
+    plan = plan_section_sync(1, sections, ["A", "B", "C"])
+    check("Synced course yields a no-op plan", plan.is_noop and plan.unchanged == 3 and plan.section_ids == [10, 11, 12], plan)
+
+    # 2. Pure reorder: only moves, and only the sections outside the longest ordered run
+    sections = make_course(["A", "B", "C", "D"])
+    plan = plan_section_sync(1, sections, ["B", "C", "D", "A"])
+    check("Rotation is a single move", kinds(plan) == ["move"] and plan.operations[0].section_id == 10, kinds(plan))
+    plan = plan_section_sync(1, sections, ["D", "C", "B", "A"])
+    check("Reversal moves all but one section, nothing else",
+          set(kinds(plan)) == {"move"} and len(plan.operations) == 3 and apply_plan(sections, plan) == ["D", "C", "B", "A"], kinds(plan))
+
+    # 3. Rename spares before creating or deleting
+    sections = make_course(["A", "Old"])
+    plan = plan_section_sync(1, sections, ["A", "New"])
+    check("A spare section is renamed instead of delete + create",
+          kinds(plan) == ["rename"] and plan.operations[0].section_id == 11 and plan.operations[0].name == "New", kinds(plan))
+    sections = make_course(["A", "X", "Y"])
+    plan = plan_section_sync(1, sections, ["A", "B"])
+    check("Extra sections are deleted after renaming what can be reused",
+          kinds(plan) == ["rename", "delete"] and plan.operations[1].section_id == 12, kinds(plan))
+    sections = make_course(["A"])
+    plan = plan_section_sync(1, sections, ["A", "B", "C"])
+    check("Missing topics are created (no spare to rename)",
+          kinds(plan) == ["create", "create"] and [o.position for o in plan.operations] == [2, 3], kinds(plan))
+
+    # 4. Duplicate names: each copy is matched once
+    sections = make_course(["A", "A", "B"])
+    plan = plan_section_sync(1, sections, ["A", "B", "A"])
+    check("Duplicate names are all kept; only a move is needed",
+          plan.unchanged == 3 and kinds(plan) == ["move"] and apply_plan(sections, plan) == ["A", "B", "A"], kinds(plan))
+    sections = make_course(["A"])
+    plan = plan_section_sync(1, sections, ["A", "A"])
+    check("A second copy of an existing name is created", plan.unchanged == 1 and kinds(plan) == ["create"], kinds(plan))
+
+    # 5. The general section (0) is never renamed, deleted, moved or reused, even when a topic has its name
+    sections = make_course(["X", "Y"], general_name="Intro")
+    plan = plan_section_sync(1, sections, ["Intro", "Y"])
+    touched = {o.section_id for o in plan.operations} | set(plan.section_ids)
+    check("General section is never touched", GENERAL_ID not in touched and kinds(plan) == ["rename"], plan)
+
+    # 6. Randomized: any plan, replayed, yields the syllabus and leaves section 0 alone
+    rng = random.Random(7)
+    failures = []
+    for _ in range(2000):
+        pool = [f"T{i}" for i in range(8)]
+        current = [rng.choice(pool) for _ in range(rng.randint(0, 8))]
+        programa = [rng.choice(pool) for _ in range(rng.randint(0, 8))]
+        sections = make_course(current, general_name=rng.choice(pool))
+        plan = plan_section_sync(1, sections, programa)
+        moves = sum(1 for o in plan.operations if o.op == "move")
+        writes = len(plan.operations) - moves
+        touched = {o.section_id for o in plan.operations} | set(plan.section_ids)
+        if (apply_plan(sections, plan) != programa or GENERAL_ID in touched
+                or writes != abs(len(current) - len(programa)) + min(len(current), len(programa)) - plan.unchanged):
+            failures.append((current, programa, kinds(plan)))
+    check("2000 random courses: replayed plans match the syllabus with minimal writes", not failures, failures[:3])
+
+    print("Test Complete.")
+
+if __name__ == "__main__":
+    test_section_planner()
@@ -0,0 +1,127 @@
+import os
+import time
+import tempfile
+import logging
+import threading
+from cryptography.fernet import Fernet
+from app.core.config_provider import SSMConfigProvider, ParameterCache, log as ssm_log
+
+TOKEN_PATH = "/prod/keduka/md-api-secao/moodle_token"
+
+class FakeSSM:
+    """Stand-in for the boto3 SSM client: GetParameters only, optional latency/outage."""
+    def __init__(self, values: dict, delay: float = 0.0):
+        self.values = dict(values)
+        self.delay = delay
+        self.down = False
+        self.calls = 0
+
+    def get_parameters(self, Names, WithDecryption=True):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.down:
+            raise ConnectionError("SSM unreachable")
+        return {
+            "Parameters": [{"Name": n, "Value": self.values[n]} for n in Names if n in self.values],
+            "InvalidParameters": [n for n in Names if n not in self.values]
+        }
+
+def make_cache(fake: FakeSSM, **kwargs) -> ParameterCache:
+    provider = SSMConfigProvider()
+    provider._ssm_client = fake
+    return ParameterCache(provider, defaults={TOKEN_PATH: "env-token"}, **kwargs)
+
+def test_ssm_cache():
+    print("Testing SSM parameter cache...")
+
+    # 1. get() never blocks, even on a cold start against a slow SSM
+    fake = FakeSSM({TOKEN_PATH: "ssm-token"}, delay=1.0)
+    cache = make_cache(fake, refresh_interval=3600)
+    start = time.monotonic()
+    value = cache.get(TOKEN_PATH)
+    elapsed = time.monotonic() - start
+    if value == "env-token" and elapsed < 0.1:
+        print(f"PASS: Cold get() served the default in {elapsed * 1000:.1f}ms")
+    else:
+        print(f"FAIL: Cold get() returned {value!r} after {elapsed:.2f}s")
+
+    # 2. The startup wait sees the first fetch
+    if cache.wait_loaded(5.0) and cache.get(TOKEN_PATH) == "ssm-token":
+        print("PASS: wait_loaded() returned once SSM values landed")
+    else:
+        print(f"FAIL: After wait_loaded() got {cache.get(TOKEN_PATH)!r}")
+    cache.stop()
+
+    # 3. Encrypted disk cache serves the next cold start while SSM is down
+    key = Fernet.generate_key().decode()
+    path = os.path.join(tempfile.mkdtemp(), "ssm_cache.bin")
+    writer = make_cache(FakeSSM({TOKEN_PATH: "cached-token"}), cache_path=path, cache_key=key, refresh_interval=3600)
+    writer.wait_loaded(5.0)
+    writer.stop()
+    with open(path, "rb") as f:
+        plain = b"cached-token" in f.read()
+
+    outage = FakeSSM({}, delay=0.0)
+    outage.down = True
+    reader = make_cache(outage, cache_path=path, cache_key=key, refresh_interval=3600)
+    if not plain and reader.get(TOKEN_PATH) == "cached-token" and reader.source == "disk_cache":
+        print("PASS: Disk cache is encrypted and serves a cold start during an SSM outage")
+    else:
+        print(f"FAIL: Disk cache (plain text: {plain}) served {reader.get(TOKEN_PATH)!r} from {reader.source}")
+    reader.stop()
+
+    warnings = []
+    handler = logging.Handler()
+    handler.emit = lambda record: warnings.append(record.getMessage())
+    ssm_log.addHandler(handler)
+    try:
+        wrong_key = make_cache(outage, cache_path=path, cache_key=Fernet.generate_key().decode(), refresh_interval=3600)
+        value = wrong_key.get(TOKEN_PATH)
+        wrong_key.wait_loaded(5.0)
+    finally:
+        ssm_log.removeHandler(handler)
+    if value == "env-token" and wrong_key.get(TOKEN_PATH) == "env-token":
+        print("PASS: A cache written with another key is ignored")
+    else:
+        print("FAIL: Cache decrypted with the wrong key")
+    # InvalidToken has an empty message: the warning must still say what went wrong
+    if any(w.endswith(": InvalidToken") for w in warnings):
+        print("PASS: The ignored cache is logged with the error class")
+    else:
+        print(f"FAIL: Unreadable cache warning was {warnings}")
+    wrong_key.stop()
+
+    # 4. Background refresh picks up a rotation; a failed refresh keeps the last values
+    fake = FakeSSM({TOKEN_PATH: "v1"})
+    cache = make_cache(fake, refresh_interval=0.05)
+    cache.wait_loaded(5.0)
+    fake.values[TOKEN_PATH] = "v2"
+    time.sleep(0.3)
+    rotated = cache.get(TOKEN_PATH)
+    fake.down = True
+    time.sleep(0.3)
+    if rotated == "v2" and cache.get(TOKEN_PATH) == "v2" and cache.refresh_failures > 0:
+        print("PASS: Rotation applied without restart; outage kept the last values")
+    else:
+        print(f"FAIL: rotated={rotated!r} now={cache.get(TOKEN_PATH)!r} failures={cache.refresh_failures}")
+    cache.stop()
+
+    # 5. Batched: one GetParameters call per refresh, not one per get()
+    fake = FakeSSM({TOKEN_PATH: "x"})
+    cache = make_cache(fake, refresh_interval=3600)
+    cache.wait_loaded(5.0)
+    threads = [threading.Thread(target=lambda: [cache.get(TOKEN_PATH) for _ in range(1000)]) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if fake.calls == 1:
+        print("PASS: 8000 reads served by a single SSM call")
+    else:
+        print(f"FAIL: {fake.calls} SSM calls")
+    cache.stop()
+
+    print("Test Complete.")
+
+if __name__ == "__main__":
+    test_ssm_cache()
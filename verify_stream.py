@@ -0,0 +1,147 @@
+import os
+import json
+import socket
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+# Fake Moodle + orchestrator on one local port; must be configured before the app is imported
+PORT = _free_port()
+os.environ.update({
+    "MOODLE_URL": f"http://127.0.0.1:{PORT}/ws",
+    "ORCHESTRATOR_URL": f"http://127.0.0.1:{PORT}",
+    "SSM_ENABLED": "false",
+    "SYLLABUS_CACHE_ENABLED": "false",
+    "LOG_LEVEL": os.environ.get("LOG_LEVEL", "ERROR")
+})
+
+from fastapi.testclient import TestClient
+from app.core.orchestrator_transport import parse_stream_line
+from app.core.incremental_json import StringArrayStreamParser
+
+TOPICS = ["Introdução", 'Aspas "duplas" e \\ barra', "Unicode é中", "Último"]
+
+def check(label: str, ok: bool, detail=""):
+    print(f"{'PASS' if ok else 'FAIL'}: {label}" + ("" if ok else f" -> {detail}"))
+
+def test_parse_stream_line():
+    cases = [
+        ('data: {"delta": "abc"}', "abc"),
+        ('data:{"content": "x y"}\r\n', "x y"),
+        ('{"response": "ndjson"}', "ndjson"),
+        ('{"delta": "a"}\n', "a"),
+        ("data: plain text", "plain text"),
+        ('data: "json string"', "json string"),
+        ("data: [DONE]", None),
+        ("[DONE]", None),
+        (": keep-alive", None),
+        ("", None),
+        ("   ", None),
+        ("event: message", None),
+        ("id: 42", None),
+        ("data:", None),
+        ('data: {"usage": {"tokens": 3}}', None),
+        ("data: [1, 2]", None)
+    ]
+    wrong = [(line, expected, parse_stream_line(line)) for line, expected in cases if parse_stream_line(line) != expected]
+    check(f"parse_stream_line: SSE, NDJSON, [DONE], keep-alives and metadata ({len(cases)} lines)", not wrong, wrong)
+
+def test_topic_parser():
+    text = 'Here is the JSON:\n```json\n' + json.dumps({"note": "topics", "topics": TOPICS, "extra": ["not", "topics"]}, ensure_ascii=False) + "\n```"
+
+    # Every split point: a topic, an escape or the "topics" key cut across two chunks
+    bad_splits = []
+    for cut in range(len(text) + 1):
+        parser = StringArrayStreamParser("topics")
+        emitted = parser.feed(text[:cut]) + parser.feed(text[cut:])
+        if emitted != TOPICS or not parser.done:
+            bad_splits.append(cut)
+    check("Topic parser: same topics for every 2-chunk split (keys, escapes, unicode)", not bad_splits, bad_splits[:5])
+
+    parser = StringArrayStreamParser("topics")
+    emitted = [(i, topic) for i, ch in enumerate(text) for topic in parser.feed(ch)]
+    closing = [text.index(json.dumps(t, ensure_ascii=False)) + len(json.dumps(t, ensure_ascii=False)) - 1 for t in TOPICS]
+    check("Topic parser: each topic is emitted on its closing quote (1-char chunks)",
+          [t for _, t in emitted] == TOPICS and [i for i, _ in emitted] == closing, emitted)
+
+    parser = StringArrayStreamParser("topics")
+    partial = parser.feed('{"topics": ["A", "B", "unterminated')
+    check("Topic parser: an unterminated topic is never emitted", partial == ["A", "B"] and parser.items == ["A", "B"] and not parser.done, partial)
+
+class _Upstream(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    mode = "sse"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path.startswith("/execute"):
+            return self._execute(json.loads(body))
+        function = dict(pair.split("=", 1) for pair in body.decode().split("&")).get("wsfunction")
+        data = {
+            "core_course_get_courses": [{"id": 5, "fullname": "Curso", "summary": "S"}],
+            "core_competency_list_course_competencies": [],
+            "core_course_get_contents": [{"id": 1, "section": 0, "name": "Geral"}] + [
+                {"id": 10 + i, "section": i + 1, "name": topic} for i, topic in enumerate(TOPICS)
+            ]
+        }.get(function, {})
+        self._send(200, "application/json", json.dumps(data).encode())
+
+    def _execute(self, request: dict):
+        text = json.dumps({"topics": TOPICS}, ensure_ascii=False)
+        pieces = [text[i:i + 3] for i in range(0, len(text), 3)]
+        if self.mode == "sse":
+            lines = [": keep-alive", "event: message"] + [f"data: {json.dumps({'delta': p})}" for p in pieces] + ["data: [DONE]"]
+            payload, content_type = "\n\n".join(lines) + "\n\n", "text/event-stream"
+        else:
+            lines = [json.dumps({"content": p}) for p in pieces]
+            lines.insert(len(lines) // 2, "")
+            payload, content_type = "\n".join(lines) + "\n", "application/x-ndjson"
+        self._send(200, content_type, payload.encode())
+
+    def _send(self, status: int, content_type: str, body: bytes):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def test_stream_endpoint():
+    from app.main import app
+    server = ThreadingHTTPServer(("127.0.0.1", PORT), _Upstream)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        with TestClient(app) as client:
+            for mode in ("sse", "ndjson"):
+                _Upstream.mode = mode
+                events = []
+                with client.stream("POST", "/api/course/programa/stream", json={"course_id": 5, "dry_run": True},
+                                   headers={"X-Execution-ID": f"verify-stream-{mode}"}) as response:
+                    event = None
+                    for line in response.iter_lines():
+                        if line.startswith("event: "):
+                            event = line[7:]
+                        elif line.startswith("data: "):
+                            events.append((event, json.loads(line[6:])))
+                names = [e for e, _ in events]
+                topics = [d["name"] for e, d in events if e == "topic"]
+                programa = next((d for e, d in events if e == "programa"), None)
+                plan = next((d for e, d in events if e == "plan"), {})
+                ok = (names[:2] == ["course", "competencies"] and names[-2:] == ["plan", "done"]
+                      and topics == TOPICS and programa == TOPICS and plan.get("operations") == [])
+                check(f"Stream endpoint ({mode} upstream): topics in order, then programa, plan, done", ok, events)
+    finally:
+        server.shutdown()
+
+if __name__ == "__main__":
+    print("Testing streamed syllabus generation...")
+    test_parse_stream_line()
+    test_topic_parser()
+    test_stream_endpoint()
+    print("Test Complete.")